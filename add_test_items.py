@@ -39,37 +39,39 @@ def add_test_items():
         10713, 10714, 10716, 10717, 10718, 10720  # Voorbeelden - pas aan op basis van echte data
     ]
     
-    # Voeg artikelen toe aan categorie 1
-    print("📦 Toevoegen aan Categorie 1 (Bestel bij fabrikant):")
-    for item in category_1_items:
-        if cm.add_item_to_category(str(item), "category_1"):
-            print(f"  ✅ {item} toegevoegd")
-        else:
-            print(f"  ⚠️  {item} was al toegevoegd")
+    # Alle toevoegingen in één batch: de catalogus wordt één keer bijgewerkt
+    with cm.batch():
+        # Voeg artikelen toe aan categorie 1
+        print("📦 Toevoegen aan Categorie 1 (Bestel bij fabrikant):")
+        for item in category_1_items:
+            if cm.add_item_to_category(str(item), "category_1"):
+                print(f"  ✅ {item} toegevoegd")
+            else:
+                print(f"  ⚠️  {item} was al toegevoegd")
     
-    # Voeg artikelen toe aan categorie 2
-    print("\n📦 Toevoegen aan Categorie 2 (Binnenkort leverbaar):")
-    for item in category_2_items:
-        if cm.add_item_to_category(str(item), "category_2"):
-            print(f"  ✅ {item} toegevoegd")
-        else:
-            print(f"  ⚠️  {item} was al toegevoegd")
+        # Voeg artikelen toe aan categorie 2
+        print("\n📦 Toevoegen aan Categorie 2 (Binnenkort leverbaar):")
+        for item in category_2_items:
+            if cm.add_item_to_category(str(item), "category_2"):
+                print(f"  ✅ {item} toegevoegd")
+            else:
+                print(f"  ⚠️  {item} was al toegevoegd")
     
-    # Voeg artikelen toe aan categorie 3
-    print("\n📦 Toevoegen aan Categorie 3 (Geen voorraadvooruitzicht):")
-    for item in category_3_items:
-        if cm.add_item_to_category(str(item), "category_3"):
-            print(f"  ✅ {item} toegevoegd")
-        else:
-            print(f"  ⚠️  {item} was al toegevoegd")
+        # Voeg artikelen toe aan categorie 3
+        print("\n📦 Toevoegen aan Categorie 3 (Geen voorraadvooruitzicht):")
+        for item in category_3_items:
+            if cm.add_item_to_category(str(item), "category_3"):
+                print(f"  ✅ {item} toegevoegd")
+            else:
+                print(f"  ⚠️  {item} was al toegevoegd")
     
-    # Voeg artikelen toe aan categorie 4
-    print("\n📦 Toevoegen aan Categorie 4 (Vervang door alternatief):")
-    for item in category_4_items:
-        if cm.add_item_to_category(str(item), "category_4"):
-            print(f"  ✅ {item} toegevoegd")
-        else:
-            print(f"  ⚠️  {item} was al toegevoegd")
+        # Voeg artikelen toe aan categorie 4
+        print("\n📦 Toevoegen aan Categorie 4 (Vervang door alternatief):")
+        for item in category_4_items:
+            if cm.add_item_to_category(str(item), "category_4"):
+                print(f"  ✅ {item} toegevoegd")
+            else:
+                print(f"  ⚠️  {item} was al toegevoegd")
     
     print("\n📋 Nieuwe categorie configuratie:")
     print("=" * 60)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Analyse API
+===========
+
+Herbruikbare analyse binnen één proces, zonder module globals aan te passen.
+Een Analyzer krijgt onveranderlijke instellingen (AnalysisSettings) en deelt
+de categorie configuratie (CategoryConfigProvider) met andere analyzers in
+hetzelfde proces: de configuratie en de indexen worden één keer geladen en
+alleen opnieuw ingelezen als de bestanden wijzigen. Elke run geeft een
+AnalysisResult terug. Analyzers kunnen tegelijk in meerdere threads draaien.
+
+Gebruik:
+    analyzer = Analyzer()
+    result = analyzer.with_settings(location_code="NL01").run("export.xlsx")
+    print(result.stats['orders'], result.output_file)
+
+Kleuren, Excel writer en digest groepering staan in de instellingen.
+Proces-globaal (bij elke run gelezen uit config.py via backorder_analyzer,
+niet per Analyzer in te stellen) zijn: de e-mail templates en links, de
+stamgegevens (ITEM_MASTER_FILE / DEALER_MASTER_FILE), de export cache, de
+notification ledger (bestand en bewaartermijn), de mappen voor incrementele
+staat en snapshots en de outbox/verzend instellingen.
+"""
+
+import dataclasses
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+import backorder_analyzer as analyzer
+from incremental_analysis import IncrementalState
+from polars_pipeline import load_filtered_export, resolve_engine
+
+
+def _freeze(value):
+    """Lijsten als tuple en dicts als tuple van (sleutel, waarde) paren, ook genest."""
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class AnalysisSettings:
+    """
+    Instellingen van één analyse; standaard de waarden uit config.py.
+
+    Dicts (backorder_filters, customer_priority, colors) worden als tuple van
+    paren bewaard en lijsten als tuple, ook genest; maak een variant met
+    replace(...).
+    """
+    input_file: str = analyzer.INPUT_FILE
+    location_code: object = _freeze(analyzer.LOCATION_CODE)
+    fully_reserved: object = _freeze(analyzer.FULLY_RESERVED)
+    order_status: object = _freeze(analyzer.ORDER_STATUS)
+    backorder_filters: tuple = _freeze(analyzer.BACKORDER_FILTERS)
+    use_cache: bool = True
+    engine: str = analyzer.ANALYSIS_ENGINE
+    email_mode: str = analyzer.EMAIL_MODE
+    use_ledger: bool = True
+    send_emails: bool = False
+    stock_allocation: bool = analyzer.STOCK_ALLOCATION_ENABLED
+    allocation_priority: tuple = _freeze(analyzer.STOCK_ALLOCATION_PRIORITY)
+    customer_priority: tuple = _freeze(analyzer.CUSTOMER_PRIORITY)
+    change_report: bool = analyzer.CHANGE_REPORT_ENABLED
+    output_dir: str = os.path.dirname(analyzer.OUTPUT_FILE) or "Output"
+    email_file: str = analyzer.OUTPUT_FILE.replace('.xlsx', '_Emails.xlsx')
+    incremental: bool = False
+    state_name: str = None
+    writer_engine: str = analyzer.EXCEL_WRITER_ENGINE
+    colors: tuple = _freeze(analyzer.COLORS)
+    digest_grouping: str = analyzer.EMAIL_DIGEST_GROUPING
+
+    def __post_init__(self):
+        for name in ('location_code', 'fully_reserved', 'order_status', 'backorder_filters',
+                     'allocation_priority', 'customer_priority', 'colors'):
+            object.__setattr__(self, name, _freeze(getattr(self, name)))
+
+    def replace(self, **changes):
+        """Kopie met gewijzigde instellingen."""
+        return dataclasses.replace(self, **changes)
+
+    def filter_spec(self):
+        """Filters als dict kolom -> criterium (zoals get_filter_spec)."""
+        spec = {
+            'Location Code': _thaw(self.location_code),
+            'Fully Reserved': _thaw(self.fully_reserved),
+            'Order Status': _thaw(self.order_status)
+        }
+        spec.update({column: _thaw(criterion) for column, criterion in self.backorder_filters})
+        return spec
+
+
+def _thaw(criterion):
+    """Criterium terug in de vorm van de filter spec ({"not": ...} en vergelijkingen als dict)."""
+    if isinstance(criterion, tuple) and criterion and all(
+            isinstance(pair, tuple) and len(pair) == 2 and isinstance(pair[0], str) for pair in criterion):
+        return dict(criterion)
+    return criterion
+
+
+@dataclass
+class AnalysisResult:
+    """Uitkomst van één analyse."""
+    settings: AnalysisSettings
+    grouped_data: dict
+    email_report: object
+    email_layout: str
+    stats: dict
+    output_file: str
+    email_file: str = None
+    change_file: str = None
+    changes: dict = field(default_factory=dict)
+
+
+class Analyzer:
+    """Voert analyses uit met vaste instellingen en een gedeelde categorie configuratie."""
+
+    def __init__(self, settings=None, category_provider=None):
+        self.settings = settings or AnalysisSettings()
+        # Standaard de provider van backorder_analyzer: één CategoryManager per proces
+        self.category_provider = category_provider or analyzer.category_provider
+        if self.category_provider:
+            self.category_provider.current()
+
+    def with_settings(self, **changes):
+        """Analyzer met gewijzigde instellingen die dezelfde categorie configuratie deelt."""
+        return Analyzer(self.settings.replace(**changes), self.category_provider)
+
+    def category_manager(self):
+        """De CategoryManager met de actuele configuratie (None als niet beschikbaar)."""
+        return self.category_provider.current() if self.category_provider else None
+
+    def run(self, input_file=None, output_file=None, email_file=None):
+        """
+        Analyseer een export (standaard settings.input_file).
+
+        output_file: analyse werkboek (standaard <output_dir>/Backorder_Analyse_v<tijd>.xlsx);
+        email_file: e-mail rapport (standaard settings.email_file).
+        """
+        settings = self.settings
+        colors = dict(settings.colors)
+        start = time.perf_counter()
+        file_to_use = input_file or settings.input_file
+        manager = self.category_manager()
+        engine = resolve_engine(settings.engine)
+        logging.info(f"Analyse van {file_to_use} (engine {engine})")
+
+        # Laad en valideer data (uit cache indien beschikbaar)
+        filter_spec = settings.filter_spec()
+        if engine == 'polars':
+            # Inlezen en filteren als één lazy query plan
+            filtered_df, rows_read = load_filtered_export(file_to_use, settings.use_cache, filter_spec)
+        else:
+            filtered_df, rows_read = analyzer.load_filtered_export(file_to_use, settings.use_cache, filter_spec)
+
+        # Omschrijvingen en dealernamen uit de stamgegevens
+        master_tables = analyzer.get_master_tables()
+        filtered_df = analyzer.join_master_data(filtered_df, master_tables)
+
+        # Staat van de vorige run met dezelfde export en filters
+        state_name = settings.state_name or analyzer.default_state_name(file_to_use, filter_spec)
+
+        # Incrementeel: alleen nieuwe of gewijzigde orders opnieuw categoriseren
+        email_engine = analyzer.get_email_engine(manager)
+        state = None
+        cached_categories = None
+        if settings.incremental:
+            email_layout = analyzer.resolve_email_layout(settings.email_mode)
+            state = IncrementalState(analyzer.INCREMENTAL_STATE_DIR, state_name)
+            state_key = IncrementalState.make_key(
+                schema=analyzer.CACHE_SCHEMA_VERSION,
+                categories=self.category_provider.version if self.category_provider else None,
+                layout=email_layout,
+                templates=email_engine.template_versions(email_layout),
+                grouping=settings.digest_grouping,
+                ledger=settings.use_ledger,
+                master={name: table.version if table is not None else None
+                        for name, table in master_tables.items()}
+            )
+            cached_categories = state.cached_categories(filtered_df, state_key)
+
+        # Groepeer per order
+        grouped_data = analyzer.group_by_sales_order(
+            filtered_df, cached_categories, allocate=settings.stock_allocation, engine=engine, manager=manager,
+            priority=list(settings.allocation_priority), customer_priority=dict(settings.customer_priority))
+
+        # Genereer unieke bestandsnaam
+        if not output_file:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file = os.path.join(settings.output_dir, f"Backorder_Analyse_v{timestamp}.xlsx")
+        email_file = email_file or settings.email_file
+
+        # Schrijf Excel werkboek
+        analyzer.create_excel_workbook(grouped_data, output_file, colors, settings.writer_engine)
+
+        # Genereer e-mail rapport (alleen notificaties die nog niet eerder gemaakt zijn)
+        ledger = analyzer.get_notification_ledger() if settings.use_ledger else None
+        try:
+            # Met voorraad toewijzing hangen de backorders van een order ook af van andere orders
+            if state is not None and email_layout == 'items' and not settings.stock_allocation:
+                # E-mails alleen voor gewijzigde orders; zonder ledger de rest uit de vorige run
+                email_report, email_layout = analyzer.generate_email_output(
+                    state.changed_subset(grouped_data), settings.email_mode, engine=email_engine, ledger=ledger,
+                    grouping=settings.digest_grouping)
+                if ledger is None:
+                    email_report = state.merge_emails(grouped_data, email_report)
+            else:
+                email_report, email_layout = analyzer.generate_email_output(
+                    grouped_data, settings.email_mode, engine=email_engine, ledger=ledger,
+                    grouping=settings.digest_grouping)
+            if len(email_report) > 0:
+                analyzer.save_email_report(email_report, email_file, layout=email_layout,
+                                           writer_engine=settings.writer_engine)
+            if ledger is not None:
+                ledger.commit()
+        finally:
+            if ledger is not None:
+                ledger.close()
+        if state is not None:
+            reusable = email_layout == 'items' and ledger is None and not settings.stock_allocation
+            state.save(grouped_data, email_report if reusable else None)
+        if settings.send_emails and len(email_report) > 0:
+            analyzer.send_email_report(email_report)
+
+        # Wijzigingen t.o.v. de vorige run
+        change_file, change_counts = None, {}
+        if settings.change_report:
+            change_file, change_counts = analyzer.write_change_report(grouped_data, output_file, state_name,
+                                                                      colors, settings.writer_engine)
+
+        # Print samenvatting
+        total_orders = len(grouped_data)
+        total_sendable = sum(order['sendable_count'] for order in grouped_data.values())
+        total_backorder = sum(order['backorder_count'] for order in grouped_data.values())
+
+        logging.info("=== Analyse voltooid ===")
+        logging.info(f"Totaal orders: {total_orders}")
+        logging.info(f"Totaal verzendbare artikelen: {total_sendable}")
+        logging.info(f"Totaal backorder artikelen: {total_backorder}")
+        logging.info(f"Output bestand: {output_file}")
+
+        if len(email_report) > 0:
+            logging.info(f"E-mails om te verzenden: {len(email_report)}")
+            logging.info(f"E-mail rapport: {email_file}")
+
+        # Categorie statistieken (in volgorde van eerste voorkomen)
+        categories = [order_info['backorder']['Category'] for order_info in grouped_data.values()
+                      if len(order_info['backorder']) > 0]
+        category_counts = {}
+        if categories:
+            counts = pd.concat(categories).value_counts(dropna=False, sort=False)
+            category_counts = {None if pd.isna(category) else category: int(count)
+                               for category, count in counts.items()}
+
+        logging.info("Backorder categorieën:")
+        for cat_num, count in category_counts.items():
+            if count > 0:
+                if cat_num is None:
+                    logging.info(f"  - Geen categorie: {count} artikelen")
+                elif manager:
+                    cat_name = manager.get_category_name(cat_num)
+                    logging.info(f"  - {cat_name}: {count} artikelen")
+                else:
+                    logging.info(f"  - Categorie {cat_num}: {count} artikelen")
+
+        email_file = email_file if len(email_report) > 0 else None
+        stats = {
+            'rows_read': rows_read,
+            'rows_after_filter': len(filtered_df),
+            'orders': total_orders,
+            'sendable': total_sendable,
+            'backorder': total_backorder,
+            'emails': len(email_report),
+            'category_counts': category_counts,
+            'seconds': time.perf_counter() - start,
+            'output_file': output_file,
+            'email_file': email_file,
+            'changes': change_counts,
+            'change_file': change_file
+        }
+        if state is not None:
+            stats['orders_reused'] = len(state.reused_orders)
+            stats['orders_recomputed'] = len(state.changed_orders)
+
+        return AnalysisResult(settings=settings, grouped_data=grouped_data, email_report=email_report,
+                              email_layout=email_layout, stats=stats, output_file=output_file,
+                              email_file=email_file, change_file=change_file, changes=change_counts)
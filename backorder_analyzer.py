@@ -15,10 +15,9 @@ import pandas as pd
 import numpy as np
 import logging
 import os
+import json
+import hashlib
 from datetime import datetime
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
 
 # Import configuratie
 try:
@@ -27,9 +26,33 @@ except ImportError:
     # Fallback configuratie als config.py niet bestaat
     INPUT_FILE = "Navision_Backorder_Export_Realistic.xlsx"
     OUTPUT_FILE = "Output/Backorder_Analyse.xlsx"
+    EXCEL_READER_ENGINE = "auto"
+    EXCEL_WRITER_ENGINE = "auto"
+    EXPORT_CACHE_ENABLED = True
+    EXPORT_CACHE_DIR = "Cache/exports"
+    EXPORT_CACHE_MAX_MB = 500
+    STREAMING_BATCH_ROWS = 50000
+    STREAMING_MEMORY_BUDGET_MB = 512
+    ANALYSIS_ENGINE = "pandas"
+    BATCH_WORKERS = 0
+    BATCH_OUTPUT_DIR = "Output/Batch"
+    SWEEP_WORKERS = 0
+    SWEEP_MODE = "threads"
+    INCREMENTAL_STATE_DIR = "Cache/incremental"
+    CHANGE_REPORT_ENABLED = True
+    CHANGE_SNAPSHOT_DIR = "Cache/snapshots"
+    ITEM_MASTER_FILE = ""
+    ITEM_MASTER_COLUMNS = {"key": "No.", "value": "Description"}
+    DEALER_MASTER_FILE = ""
+    DEALER_MASTER_COLUMNS = {"key": "No.", "value": "Name"}
+    MASTER_DATA_CACHE_DIR = "Cache/master"
+    STOCK_ALLOCATION_ENABLED = False
+    STOCK_ALLOCATION_PRIORITY = ["customer", "order"]
+    CUSTOMER_PRIORITY = {}
     LOCATION_CODE = "DSV"
     FULLY_RESERVED = "No"
     ORDER_STATUS = "Backorder"
+    BACKORDER_FILTERS = {}
     COLORS = {
         'header': '366092',
         'sendable': 'C6EFCE',
@@ -59,13 +82,36 @@ except ImportError:
         3: {'name': 'Geen voorraadvooruitzicht', 'color': 'FFA500'}
     }
     EMAIL_TEMPLATES = {}
+    EMAIL_MODE = "per_item"
+    EMAIL_DIGEST_GROUPING = "customer"
+    EMAIL_DIGEST_TEMPLATES = {}
     SALESFORCE_EMAIL_SETTINGS = {'enabled': False}
+    EMAIL_OUTBOX_SETTINGS = {}
+    NOTIFICATION_LEDGER_ENABLED = True
+    NOTIFICATION_LEDGER_FILE = "Cache/notification_ledger.sqlite"
+    NOTIFICATION_LEDGER_RETENTION_DAYS = 90
+
+from navision_reader import read_export
+from export_cache import ExportCache
+from excel_writer import AnalysisSheetWriter, EmailSheetWriter, resolve_writer_engine, measure_grouped_data
+from email_engine import EmailEngine, EMAIL_CATEGORIES, LINK_FIELDS
+from email_outbox import send_report
+from notification_ledger import NotificationLedger
+from category_rules import BIKE_BATTERY_TAG, DEFAULT_RULES, RuleEngine
+from filter_spec import compile_filter
+from stock_allocation import allocate_stock
+from master_data import MasterTable
+from substitution import SUBSTITUTION_COLUMNS, export_availability, resolve_substitutes
+from change_report import SnapshotStore, build_snapshot, diff_snapshots, save_change_report, summarize_changes
+from polars_pipeline import ENGINES, resolve_engine
 
 # Import CategoryManager
 try:
-    from category_manager import CategoryManager
-    category_manager = CategoryManager()
+    from category_manager import CategoryConfigProvider
+    category_provider = CategoryConfigProvider()
+    category_manager = category_provider.current()
 except ImportError:
+    category_provider = None
     category_manager = None
 
 # Setup logging
@@ -78,12 +124,81 @@ logging.basicConfig(
     ]
 )
 
-def load_navision_data(file_path):
+# Kolom mapping van het Navision export formaat naar het verwachte formaat
+COLUMN_MAPPING = {
+    'DOCUMENT_ID': 'Sales Order No.',
+    'SELL_TO_CUSTOMER_ID': 'Customer Name',
+    'TYPE_ID': 'Item No.',
+    'QUANTITY': 'Quantity',
+    'AVAILABLE_STOCK': 'Quantity Available'
+}
+
+# Vaste dtypes voor identificatie kolommen (bron- en doelnamen); aantallen
+# worden numeriek ingelezen door de engine
+SOURCE_DTYPES = {
+    'DOCUMENT_ID': str,
+    'SELL_TO_CUSTOMER_ID': str,
+    'TYPE_ID': str,
+    'Sales Order No.': str,
+    'Customer Name': str,
+    'Item No.': str
+}
+
+def get_source_columns():
+    """Kolommen uit de export die de analyse daadwerkelijk gebruikt."""
+    # Bronkolommen uit de mapping plus verplichte kolommen voor exports die al
+    # in het verwachte formaat staan (dubbelen verwijderd, volgorde behouden)
+    return list(dict.fromkeys(list(COLUMN_MAPPING.keys()) + REQUIRED_COLUMNS))
+
+# Kolommen met een vaste waarde als ze niet in de export staan; worden niet per
+# rij aangemaakt (zie column_values)
+COLUMN_DEFAULTS = {
+    'Location Code': 'DSV',
+    'Fully Reserved': 'No',
+    'Order Status': 'Backorder'
+}
+
+# Kolommen die pas bij het wegschrijven worden afgeleid ('Artikel <nummer>')
+LAZY_COLUMNS = ['Description']
+
+# Kolommen met veel herhaalde waarden, opgeslagen als categorical
+CATEGORICAL_COLUMNS = [
+    'Sales Order No.', 'Item No.', 'Customer Name',
+    'Location Code', 'Fully Reserved', 'Order Status'
+]
+
+# Aantallen, opgeslagen in het kleinste numerieke type waarin ze exact passen
+QUANTITY_COLUMNS = ['Quantity', 'Quantity Available']
+
+# Verhoog dit nummer bij wijzigingen in load_navision_data of validate_columns,
+# zodat gecachete exports van een oudere versie niet meer gebruikt worden
+CACHE_SCHEMA_VERSION = 2
+
+def get_mapping_version():
+    """Versie van de kolom mapping, onderdeel van de cache sleutel."""
+    payload = json.dumps({
+        'schema': CACHE_SCHEMA_VERSION,
+        'mapping': COLUMN_MAPPING,
+        'required': REQUIRED_COLUMNS
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]
+
+def get_export_cache():
+    """Maak de export cache volgens de configuratie."""
+    return ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_MB)
+
+def load_navision_data(file_path, engine=None):
     """Laad de Navision export data."""
     logging.info(f"Laden van Navision export: {file_path}")
     
     try:
-        df = pd.read_excel(file_path)
+        df, read_info = read_export(
+            file_path,
+            columns=get_source_columns(),
+            dtypes=SOURCE_DTYPES,
+            engine=engine or EXCEL_READER_ENGINE
+        )
+        df.attrs['reader'] = read_info
         logging.info(f"Data geladen: {len(df)} rijen, {len(df.columns)} kolommen")
         
         # Debug: Check voor negatieve quantities
@@ -101,15 +216,10 @@ def load_navision_data(file_path):
 def validate_columns(df):
     """Valideer en map kolommen naar het verwachte formaat."""
     logging.info(f"Beschikbare kolommen: {list(df.columns)}")
+    memory_before = column_memory(df)
     
     # Kolom mapping voor jouw Excel formaat
-    column_mapping = {
-        'DOCUMENT_ID': 'Sales Order No.',
-        'SELL_TO_CUSTOMER_ID': 'Customer Name', 
-        'TYPE_ID': 'Item No.',
-        'QUANTITY': 'Quantity',
-        'AVAILABLE_STOCK': 'Quantity Available'
-    }
+    column_mapping = COLUMN_MAPPING
     
     # Verwijder ITEM_ID kolom als die bestaat (omdat we TYPE_ID gebruiken)
     if 'ITEM_ID' in df.columns:
@@ -122,185 +232,391 @@ def validate_columns(df):
             df = df.rename(columns={old_col: new_col})
             logging.info(f"Kolom hernoemd: {old_col} -> {new_col}")
     
-    # Voeg ontbrekende kolommen toe met default waarden (na hernoeming)
-    df['Description'] = 'Artikel ' + df['Item No.'].astype(str)
-    df['Location Code'] = 'DSV'  # Default locatie
-    df['Fully Reserved'] = 'No'  # Default waarde
-    df['Order Status'] = 'Backorder'  # Default status
+    # Kolommen die de analyse niet gebruikt direct laten vallen
+    unused_columns = [col for col in df.columns if col not in REQUIRED_COLUMNS]
+    if unused_columns:
+        df = df.drop(columns=unused_columns)
+        logging.info(f"Ongebruikte kolommen verwijderd: {unused_columns}")
+    
+    df = normalize_dtypes(apply_column_defaults(df))
+    log_memory_report(memory_before, column_memory(df))
     
-    # Controleer of alle verplichte kolommen nu aanwezig zijn
-    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    logging.info("Kolom mapping voltooid")
+    return df
+
+def apply_column_defaults(df):
+    """
+    Controleer of alle verplichte kolommen aanwezig zijn.
+    
+    Kolommen met een vaste default (COLUMN_DEFAULTS) en de omschrijving worden
+    niet per rij aangemaakt: filters gebruiken de default waarde direct en de
+    output maakt 'Artikel <nummer>' pas bij het wegschrijven.
+    """
+    missing_columns = [col for col in REQUIRED_COLUMNS
+                       if col not in df.columns and col not in COLUMN_DEFAULTS and col not in LAZY_COLUMNS]
     if missing_columns:
         logging.warning(f"Ontbrekende kolommen na mapping: {missing_columns}")
-        # Voeg ontbrekende kolommen toe met default waarden
+        # Voeg ontbrekende kolommen toe met een lege waarde
         for col in missing_columns:
-            if col == 'Description':
-                df[col] = 'Artikel ' + df['Item No.'].astype(str)
-            elif col == 'Location Code':
-                df[col] = 'DSV'
-            elif col == 'Fully Reserved':
-                df[col] = 'No'
-            elif col == 'Order Status':
-                df[col] = 'Backorder'
-            else:
-                df[col] = ''
+            df[col] = ''
     
-    logging.info("Kolom mapping voltooid")
     return df
 
-def filter_backorder_data(df):
-    """Filter de data op basis van de criteria."""
+def column_values(df, column):
+    """Waarden van een kolom, of de default waarde (scalar) als de kolom niet aangemaakt is."""
+    if column in df.columns:
+        return df[column]
+    return COLUMN_DEFAULTS[column]
+
+def downcast_quantities(values):
+    """Zet aantallen om naar het kleinste numerieke type waarin ze exact passen."""
+    if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return values
+    present = values.dropna()
+    if len(present) == len(values) and (present % 1 == 0).all():
+        return pd.to_numeric(values, downcast='integer')
+    # float32 alleen als alle waarden daarin exact te representeren zijn
+    as_float32 = values.astype('float32')
+    if (as_float32.astype('float64') == values).where(values.notna(), True).all():
+        return as_float32
+    return values
+
+def normalize_dtypes(df):
+    """Identificatie kolommen en statussen als categorical, aantallen zo klein mogelijk."""
+    df = df.copy(deep=False)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in QUANTITY_COLUMNS:
+        if col in df.columns:
+            df[col] = downcast_quantities(df[col])
+    return df
+
+def column_memory(df):
+    """Geheugengebruik per kolom in bytes."""
+    return df.memory_usage(index=False, deep=True)
+
+def log_memory_report(before, after):
+    """Log het geheugengebruik per kolom voor en na normalisatie."""
+    # Bronnamen omzetten naar de namen na mapping, zodat voor en na naast elkaar staan
+    before = before.rename(index=COLUMN_MAPPING)
+    columns = list(dict.fromkeys(list(before.index) + list(after.index)))
+    logging.info("Geheugen per kolom (voor -> na normalisatie):")
+    for col in columns:
+        size_before = before.get(col)
+        size_after = after.get(col)
+        before_text = f"{size_before / 1024:.1f} KB" if size_before is not None else "-"
+        after_text = f"{size_after / 1024:.1f} KB" if size_after is not None else "-"
+        logging.info(f"  {col}: {before_text} -> {after_text}")
+    total_before, total_after = before.sum(), after.sum()
+    saved = 100 * (1 - total_after / total_before) if total_before else 0
+    logging.info(f"Geheugen totaal: {total_before / 1024 / 1024:.2f} MB -> "
+                 f"{total_after / 1024 / 1024:.2f} MB ({saved:.0f}% minder)")
+    return {'before': int(total_before), 'after': int(total_after)}
+
+def load_export(file_path, use_cache=True, filter_spec=None):
+    """
+    Laad en valideer een export, via de cache als die een geldige entry heeft.
+    
+    filter_spec: filters die bij het lezen uit de cache al toegepast mogen
+    worden (pushdown); filter_backorder_data blijft daarna nodig.
+    """
+    return _load_export(file_path, use_cache, filter_spec)[0]
+
+def _load_export(file_path, use_cache=True, filter_spec=None):
+    """load_export plus het aantal regels van de export (ook als de pushdown regels overslaat)."""
+    cache = get_export_cache() if (use_cache and EXPORT_CACHE_ENABLED) else None
+    cache_key = None
+    
+    if cache:
+        cache_key = cache.key_for(file_path, get_mapping_version())
+        pushdown = compile_filter(filter_spec).pushdown() if filter_spec else None
+        df = cache.get(cache_key, filters=pushdown)
+        if df is not None:
+            rows_read = (cache.row_count(cache_key) if pushdown else None) or len(df)
+            logging.info(f"Data geladen uit cache: {len(df)} van {rows_read} rijen, {len(df.columns)} kolommen")
+            return df, rows_read
+    
+    df = validate_columns(load_navision_data(file_path))
+    
+    if cache:
+        try:
+            cache.put(cache_key, df)
+        except Exception as e:
+            # Cache is een optimalisatie; de analyse gaat gewoon door
+            logging.warning(f"Kon export niet cachen: {e}")
+    
+    return df, len(df)
+
+def load_filtered_export(file_path, use_cache=True, filter_spec=None):
+    """
+    Inlezen (met pushdown uit de cache) en filteren met de pandas engine.
+    Geeft (gefilterde DataFrame, aantal ingelezen regels) terug, zoals
+    polars_pipeline.load_filtered_export.
+    """
+    filter_spec = get_filter_spec() if filter_spec is None else filter_spec
+    df, rows_read = _load_export(file_path, use_cache=use_cache, filter_spec=filter_spec)
+    return filter_backorder_data(df, filter_spec, rows_read=rows_read), rows_read
+
+def get_master_tables():
+    """Artikel en dealer stamgegevens volgens de configuratie (None als niet ingesteld)."""
+    tables = {}
+    for name, file_path, columns in (('items', ITEM_MASTER_FILE, ITEM_MASTER_COLUMNS),
+                                     ('dealers', DEALER_MASTER_FILE, DEALER_MASTER_COLUMNS)):
+        tables[name] = None
+        if file_path:
+            tables[name] = MasterTable(file_path, columns['key'], columns['value'],
+                                       MASTER_DATA_CACHE_DIR, EXCEL_READER_ENGINE)
+    return tables
+
+def join_master_data(df, tables=None):
+    """
+    Koppel de omschrijving per artikel (Description) en de naam per dealer
+    (Dealer Name) uit de stamgegevens aan de export.
+    """
+    tables = tables if tables is not None else get_master_tables()
+    if tables['items'] is None and tables['dealers'] is None:
+        return df
+    df = df.copy(deep=False)
+    if tables['items'] is not None:
+        df['Description'] = tables['items'].lookup(df['Item No.'], missing_format="Artikel {key}")
+    if tables['dealers'] is not None:
+        df['Dealer Name'] = tables['dealers'].lookup(df['Customer Name'])
+    return df
+
+def get_filter_spec():
+    """Filters uit de configuratie: LOCATION_CODE, FULLY_RESERVED, ORDER_STATUS en BACKORDER_FILTERS."""
+    spec = {
+        'Location Code': LOCATION_CODE,
+        'Fully Reserved': FULLY_RESERVED,
+        'Order Status': ORDER_STATUS
+    }
+    spec.update(BACKORDER_FILTERS)
+    return spec
+
+def filter_backorder_data(df, filter_spec=None, rows_read=None):
+    """
+    Filter de data op basis van de criteria.
+    
+    Alle criteria worden samen tot één masker geëvalueerd; de data wordt
+    maximaal één keer geselecteerd.
+    rows_read: aantal regels van de export als df al bij het lezen gefilterd
+    is (pushdown); standaard len(df).
+    """
     original_count = len(df)
-    
-    # Filter op Location Code (alleen als niet leeg)
-    if LOCATION_CODE:
-        df = df[df['Location Code'] == LOCATION_CODE]
-        logging.info(f"Na Location Code filter ({LOCATION_CODE}): {len(df)} rijen")
-    
-    # Filter op Fully Reserved (alleen als niet leeg)
-    if FULLY_RESERVED:
-        df = df[df['Fully Reserved'] == FULLY_RESERVED]
-        logging.info(f"Na Fully Reserved filter ({FULLY_RESERVED}): {len(df)} rijen")
-    
-    # Filter op Order Status (alleen als niet leeg)
-    if ORDER_STATUS:
-        df = df[df['Order Status'] == ORDER_STATUS]
-        logging.info(f"Na Order Status filter ({ORDER_STATUS}): {len(df)} rijen")
-    
-    logging.info(f"Filtering voltooid: {original_count} -> {len(df)} rijen")
+    scope = f"{original_count} rijen"
+    if rows_read is not None and rows_read > original_count:
+        logging.info(f"Bij het lezen al gefilterd (pushdown): {rows_read} -> {original_count} rijen")
+        scope += " na pushdown"
+    compiled = compile_filter(get_filter_spec() if filter_spec is None else filter_spec)
+    
+    unknown_columns = [predicate.column for predicate in compiled.predicates
+                       if predicate.column not in df.columns and predicate.column not in COLUMN_DEFAULTS]
+    if unknown_columns:
+        raise ValueError(f"Filter op onbekende kolom(men): {unknown_columns}")
+    
+    if compiled:
+        mask, counts = compiled.mask(df, column_values)
+        for description, count in counts:
+            logging.info(f"Filter {description}: {count} van {scope}")
+        if not mask.all():
+            df = df[mask]
+    
+    logging.info(f"Filtering voltooid: {rows_read or original_count} -> {len(df)} rijen")
     return df
 
-def categorize_backorder_items(df):
-    """Categoriseer backorder artikelen in de drie categorieën."""
-    def get_category(item_no):
-        if category_manager:
-            category = category_manager.get_category_for_item(item_no)
-            # Als CategoryManager geen categorie heeft (None), gebruik dan geen categorie
-            if category is None:
-                return None
-            return category
-        else:
-            # Geen CategoryManager beschikbaar - alle artikelen krijgen geen categorie
-            return None
-    
+def categorize_backorder_items(df, cached_categories=None, manager=None):
+    """
+    Categoriseer backorder artikelen in de drie categorieën.
+    
+    cached_categories: bewaarde categorie kolommen (index van df) voor regels die
+    niet opnieuw gecategoriseerd hoeven te worden (incrementele modus).
+    manager: CategoryManager (standaard die van deze module).
+    """
+    if manager is None:
+        manager = category_manager
     # Maak een kopie van de DataFrame om pandas warnings te voorkomen
     df_copy = df.copy()
     
-    # Voeg categorie toe aan DataFrame
-    df_copy['Category'] = df_copy['Item No.'].apply(get_category)
-    
-    # Bepaal categorie namen en acties
-    df_copy['Category_Name'] = df_copy['Category'].apply(lambda x: 
-        category_manager.get_category_name(x) if category_manager 
-        else 'Geen categorie'
-    )
-    
-    df_copy['Category_Action'] = df_copy['Category'].apply(lambda x: 
-        category_manager.get_category_action(x) if category_manager 
-        else 'Behoud backorder'
-    )
+    # Regels van ongewijzigde orders houden hun categorie uit de vorige run
+    reuse = np.zeros(len(df_copy), dtype=bool)
+    if cached_categories is not None and len(cached_categories) > 0:
+        reuse = df_copy.index.isin(cached_categories.index)
+    to_categorize = df_copy[~reuse] if reuse.any() else df_copy
     
+    if manager:
+        # Eén opzoekactie per uniek artikel via de index van de CategoryManager
+        categorized = manager.categorize_items(to_categorize['Item No.'], to_categorize['Customer Name'])
+    else:
+        # Geen CategoryManager beschikbaar - alle artikelen krijgen geen categorie
+        categorized = pd.DataFrame({
+            'Category': pd.Series(None, index=to_categorize.index, dtype=object),
+            'Category_Name': 'Geen categorie',
+            'Category_Action': 'Behoud backorder'
+        }, index=to_categorize.index)
+    
+    if reuse.any():
+        categorized = pd.concat([categorized, cached_categories.loc[df_copy.index[reuse]]]).reindex(df_copy.index)
+    
+    df_copy['Category'] = categorized['Category']
+    df_copy['Category_Name'] = categorized['Category_Name']
+    df_copy['Category_Action'] = categorized['Category_Action']
     return df_copy
 
-def group_by_sales_order(df):
-    """Groepeer data per Sales Order en categoriseer artikelen."""
+def bike_battery_mask(df, manager=None):
+    """Masker van fiets/batterij artikelen volgens de categorie regels (standaard BA/HP prefix)."""
+    if manager is None:
+        manager = category_manager
+    if manager:
+        return manager.tag_items(BIKE_BATTERY_TAG, df['Item No.'], df['Customer Name'])
+    return RuleEngine(DEFAULT_RULES).tag_mask(BIKE_BATTERY_TAG, df['Item No.'], df['Customer Name'])
+
+def add_substitutes(backorder_df, df, allocated=None, manager=None):
+    """
+    Voeg aan de backorder regels van categorie 4 het gekozen alternatief toe en
+    of dat alternatief volgens de export (df) geleverd kan worden.
+    allocated: aantallen per regel van df die de voorraad al gebruiken.
+    """
+    if manager is None:
+        manager = category_manager
+    alternatives = manager.get_alternatives(4) if manager else {}
+    category_4 = (backorder_df['Category'] == 4).to_numpy()
+    if not alternatives or not category_4.any():
+        return backorder_df
+    substitutes = resolve_substitutes(backorder_df[category_4], alternatives, export_availability(df, allocated))
+    for column in SUBSTITUTION_COLUMNS:
+        backorder_df[column] = substitutes[column]
+    return backorder_df
+
+def group_by_sales_order(df, cached_categories=None, allocate=None, substitutes=True, engine=None,
+                         manager=None, priority=None, customer_priority=None):
+    """
+    Groepeer data per Sales Order en categoriseer artikelen.
+    
+    cached_categories: zie categorize_backorder_items (incrementele modus).
+    allocate: voorraad per artikel over de orderregels verdelen (standaard
+    STOCK_ALLOCATION_ENABLED); regels worden dan gesplitst in een verzendbaar
+    en een backorder deel.
+    substitutes: alternatieven van categorie 4 opzoeken in df (alleen zinvol als
+    df alle regels van de export bevat).
+    engine: 'polars' berekent de tellingen en posities per order met polars
+    (standaard pandas); het resultaat is gelijk.
+    manager, priority, customer_priority: CategoryManager en toewijzingsvolgorde
+    (standaard die van deze module en STOCK_ALLOCATION_PRIORITY / CUSTOMER_PRIORITY).
+    """
     grouped_data = {}
     
-    for order_no in df['Sales Order No.'].unique():
-        order_data = df[df['Sales Order No.'] == order_no]
-        customer_name = order_data['Customer Name'].iloc[0]
-        
-        # Split in verzendbaar en backorder
-        # Gebruik pandas.isna() om NaN waarden te controleren
-        sendable = order_data[(order_data['Quantity Available'] > 0) & (~order_data['Quantity Available'].isna())]
-        # Backorder: 0, negatieve waarden, of NaN
-        backorder = order_data[(order_data['Quantity Available'] <= 0) | (order_data['Quantity Available'].isna())]
-        
-        # Check voor BA/HP artikelen (batterijen/fietsen) - deze mogen gewoon als backorder blijven
-        # Converteer naar string en check veilig
-        ba_hp_items = backorder[backorder['Item No.'].astype(str).str.startswith(('BA', 'HP'), na=False)]
-        if len(ba_hp_items) > 0:
-            logging.info(f"Order {order_no} bevat {len(ba_hp_items)} BA/HP artikelen (batterijen/fietsen) - deze blijven als normale backorder")
-        
-        # Als er 0 verzendbaar en 0 backorder zijn, check dan voor BA/HP nummers
-        if len(sendable) == 0 and len(backorder) == 0:
-            # Check of er BA/HP nummers in de hele order zitten
-            all_ba_hp = order_data[order_data['Item No.'].astype(str).str.startswith(('BA', 'HP'), na=False)]
-            if len(all_ba_hp) > 0:
-                logging.info(f"Order {order_no} bevat alleen BA/HP artikelen (fiets/batterij) - niet aanpassen")
-                # Markeer als speciale categorie voor Excel output
-                grouped_data[order_no] = {
-                    'customer': customer_name,
-                    'sendable': sendable,
-                    'backorder': backorder,
-                    'total_items': len(order_data),
-                    'sendable_count': len(sendable),
-                    'backorder_count': len(backorder),
-                    'is_bike_battery': True
-                }
-                continue
-        
-        # Debug: Check voor onmogelijke situaties
-        if len(sendable) == 0 and len(backorder) == 0:
-            logging.warning(f"Order {order_no} heeft geen verzendbare of backorder artikelen!")
-            logging.warning(f"Order data: {order_data[['Item No.', 'Quantity', 'Quantity Available']].to_dict('records')}")
-            # Forceer alle artikelen als backorder als er geen verzendbare of backorder zijn
-            backorder = order_data.copy()
-            logging.info(f"Order {order_no}: Alle artikelen geforceerd als backorder")
-        
-        # Categoriseer backorder artikelen
-        if len(backorder) > 0:
-            backorder = categorize_backorder_items(backorder)
+    # Regels zonder ordernummer kunnen niet gegroepeerd worden
+    missing_order = df['Sales Order No.'].isna()
+    if missing_order.any():
+        logging.warning(f"{int(missing_order.sum())} regels zonder Sales Order No. overgeslagen")
+        df = df[~missing_order]
+    
+    if len(df) == 0:
+        return grouped_data
+    
+    if allocate is None:
+        allocate = STOCK_ALLOCATION_ENABLED
+    
+    # Split in verzendbaar en backorder voor alle regels tegelijk
+    if allocate:
+        # Verzendbaar: het toegewezen deel; backorder: de rest (of de hele regel zonder voorraad).
+        # Regels zonder vraag (Quantity 0 of leeg) zijn geen van beide.
+        allocated, remaining = allocate_stock(df, priority or STOCK_ALLOCATION_PRIORITY,
+                                              CUSTOMER_PRIORITY if customer_priority is None else customer_priority)
+        sendable_mask = allocated > 0
+        backorder_mask = remaining > 0
+        # Gedeeltelijk toegewezen regels staan in beide delen, maar tellen als backorder
+        split_mask = sendable_mask & backorder_mask
+        sendable_df = df[sendable_mask].copy()
+        sendable_df['Quantity'] = allocated[sendable_mask]
+        backorder_df = df[backorder_mask].copy()
+        backorder_df['Quantity'] = remaining[backorder_mask]
+    else:
+        # Verzendbaar: Quantity Available > 0; backorder: 0, negatieve waarden, of NaN
+        available = df['Quantity Available']
+        sendable_mask = (available > 0) & (~available.isna())
+        # Verzendbare regels gebruiken hun aantal van de voorraad (voor de alternatieven)
+        allocated = np.where(sendable_mask.to_numpy(), np.nan_to_num(
+            df['Quantity'].to_numpy(dtype='float64', na_value=np.nan)), 0.0)
+        backorder_mask = ~sendable_mask
+        split_mask = np.zeros(len(df), dtype=bool)
+        sendable_df = df[sendable_mask]
+        backorder_df = df[backorder_mask]
+    
+    # BA/HP artikelen (batterijen/fietsen) - deze mogen gewoon als backorder blijven
+    ba_hp_mask = bike_battery_mask(df, manager)
+    
+    # Categoriseer alle backorder artikelen in één keer
+    if len(backorder_df) > 0:
+        backorder_df = categorize_backorder_items(backorder_df, cached_categories, manager)
+        if substitutes:
+            backorder_df = add_substitutes(backorder_df, df, allocated, manager)
+    
+    if engine == 'polars':
+        from polars_pipeline import order_layout
+        order_stats, sendable_positions, backorder_positions = order_layout(
+            df['Sales Order No.'], sendable_mask, backorder_mask, split_mask, ba_hp_mask)
+    else:
+        # Posities per order binnen de verzendbaar/backorder frames (één groupby pass)
+        sendable_positions = sendable_df.groupby('Sales Order No.', sort=False, observed=True).indices
+        backorder_positions = backorder_df.groupby('Sales Order No.', sort=False, observed=True).indices
+        
+        # Tellingen per order, in volgorde van eerste voorkomen
+        order_stats = pd.DataFrame({
+            'Sales Order No.': df['Sales Order No.'],
+            'sendable': sendable_mask,
+            'backorder': backorder_mask,
+            'split': split_mask,
+            'ba_hp_backorder': ba_hp_mask & backorder_mask
+        }).groupby('Sales Order No.', sort=False, observed=True).agg(
+            total=('sendable', 'size'),
+            sendable=('sendable', 'sum'),
+            backorder=('backorder', 'sum'),
+            split=('split', 'sum'),
+            ba_hp_backorder=('ba_hp_backorder', 'sum')
+        )
+    empty_frame = df.iloc[0:0]
+    first_lines = df.drop_duplicates(subset='Sales Order No.').set_index('Sales Order No.')
+    customers = first_lines['Customer Name']
+    dealer_names = first_lines['Dealer Name'] if 'Dealer Name' in df.columns else None
+    
+    for order_no, total, sendable_count, backorder_count, split_count, ba_hp_backorder_count in \
+            order_stats.itertuples(name=None):
+        customer_name = customers[order_no]
+        # Regels die deels verzendbaar zijn tellen één keer, als backorder
+        sendable_count -= split_count
+        
+        sendable = sendable_df.take(sendable_positions[order_no]) if order_no in sendable_positions else empty_frame
+        backorder = backorder_df.take(backorder_positions[order_no]) if order_no in backorder_positions else empty_frame
+        
+        if ba_hp_backorder_count > 0:
+            logging.info(f"Order {order_no} bevat {ba_hp_backorder_count} BA/HP artikelen (batterijen/fietsen) - deze blijven als normale backorder")
         
         grouped_data[order_no] = {
             'customer': customer_name,
             'sendable': sendable,
             'backorder': backorder,
-            'total_items': len(order_data),
-            'sendable_count': len(sendable),
-            'backorder_count': len(backorder)
+            'total_items': total,
+            'sendable_count': sendable_count,
+            'backorder_count': backorder_count,
+            'split_count': split_count
         }
+        # Alleen een bekende dealernaam (onbekend in de stamgegevens is NaN)
+        if dealer_names is not None and pd.notna(dealer_names[order_no]):
+            grouped_data[order_no]['customer_name'] = dealer_names[order_no]
         
-        logging.info(f"Order {order_no} ({customer_name}): {len(sendable)} verzendbaar, {len(backorder)} backorder")
+        logging.info(f"Order {order_no} ({customer_name}): {sendable_count} verzendbaar, {backorder_count} backorder")
     
     return grouped_data
 
-def shorten_url(url):
-    """Verkort een URL door alleen het domein en belangrijke delen te behouden."""
-    if not url or not isinstance(url, str):
-        return url
-    
-    # Verwijder protocol
-    if url.startswith('http://'):
-        url = url[7:]
-    elif url.startswith('https://'):
-        url = url[8:]
-    
-    # Verwijder www. als aanwezig
-    if url.startswith('www.'):
-        url = url[4:]
-    
-    # Als de URL nog steeds te lang is, behoud alleen het domein en eerste pad
-    if len(url) > 50:
-        parts = url.split('/')
-        if len(parts) > 1:
-            # Behoud domein + eerste pad
-            shortened = '/'.join(parts[:2])
-            if len(shortened) > 50:
-                # Als nog steeds te lang, behoud alleen domein
-                shortened = parts[0]
-            return shortened
-        else:
-            return parts[0]
-    
-    return url
-
-def generate_email_content(item_data, category):
+def generate_email_content(item_data, category, engine=None):
     """Genereer e-mail content voor een artikel."""
     if category not in EMAIL_TEMPLATES:
         return None
     
-    template = EMAIL_TEMPLATES[category]
+    engine = engine or get_email_engine()
+    subject_template, body_template = engine.compiled[category]
     
     # Vul template variabelen
     email_data = {
@@ -311,42 +627,13 @@ def generate_email_content(item_data, category):
         'quantity': item_data['Quantity']
     }
     
-    # Voeg specifieke links toe via CategoryManager
-    if category_manager:
-        if category == 1:
-            # Categorie 1: Link naar fabrikant
-            manufacturer_link = category_manager.get_item_link(item_data['Item No.'], 'fabrikant')
-            if manufacturer_link:
-                email_data['manufacturer_message'] = f"Wij raden u aan om dit artikel direct bij de fabrikant te bestellen:\n🔗 {shorten_url(manufacturer_link)} (verkorte link)"
-            else:
-                email_data['manufacturer_message'] = "Wij raden u aan om contact op te nemen met de fabrikant van dit artikel voor bestelling."
-        elif category == 3:
-            # Categorie 3: Link naar externe verkoper
-            external_link = category_manager.get_item_link(item_data['Item No.'], 'externe_verkoper')
-            if external_link:
-                email_data['external_seller_message'] = f"Wij raden u aan om dit artikel bij een externe verkoper te bestellen:\n🔗 {shorten_url(external_link)} (verkorte link)"
-            else:
-                email_data['external_seller_message'] = "Wij raden u aan om een externe verkoper te zoeken voor dit artikel."
-    else:
-        # Fallback naar oude methode
-        if category == 1:
-            manufacturer_links = template.get('manufacturer_links', {})
-            link = manufacturer_links.get(
-                item_data['Item No.'], 
-                manufacturer_links.get('default', 'https://www.original-equipment-parts.com')
-            )
-            email_data['manufacturer_message'] = f"Wij raden u aan om dit artikel direct bij de fabrikant te bestellen:\n🔗 {shorten_url(link)} (verkorte link)"
-        elif category == 3:
-            external_links = template.get('external_seller_links', {})
-            link = external_links.get(
-                item_data['Item No.'], 
-                external_links.get('default', 'https://www.autodoc.nl')
-            )
-            email_data['external_seller_message'] = f"Wij raden u aan om dit artikel bij een externe verkoper te bestellen:\n🔗 {shorten_url(link)} (verkorte link)"
+    # Voeg specifieke links toe (CategoryManager of fallback links uit de template)
+    if category in LINK_FIELDS:
+        email_data[LINK_FIELDS[category][0]] = engine.get_link_message(category, item_data['Item No.'])
     
     # Genereer e-mail content
-    subject = template['subject'].format(**email_data)
-    body = template['body'].format(**email_data)
+    subject = subject_template.render_one(email_data)
+    body = body_template.render_one(email_data)
     
     return {
         'to': item_data['Customer Name'],
@@ -356,339 +643,235 @@ def generate_email_content(item_data, category):
         'item_data': item_data
     }
 
-def create_excel_workbook(grouped_data):
-    """Maak een Excel werkboek met de geanalyseerde data."""
-    logging.info("Excel werkboek succesvol aangemaakt")
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Backorder Analyse"
-    
-    # Definieer kleuren
-    colors = {
-        'header': PatternFill(start_color=COLORS['header'], end_color=COLORS['header'], fill_type='solid'),
-        'sendable': PatternFill(start_color=COLORS['sendable'], end_color=COLORS['sendable'], fill_type='solid'),
-        'backorder': PatternFill(start_color=COLORS['backorder'], end_color=COLORS['backorder'], fill_type='solid'),
-        'order_header': PatternFill(start_color=COLORS['order_header'], end_color=COLORS['order_header'], fill_type='solid'),
-        'category_1': PatternFill(start_color=COLORS['category_1'], end_color=COLORS['category_1'], fill_type='solid'),
-        'category_2': PatternFill(start_color=COLORS['category_2'], end_color=COLORS['category_2'], fill_type='solid'),
-        'category_3': PatternFill(start_color=COLORS['category_3'], end_color=COLORS['category_3'], fill_type='solid'),
-        'category_4': PatternFill(start_color=COLORS['category_4'], end_color=COLORS['category_4'], fill_type='solid'),
-        'no_category': PatternFill(start_color=COLORS['backorder'], end_color=COLORS['backorder'], fill_type='solid')
-    }
+def create_excel_workbook(grouped_data, file_path, colors=None, writer_engine=None):
+    """
+    Schrijf de geanalyseerde data als Excel werkboek naar file_path
+    (standaard met COLORS en EXCEL_WRITER_ENGINE).
+    """
+    engine = resolve_writer_engine(writer_engine or EXCEL_WRITER_ENGINE)
     
-    # Definieer borders
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    # openpyxl write-only kan kolombreedtes niet achteraf zetten: vooraf meten
+    column_widths = None if engine == 'xlsxwriter' else measure_grouped_data(grouped_data)
     
-    # Definieer fonts
-    header_font = Font(bold=True, color="FFFFFF")
-    normal_font = Font()
-    
-    current_row = 1
-    
-    # Voor elke order
+    writer = AnalysisSheetWriter(file_path, colors or COLORS, column_widths=column_widths, engine=engine)
     for order_no, order_info in grouped_data.items():
-        customer = order_info['customer']
-        
-        # Check voor fiets/batterij orders
-        if order_info.get('is_bike_battery', False):
-            ws.cell(row=current_row, column=1, value=f"Order: {order_no}")
-            ws.cell(row=current_row, column=2, value=f"Klant: {customer}")
-            ws.cell(row=current_row, column=3, value="🚲 FIETS/BATTERIJ ORDER")
-            ws.cell(row=current_row, column=4, value="NIET AANPASSEN")
-            ws.cell(row=current_row, column=5, value="")
-            
-            # Styling voor fiets/batterij order
-            for col in range(1, 6):
-                cell = ws.cell(row=current_row, column=col)
-                cell.fill = PatternFill(start_color="FFD700", end_color="FFD700", fill_type='solid')  # Goud
-                cell.font = Font(bold=True)
-                cell.border = thin_border
-        else:
-            # Normale order header
-            ws.cell(row=current_row, column=1, value=f"Order: {order_no}")
-            ws.cell(row=current_row, column=2, value=f"Klant: {customer}")
-            ws.cell(row=current_row, column=3, value=f"Totaal: {order_info['total_items']}")
-            ws.cell(row=current_row, column=4, value=f"Verzendbaar: {order_info['sendable_count']}")
-            ws.cell(row=current_row, column=5, value=f"Backorder: {order_info['backorder_count']}")
-            
-            # Styling voor normale order header
-            for col in range(1, 6):
-                cell = ws.cell(row=current_row, column=col)
-                cell.fill = colors['order_header']
-                cell.font = Font(bold=True)
-                cell.border = thin_border
-        
-        # Styling voor order header
-        for col in range(1, 6):
-            cell = ws.cell(row=current_row, column=col)
-            cell.fill = colors['order_header']
-            cell.font = Font(bold=True)
-            cell.border = thin_border
-        
-        current_row += 1
-        
-        # Skip verdere verwerking voor fiets/batterij orders
-        if order_info.get('is_bike_battery', False):
-            current_row += 1  # Extra ruimte
-            continue
-        
-        # Verzendbare artikelen
-        if len(order_info['sendable']) > 0:
-            ws.cell(row=current_row, column=1, value="✅ VERZENDBAAR")
-            ws.cell(row=current_row, column=1).fill = colors['sendable']
-            ws.cell(row=current_row, column=1).font = Font(bold=True)
-            current_row += 1
-            
-            # Headers voor verzendbare artikelen
-            headers = ['Artikelnummer', 'Omschrijving', 'Aantal', 'Beschikbaar']
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=current_row, column=col, value=header)
-                cell.fill = colors['header']
-                cell.font = header_font
-                cell.border = thin_border
-            current_row += 1
-            
-            # Verzendbare artikelen data
-            for _, item in order_info['sendable'].iterrows():
-                ws.cell(row=current_row, column=1, value=item['Item No.'])
-                # Fallback voor Description als deze niet beschikbaar is
-                description = item.get('Description', f'Artikel {item["Item No."]}')
-                ws.cell(row=current_row, column=2, value=description)
-                ws.cell(row=current_row, column=3, value=item['Quantity'])
-                ws.cell(row=current_row, column=4, value=item['Quantity Available'])
-                
-                # Styling
-                for col in range(1, 5):
-                    cell = ws.cell(row=current_row, column=col)
-                    cell.fill = colors['sendable']
-                    cell.border = thin_border
-                current_row += 1
-        
-        # Backorder artikelen
-        if len(order_info['backorder']) > 0:
-            ws.cell(row=current_row, column=1, value="❌ BACKORDER")
-            ws.cell(row=current_row, column=1).fill = colors['backorder']
-            ws.cell(row=current_row, column=1).font = Font(bold=True)
-            current_row += 1
-            
-            # Headers voor backorder artikelen
-            headers = ['Artikelnummer', 'Omschrijving', 'Aantal', 'Beschikbaar', 'Categorie', 'Actie']
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=current_row, column=col, value=header)
-                cell.fill = colors['header']
-                cell.font = header_font
-                cell.border = thin_border
-            current_row += 1
-            
-            # Backorder artikelen data
-            for _, item in order_info['backorder'].iterrows():
-                category = item['Category']
-                category_name = item['Category_Name']
-                
-                ws.cell(row=current_row, column=1, value=item['Item No.'])
-                # Fallback voor Description als deze niet beschikbaar is
-                description = item.get('Description', f'Artikel {item["Item No."]}')
-                ws.cell(row=current_row, column=2, value=description)
-                ws.cell(row=current_row, column=3, value=item['Quantity'])
-                ws.cell(row=current_row, column=4, value=item['Quantity Available'])
-                ws.cell(row=current_row, column=5, value=category_name)
-                
-                # Actie kolom - gebruik de actie uit de data
-                action = item.get('Category_Action', 'Behoud backorder')
-                ws.cell(row=current_row, column=6, value=action)
-                
-                # Styling met categorie kleur
-                if category is not None and not pd.isna(category):
-                    category_color = colors[f'category_{int(category)}']
-                else:
-                    # Default kleur voor artikelen zonder categorie
-                    category_color = colors['no_category']
-                
-                for col in range(1, 7):
-                    cell = ws.cell(row=current_row, column=col)
-                    cell.fill = category_color
-                    cell.border = thin_border
-                current_row += 1
-        
-        # Spacing tussen orders
-        current_row += 2
+        writer.write_order(order_no, order_info)
+    writer.close()
     
-    # Auto-fit kolommen (veilige versie)
-    for col in range(1, 7):  # Max 6 kolommen
-        max_length = 0
-        column_letter = ws.cell(row=1, column=col).column_letter
-        
-        for row in range(1, current_row):
-            cell = ws.cell(row=row, column=col)
-            if cell.value:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-        
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    return wb
+    logging.info(f"Excel bestand opgeslagen: {file_path} ({engine})")
+    return file_path
 
-def generate_email_report(grouped_data):
-    """Genereer een rapport van alle e-mails die verzonden moeten worden."""
-    email_report = []
-    
-    for order_no, order_info in grouped_data.items():
-        for _, item in order_info['backorder'].iterrows():
-            category = item['Category']
-            
-            # Alleen categorie 1 en 3 krijgen e-mails
-            if category in [1, 3]:
-                email_content = generate_email_content(item, category)
-                if email_content:
-                    email_report.append(email_content)
-    
-    return email_report
-
-def save_excel_file(wb, file_path):
-    """Sla het Excel bestand op."""
-    # Maak output directory als deze niet bestaat
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    
-    wb.save(file_path)
-    logging.info(f"Excel bestand opgeslagen: {file_path}")
-
-def save_email_report(email_report, file_path):
-    """Sla het e-mail rapport op als Excel bestand."""
-    if not email_report:
+def refresh_category_manager():
+    """
+    Herlaad de categorie configuratie als die sinds de vorige analyse gewijzigd is
+    (bijvoorbeeld vanuit de GUI) en geef de actuele CategoryManager terug.
+    """
+    global category_manager
+    if category_provider:
+        category_manager = category_provider.current()
+    return category_manager
+
+def get_category_version():
+    """Versie van de categorie configuratie (sleutel voor caches van analyseresultaten)."""
+    return category_provider.version if category_provider else None
+
+def get_notification_ledger():
+    """Open de notification ledger volgens de configuratie (None als uitgeschakeld)."""
+    if not NOTIFICATION_LEDGER_ENABLED:
+        return None
+    return NotificationLedger(NOTIFICATION_LEDGER_FILE, NOTIFICATION_LEDGER_RETENTION_DAYS)
+
+def get_email_engine(manager=None):
+    """Maak een e-mail engine met de huidige templates en links."""
+    return EmailEngine(EMAIL_TEMPLATES, category_manager if manager is None else manager, EMAIL_DIGEST_TEMPLATES)
+
+def collect_email_lines(grouped_data, ledger=None, versions=None):
+    """
+    Verzamel alle backorder regels die een e-mail krijgen (categorie 1 en 3).
+
+    Met een notification ledger blijven alleen regels over waarvoor met deze
+    template versies nog geen e-mail gemaakt is.
+    """
+    frames = [order_info['backorder'] for order_info in grouped_data.values()
+              if len(order_info['backorder']) > 0 and 'Category' in order_info['backorder'].columns]
+    if not frames:
+        return pd.DataFrame(columns=['Sales Order No.', 'Customer Name', 'Item No.', 'Quantity', 'Category'])
+    lines = pd.concat(frames)
+    lines = lines[lines['Category'].isin(EMAIL_CATEGORIES)]
+    if ledger is not None:
+        lines = ledger.exclude_notified(lines, versions or {})
+    return lines
+
+def generate_email_frame(grouped_data, engine=None, ledger=None):
+    """Genereer alle e-mails in één batch als DataFrame (één rij per e-mail)."""
+    engine = engine or get_email_engine()
+    return engine.render(collect_email_lines(grouped_data, ledger, engine.template_versions('items')))
+
+def generate_digest_frame(grouped_data, engine=None, grouping=None, ledger=None):
+    """Genereer digest e-mails als DataFrame (één rij per dealer, of per dealer en order)."""
+    engine = engine or get_email_engine()
+    lines = collect_email_lines(grouped_data, ledger, engine.template_versions('digest'))
+    return engine.render_digests(lines, grouping or EMAIL_DIGEST_GROUPING)
+
+def resolve_email_layout(email_mode=None):
+    """Bepaal de layout van het e-mail rapport ('items' of 'digest') voor een e-mail modus."""
+    email_mode = email_mode or EMAIL_MODE
+    if email_mode not in ('per_item', 'digest'):
+        raise ValueError(f"Onbekende e-mail modus: {email_mode} (kies uit ['per_item', 'digest'])")
+    if email_mode == 'digest':
+        if EMAIL_DIGEST_TEMPLATES:
+            return 'digest'
+        logging.warning("Geen digest templates geconfigureerd, terugvallen op één e-mail per artikel")
+    return 'items'
+
+def generate_email_output(grouped_data, email_mode=None, engine=None, ledger=None, grouping=None):
+    """
+    Genereer de e-mails volgens de e-mail modus; geeft (DataFrame, layout) terug.
+    grouping: groepering van digest e-mails (standaard EMAIL_DIGEST_GROUPING).
+    """
+    layout = resolve_email_layout(email_mode)
+    if layout == 'digest':
+        return generate_digest_frame(grouped_data, engine=engine, grouping=grouping, ledger=ledger), layout
+    return generate_email_frame(grouped_data, engine=engine, ledger=ledger), layout
+
+def generate_email_report(grouped_data, ledger=None):
+    """
+    Genereer een rapport van alle e-mails die verzonden moeten worden.
+
+    Met een ledger worden eerder gemaakte notificaties overgeslagen; de nieuwe
+    worden vastgelegd zodra de aanroeper ledger.commit() doet.
+    """
+    email_frame = generate_email_frame(grouped_data, ledger=ledger)
+    
+    # Zelfde structuur als generate_email_content, voor bestaande aanroepers
+    return [{
+        'to': row['Klant'],
+        'subject': row['Onderwerp'],
+        'body': row['E-mail Body'],
+        'category': row['Categorie'],
+        'item_data': {
+            'Sales Order No.': row['Ordernummer'],
+            'Customer Name': row['Klant'],
+            'Item No.': row['Artikelnummer'],
+            'Description': row['Omschrijving'],
+            'Quantity': row['Aantal']
+        }
+    } for row in email_frame.to_dict('records')]
+
+def save_email_report(email_report, file_path, layout="items", writer_engine=None):
+    """Sla het e-mail rapport op als Excel bestand (standaard met EXCEL_WRITER_ENGINE)."""
+    if len(email_report) == 0:
         logging.info("Geen e-mails om te verzenden")
         return
     
-    # Maak DataFrame van e-mails
-    email_data = []
-    for email in email_report:
-        email_data.append({
-            'Ordernummer': email['item_data']['Sales Order No.'],
-            'Klant': email['to'],
-            'Artikelnummer': email['item_data']['Item No.'],
-            'Omschrijving': email['item_data'].get('Description', f'Artikel {email["item_data"]["Item No."]}'),
-            'Aantal': email['item_data']['Quantity'],
-            'Categorie': email['category'],
-            'Onderwerp': email['subject'],
-            'E-mail Body': email['body']
-        })
-    
-    df = pd.DataFrame(email_data)
-    
-    # Sla op als Excel
-    with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='E-mails', index=False)
-        
-        # Auto-fit kolommen
-        worksheet = writer.sheets['E-mails']
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
+    writer = EmailSheetWriter(file_path, engine=writer_engine or EXCEL_WRITER_ENGINE, layout=layout)
+    if isinstance(email_report, pd.DataFrame):
+        writer.write_frame(email_report)
+    else:
+        writer.write_emails(email_report)
+    writer.close()
     
     logging.info(f"E-mail rapport opgeslagen: {file_path}")
 
-def main(input_file=None):
-    """Hoofdfunctie van het script."""
+def send_email_report(email_report):
+    """Verzend het e-mail rapport via de outbox (hervat een onderbroken verzending)."""
+    if not SALESFORCE_EMAIL_SETTINGS.get('enabled'):
+        logging.warning("E-mail verzending staat uit (SALESFORCE_EMAIL_SETTINGS['enabled'])")
+        return None
+    return send_report(email_report, EMAIL_OUTBOX_SETTINGS, SALESFORCE_EMAIL_SETTINGS)
+
+def default_state_name(input_file, filter_spec):
+    """
+    Naam van de bewaarde staat voor een export en filter combinatie
+    (<bestandsnaam>_<hash van de filters>), zodat runs op verschillende exports
+    of met andere filters elk met hun eigen vorige run vergeleken worden.
+    """
+    stem = os.path.splitext(os.path.basename(str(input_file)))[0]
+    filters = json.dumps(filter_spec, sort_keys=True, default=str)
+    return f"{stem}_{hashlib.sha1(filters.encode('utf-8')).hexdigest()[:8]}"
+
+def write_change_report(grouped_data, output_file, state_name, colors=None, writer_engine=None):
+    """
+    Vergelijk de analyse met de snapshot van de vorige run (zelfde state_name)
+    en schrijf de wijzigingen naar <output_file>_Wijzigingen.xlsx
+    (standaard met COLORS en EXCEL_WRITER_ENGINE).
+    Geeft (bestand of None, aantal per soort wijziging) terug.
+    """
+    store = SnapshotStore(CHANGE_SNAPSHOT_DIR, state_name)
+    previous = store.load()
+    current = build_snapshot(grouped_data)
+    change_file, change_counts = None, {}
+    if previous is None:
+        logging.info("Geen snapshot van een vorige run; wijzigingen rapport vanaf de volgende run")
+    else:
+        report = diff_snapshots(previous, current)
+        change_counts = summarize_changes(report)
+        if len(report) > 0:
+            change_file = save_change_report(report, output_file.replace('.xlsx', '_Wijzigingen.xlsx'),
+                                             colors or COLORS, writer_engine or EXCEL_WRITER_ENGINE)
+            logging.info(f"Wijzigingen t.o.v. de vorige run: {len(report)} ({change_file})")
+            for change, count in change_counts.items():
+                logging.info(f"  - {change}: {count}")
+        else:
+            logging.info("Geen wijzigingen t.o.v. de vorige run")
+    store.save(current)
+    return change_file, change_counts
+
+def main(input_file=None, use_cache=True, streaming=False, email_mode=None, send_emails=False,
+         use_ledger=True, output_file=None, email_file=None, incremental=False, state_name=None,
+         engine=None):
+    """
+    Hoofdfunctie van het script.
+    
+    output_file / email_file: paden voor het analyse werkboek en het e-mail
+    rapport (standaard Output/Backorder_Analyse_v<tijd>.xlsx en OUTPUT_FILE).
+    incremental: alleen nieuwe of gewijzigde orders opnieuw categoriseren en
+    e-mailen ten opzichte van de vorige run met dezelfde state_name.
+    state_name: naam van de bewaarde staat van de vorige run (incrementele
+    resultaten en de snapshot voor het wijzigingen rapport); standaard afgeleid
+    van de export en de filters (default_state_name).
+    engine: 'pandas' of 'polars' voor inlezen, filteren en groeperen
+    (standaard ANALYSIS_ENGINE).
+    Geeft een dict met samenvattende statistieken terug.
+    """
     logging.info("=== Navision Backorder Analyzer gestart ===")
+    refresh_category_manager()
     
     # Gebruik opgegeven file of fallback naar config
     file_to_use = input_file if input_file else INPUT_FILE
     logging.info(f"Gebruik bestand: {file_to_use}")
     
-    try:
-        # Laad data
-        df = load_navision_data(file_to_use)
-        
-        # Valideer kolommen
-        validate_columns(df)
-        
-        # Filter data
-        filtered_df = filter_backorder_data(df)
-        
-        # Zorg ervoor dat de kolom namen correct zijn na filtering
-        if 'DOCUMENT_ID' in filtered_df.columns:
-            filtered_df = filtered_df.rename(columns={
-                'DOCUMENT_ID': 'Sales Order No.',
-                'SELL_TO_CUSTOMER_ID': 'Customer Name',
-                'TYPE_ID': 'Item No.',
-                'QUANTITY': 'Quantity',
-                'AVAILABLE_STOCK': 'Quantity Available'
-            })
-            logging.info("Kolommen opnieuw hernoemd na filtering")
-        
-        # Groepeer per order
-        grouped_data = group_by_sales_order(filtered_df)
-        
-        # Maak Excel werkboek
-        wb = create_excel_workbook(grouped_data)
-        
-        # Genereer unieke bestandsnaam
-        from datetime import datetime
+    if streaming and incremental:
+        logging.warning("Incrementele modus wordt in streaming modus niet ondersteund; alles wordt berekend")
+    
+    engine = resolve_engine(engine or ANALYSIS_ENGINE)
+    if streaming and engine != 'pandas':
+        logging.warning(f"De streaming modus heeft een eigen verwerking; engine {engine} wordt niet gebruikt")
+    
+    if streaming:
+        # Begrensd geheugengebruik: export wordt in batches verwerkt
+        from streaming_pipeline import run_streaming_analysis
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"Output/Backorder_Analyse_v{timestamp}.xlsx"
-        
-        # Sla Excel op
-        save_excel_file(wb, output_file)
-        
-        # Genereer e-mail rapport
-        email_report = generate_email_report(grouped_data)
-        if email_report:
-            email_file = OUTPUT_FILE.replace('.xlsx', '_Emails.xlsx')
-            save_email_report(email_report, email_file)
-        
-        # Print samenvatting
-        total_orders = len(grouped_data)
-        total_sendable = sum(order['sendable_count'] for order in grouped_data.values())
-        total_backorder = sum(order['backorder_count'] for order in grouped_data.values())
-        
-        logging.info("=== Analyse voltooid ===")
-        logging.info(f"Totaal orders: {total_orders}")
-        logging.info(f"Totaal verzendbare artikelen: {total_sendable}")
-        logging.info(f"Totaal backorder artikelen: {total_backorder}")
-        logging.info(f"Output bestand: {OUTPUT_FILE}")
-        
-        if email_report:
-            logging.info(f"E-mails om te verzenden: {len(email_report)}")
-            logging.info(f"E-mail rapport: {email_file}")
-        
-        # Categorie statistieken
-        category_counts = {}
-        for order_info in grouped_data.values():
-            for _, item in order_info['backorder'].iterrows():
-                category = item['Category']
-                if category not in category_counts:
-                    category_counts[category] = 0
-                category_counts[category] += 1
-        
-        logging.info("Backorder categorieën:")
-        for cat_num, count in category_counts.items():
-            if count > 0:
-                if cat_num is None:
-                    logging.info(f"  - Geen categorie: {count} artikelen")
-                elif category_manager:
-                    cat_name = category_manager.get_category_name(cat_num)
-                    logging.info(f"  - {cat_name}: {count} artikelen")
-                else:
-                    logging.info(f"  - Categorie {cat_num}: {count} artikelen")
+        stats = run_streaming_analysis(
+            file_to_use,
+            output_file or f"Output/Backorder_Analyse_v{timestamp}.xlsx",
+            email_file or OUTPUT_FILE.replace('.xlsx', '_Emails.xlsx'),
+            batch_size=STREAMING_BATCH_ROWS,
+            memory_budget_mb=STREAMING_MEMORY_BUDGET_MB,
+            email_mode=email_mode,
+            use_ledger=use_ledger
+        )
+        if send_emails and stats['email_file']:
+            # E-mails zijn al weggeschreven; verzend vanuit het rapport
+            send_email_report(pd.read_excel(stats['email_file'], dtype=str))
+        return stats
+    
+    try:
+        from analysis_api import AnalysisSettings, Analyzer
+        settings = AnalysisSettings(input_file=file_to_use, use_cache=use_cache, engine=engine,
+                                    email_mode=email_mode or EMAIL_MODE, use_ledger=use_ledger,
+                                    send_emails=send_emails, incremental=incremental, state_name=state_name)
+        return Analyzer(settings).run(output_file=output_file, email_file=email_file).stats
         
     except Exception as e:
         import traceback
@@ -697,4 +880,49 @@ def main(input_file=None):
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Navision Backorder Analyzer")
+    parser.add_argument("input_file", nargs="?",
+                        help="Navision export, of een map / glob patroon voor een batch analyse "
+                             "(standaard: INPUT_FILE uit config.py)")
+    parser.add_argument("--workers", type=int,
+                        help="Aantal processen voor een batch analyse (standaard: BATCH_WORKERS of aantal kernen)")
+    parser.add_argument("--no-cache", action="store_true", help="Export opnieuw inlezen zonder cache")
+    parser.add_argument("--clear-cache", action="store_true", help="Wis de export cache voor de analyse")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Verwerk de export in batches met begrensd geheugengebruik (voor zeer grote exports)")
+    parser.add_argument("--email-mode", choices=["per_item", "digest"],
+                        help="Eén e-mail per artikel of één digest per dealer (standaard: EMAIL_MODE uit config.py)")
+    parser.add_argument("--send-emails", action="store_true",
+                        help="Verzend de e-mails via SMTP (EMAIL_OUTBOX_SETTINGS uit config.py)")
+    parser.add_argument("--all-emails", action="store_true",
+                        help="Maak ook e-mails voor notificaties die eerder al gemaakt zijn (negeer de ledger)")
+    parser.add_argument("--clear-ledger", action="store_true",
+                        help="Wis de notification ledger voor de analyse")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Alleen nieuwe of gewijzigde orders opnieuw categoriseren en e-mailen (t.o.v. de vorige run)")
+    parser.add_argument("--engine", choices=ENGINES,
+                        help="Engine voor inlezen, filteren en groeperen (standaard: ANALYSIS_ENGINE uit config.py)")
+    args = parser.parse_args()
+    
+    if args.clear_cache:
+        get_export_cache().clear()
+    if args.clear_ledger and NOTIFICATION_LEDGER_ENABLED:
+        ledger = get_notification_ledger()
+        ledger.clear()
+        ledger.close()
+    
+    if args.input_file and (os.path.isdir(args.input_file) or any(char in args.input_file for char in '*?[')):
+        # Meerdere exports: parallel analyseren met één samenvatting
+        from batch_analysis import run_batch
+        if args.send_emails:
+            logging.warning("--send-emails wordt bij een batch analyse niet ondersteund; e-mails niet verzonden")
+        batch = run_batch(args.input_file, workers=args.workers, use_cache=not args.no_cache,
+                          streaming=args.streaming, email_mode=args.email_mode,
+                          use_ledger=not args.all_emails, incremental=args.incremental, engine=args.engine)
+        raise SystemExit(1 if batch['failed'] else 0)
+    
+    main(input_file=args.input_file, use_cache=not args.no_cache, streaming=args.streaming,
+         email_mode=args.email_mode, send_emails=args.send_emails, use_ledger=not args.all_emails,
+         incremental=args.incremental, engine=args.engine)
\ No newline at end of file
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Batch Analyse
+=============
+
+Analyseer alle Navision exports in een map (of volgens een glob patroon)
+parallel met een process pool. Elke export krijgt zijn eigen analyse
+werkboek en e-mail rapport; daarnaast komt er één samenvattend werkboek.
+Een fout in één export stopt de andere niet.
+
+Gebruik:
+    python batch_analysis.py exports/
+    python batch_analysis.py "exports/*_DSV.xlsx" --workers 4
+"""
+
+import glob
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+# Bestanden die als export herkend worden bij een map
+EXPORT_PATTERNS = ['*.xlsx', '*.xlsm', '*.xls']
+
+# Kolommen van het samenvattende werkboek
+SUMMARY_COLUMNS = [
+    'Bestand', 'Status', 'Regels', 'Na filtering', 'Orders', 'Verzendbaar', 'Backorder',
+    'E-mails', 'Wijzigingen', 'Categorie 1', 'Categorie 2', 'Categorie 3', 'Categorie 4', 'Geen categorie',
+    'Seconden', 'Analyse bestand', 'E-mail bestand', 'Fout'
+]
+
+
+def find_exports(source):
+    """Exports in een map, of de bestanden die bij een glob patroon horen."""
+    if os.path.isdir(source):
+        files = []
+        for pattern in EXPORT_PATTERNS:
+            files.extend(glob.glob(os.path.join(source, pattern)))
+    else:
+        files = glob.glob(source)
+    # Tijdelijke Excel lock bestanden (~$...) overslaan
+    return sorted(path for path in set(files)
+                  if os.path.isfile(path) and not os.path.basename(path).startswith('~$'))
+
+
+def output_paths(files, output_dir):
+    """Analyse en e-mail bestand per export; dubbele bestandsnamen krijgen een volgnummer."""
+    paths = {}
+    used = set()
+    for file_path in files:
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        name, counter = stem, 2
+        while name in used:
+            name = f"{stem}_{counter}"
+            counter += 1
+        used.add(name)
+        paths[file_path] = (os.path.join(output_dir, f"{name}_Analyse.xlsx"),
+                            os.path.join(output_dir, f"{name}_Emails.xlsx"))
+    return paths
+
+
+def analyze_file(file_path, output_file, email_file, options):
+    """Analyseer één export (in een worker proces); fouten worden als resultaat teruggegeven."""
+    start = time.perf_counter()
+    try:
+        import backorder_analyzer
+        # Elke export heeft zijn eigen staat van de vorige run (default_state_name)
+        stats = backorder_analyzer.main(input_file=file_path, output_file=output_file,
+                                        email_file=email_file, **options)
+        return {'file': file_path, 'status': 'ok', 'stats': stats,
+                'seconds': time.perf_counter() - start}
+    except Exception as e:
+        return {'file': file_path, 'status': 'fout', 'error': f"{type(e).__name__}: {e}",
+                'traceback': traceback.format_exc(), 'seconds': time.perf_counter() - start}
+
+
+def summary_row(result):
+    """Eén regel van het samenvattende werkboek."""
+    stats = result.get('stats') or {}
+    categories = stats.get('category_counts', {})
+    return {
+        'Bestand': os.path.basename(result['file']),
+        'Status': result['status'],
+        'Regels': stats.get('rows_read'),
+        'Na filtering': stats.get('rows_after_filter'),
+        'Orders': stats.get('orders'),
+        'Verzendbaar': stats.get('sendable'),
+        'Backorder': stats.get('backorder'),
+        'E-mails': stats.get('emails'),
+        'Wijzigingen': sum(stats['changes'].values()) if stats.get('changes') is not None else None,
+        'Categorie 1': categories.get(1, 0) if stats else None,
+        'Categorie 2': categories.get(2, 0) if stats else None,
+        'Categorie 3': categories.get(3, 0) if stats else None,
+        'Categorie 4': categories.get(4, 0) if stats else None,
+        'Geen categorie': categories.get(None, 0) if stats else None,
+        'Seconden': round(result['seconds'], 2),
+        'Analyse bestand': stats.get('output_file'),
+        'E-mail bestand': stats.get('email_file'),
+        'Fout': result.get('error')
+    }
+
+
+def write_summary(results, file_path, engine="auto"):
+    """Schrijf het samenvattende werkboek: één regel per export plus een totaal."""
+    from excel_writer import resolve_writer_engine
+
+    summary = pd.DataFrame([summary_row(result) for result in results], columns=SUMMARY_COLUMNS)
+    totals = summary[[column for column in SUMMARY_COLUMNS[2:15]]].sum(numeric_only=True, min_count=1)
+    total_row = {'Bestand': 'Totaal',
+                 'Status': f"{(summary['Status'] == 'ok').sum()} van {len(summary)} ok", **totals.to_dict()}
+    summary = pd.concat([summary, pd.DataFrame([total_row], columns=SUMMARY_COLUMNS)], ignore_index=True)
+
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with pd.ExcelWriter(file_path, engine=resolve_writer_engine(engine)) as writer:
+        summary.to_excel(writer, sheet_name='Samenvatting', index=False)
+    logging.info(f"Samenvatting opgeslagen: {file_path}")
+    return file_path
+
+
+def run_batch(source, output_dir=None, workers=None, **options):
+    """
+    Analyseer alle exports in source (map of glob patroon) parallel.
+
+    options worden doorgegeven aan backorder_analyzer.main (use_cache,
+    streaming, email_mode, use_ledger, incremental, engine). Geeft een dict met de resultaten per
+    export, het samenvattende werkboek en de tijden terug.
+    """
+    import backorder_analyzer
+
+    output_dir = output_dir or backorder_analyzer.BATCH_OUTPUT_DIR
+    files = find_exports(source)
+    if not files:
+        raise FileNotFoundError(f"Geen exports gevonden in {source}")
+
+    workers = workers or backorder_analyzer.BATCH_WORKERS or os.cpu_count() or 1
+    workers = max(1, min(workers, len(files)))
+    paths = output_paths(files, output_dir)
+    logging.info(f"Batch analyse gestart: {len(files)} exports, {workers} processen")
+
+    start = time.perf_counter()
+    results = {}
+    # spawn: workers beginnen schoon (geen gedeelde SQLite verbindingen) en werkt ook op Windows
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(analyze_file, file_path, *paths[file_path], options): file_path
+                   for file_path in files}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker proces zelf is uitgevallen
+                result = {'file': file_path, 'status': 'fout', 'error': f"{type(e).__name__}: {e}",
+                          'seconds': 0.0}
+            results[file_path] = result
+            if result['status'] == 'ok':
+                logging.info(f"✅ {os.path.basename(file_path)}: {result['stats']['orders']} orders "
+                             f"in {result['seconds']:.1f}s")
+            else:
+                logging.error(f"❌ {os.path.basename(file_path)}: {result['error']}")
+    wall_seconds = time.perf_counter() - start
+
+    ordered = [results[file_path] for file_path in files]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_file = write_summary(ordered, os.path.join(output_dir, f"Batch_Samenvatting_v{timestamp}.xlsx"),
+                                 backorder_analyzer.EXCEL_WRITER_ENGINE)
+
+    file_seconds = sum(result['seconds'] for result in ordered)
+    failed = sum(1 for result in ordered if result['status'] != 'ok')
+    logging.info("=== Batch analyse voltooid ===")
+    logging.info(f"Exports: {len(files)} ({failed} met fouten)")
+    logging.info(f"Doorlooptijd: {wall_seconds:.1f}s, som per export: {file_seconds:.1f}s "
+                 f"(x{file_seconds / wall_seconds if wall_seconds else 0:.1f} door {workers} processen)")
+
+    return {
+        'results': ordered,
+        'summary_file': summary_file,
+        'wall_seconds': wall_seconds,
+        'file_seconds': file_seconds,
+        'workers': workers,
+        'failed': failed
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Batch analyse van Navision exports")
+    parser.add_argument("source", help="Map met exports of een glob patroon")
+    parser.add_argument("--output-dir", help="Output map (standaard: BATCH_OUTPUT_DIR uit config.py)")
+    parser.add_argument("--workers", type=int, help="Aantal processen (standaard: BATCH_WORKERS of aantal kernen)")
+    parser.add_argument("--no-cache", action="store_true", help="Exports opnieuw inlezen zonder cache")
+    parser.add_argument("--streaming", action="store_true", help="Verwerk elke export in streaming modus")
+    parser.add_argument("--email-mode", choices=["per_item", "digest"])
+    parser.add_argument("--all-emails", action="store_true",
+                        help="Maak ook e-mails voor notificaties die eerder al gemaakt zijn")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Per export alleen nieuwe of gewijzigde orders opnieuw berekenen")
+    parser.add_argument("--engine", choices=["pandas", "polars"],
+                        help="Engine voor inlezen, filteren en groeperen (standaard: ANALYSIS_ENGINE uit config.py)")
+    args = parser.parse_args()
+
+    batch = run_batch(args.source, output_dir=args.output_dir, workers=args.workers,
+                      use_cache=not args.no_cache, streaming=args.streaming,
+                      email_mode=args.email_mode, use_ledger=not args.all_emails,
+                      incremental=args.incremental, engine=args.engine)
+    raise SystemExit(1 if batch['failed'] else 0)
@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+Category Catalog
+================
+
+Opslag backends voor de CategoryManager.
+
+- SQLiteCategoryStore: geïndexeerde SQLite catalogus. Opzoeken van een
+  artikel en losse wijzigingen (artikel toevoegen/verwijderen, link of
+  alternatief instellen) zijn één query op een primaire sleutel, zonder het
+  hele bestand te herschrijven.
+- JsonCategoryStore: de oorspronkelijke opslag in category_config.json en
+  item_links.json, die bij elke wijziging volledig herschreven worden.
+
+Beide backends kunnen de gegevens in het JSON formaat importeren en
+exporteren, zodat category_config.json en item_links.json uitwisselbaar
+blijven.
+
+Wijzigingen kunnen gebundeld worden in een batch (één transactie, één keer
+wegschrijven). JSON bestanden worden atomisch geschreven (tijdelijk bestand +
+rename) onder een lock bestand, zodat de analyzer en de GUI dezelfde bestanden
+veilig kunnen delen.
+"""
+
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS category_items (
+    item_no TEXT NOT NULL,
+    category_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (item_no, category_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS category_items_by_category ON category_items (category_key, position);
+CREATE TABLE IF NOT EXISTS item_links (
+    item_no TEXT NOT NULL,
+    link_type TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (item_no, link_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS alternative_products (
+    category_key TEXT NOT NULL,
+    item_no TEXT NOT NULL,
+    alternative TEXT NOT NULL,
+    PRIMARY KEY (category_key, item_no)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Velden van een categorie die in eigen tabellen staan in plaats van in de metadata
+LIST_FIELDS = ('items', 'alternative_products')
+
+
+class FileLock:
+    """Lock via een lock bestand naast het gedeelde bestand (werkt op Windows en Linux)."""
+
+    def __init__(self, path, timeout=10.0, stale_seconds=60.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale_seconds = stale_seconds
+
+    def acquire(self):
+        start = time.monotonic()
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    age = time.time() - os.path.getmtime(self.path)
+                except OSError:
+                    continue  # Lock is net vrijgegeven
+                if age > self.stale_seconds:
+                    # Achtergebleven lock van een afgebroken proces
+                    logging.warning(f"Verouderde lock {self.path} ({age:.0f}s) wordt verwijderd")
+                    self._remove()
+                    continue
+                if time.monotonic() - start > self.timeout:
+                    raise TimeoutError(f"Kon lock {self.path} niet krijgen binnen {self.timeout:.0f}s")
+                time.sleep(0.05)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def release(self):
+        self._remove()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class CorruptJsonError(ValueError):
+    """Een JSON bestand is onleesbaar en is apart gezet (corrupt_path)."""
+
+    def __init__(self, file_path, corrupt_path, error):
+        super().__init__(f"{file_path} is onleesbaar ({error}); bewaard als {corrupt_path}")
+        self.file_path = file_path
+        self.corrupt_path = corrupt_path
+
+
+def read_json(file_path):
+    """
+    Lees een JSON bestand (None als het niet bestaat).
+
+    Een onleesbaar (bijvoorbeeld afgebroken) bestand wordt apart gezet en
+    geeft CorruptJsonError, zodat de aanroeper zelf kiest tussen standaard-
+    waarden en de gegevens die hij al heeft.
+    """
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError as e:
+        corrupt_path = f"{file_path}.corrupt-{time.strftime('%Y%m%d_%H%M%S')}"
+        os.replace(file_path, corrupt_path)
+        error = CorruptJsonError(file_path, corrupt_path, e)
+        logging.error(str(error))
+        raise error from e
+
+
+def read_json_or(file_path, default):
+    """Lees een JSON bestand; default als het niet bestaat of onleesbaar is."""
+    try:
+        data = read_json(file_path)
+    except CorruptJsonError:
+        return default
+    return default if data is None else data
+
+
+def write_json(file_path, data):
+    """Schrijf een JSON bestand (indent=2) atomisch via een tijdelijk bestand."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def file_signature(file_path):
+    """Wijzigingstijd en grootte van een bestand (None als het niet bestaat)."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class JsonCategoryStore:
+    """
+    Categorieën en links in JSON bestanden.
+
+    Elke wijziging is een operatie die direct in het geheugen wordt toegepast
+    en bij commit weggeschreven. Is een bestand intussen door een ander proces
+    gewijzigd, dan wordt het opnieuw ingelezen en worden de operaties van deze
+    commit opnieuw toegepast, zodat wijzigingen van beide kanten behouden blijven.
+    """
+
+    def __init__(self, config_file, links_file, categories, item_links):
+        self.config_file = config_file
+        self.links_file = links_file
+        self.lock = FileLock(f"{config_file}.lock")
+        self.categories = categories
+        self.item_links = item_links
+        self._signatures = self._current_signatures()
+        self._pending = None  # Operaties van de lopende batch
+        self.rebuild_item_index()
+
+    def _current_signatures(self):
+        return (file_signature(self.config_file), file_signature(self.links_file))
+
+    def rebuild_item_index(self):
+        """Bouw de index van artikelnummer naar categorie sleutel opnieuw op."""
+        self._item_index = {}
+        # Artikelen per categorie als set, voor snelle controle op dubbele toewijzing
+        self._members = {}
+        for category_key, category_data in self.categories.items():
+            self._members[category_key] = set(category_data.get("items", []))
+            for item in category_data.get("items", []):
+                # Bij dubbele toewijzing wint de eerste categorie (zoals de oude lineaire zoektocht)
+                self._item_index.setdefault(str(item), category_key)
+
+    def _reindex_item(self, item_no):
+        """Werk de index bij voor één artikel na een wijziging."""
+        item_str = str(item_no)
+        self._item_index.pop(item_str, None)
+        for category_key in self.categories:
+            if item_str in self._members[category_key]:
+                self._item_index[item_str] = category_key
+                return
+
+    def _apply(self, operation):
+        """Pas één operatie toe in het geheugen; geeft False als er niets veranderde."""
+        kind, args = operation[0], operation[1:]
+        if kind == 'add':
+            item_no, category_key = args
+            if category_key not in self.categories or item_no in self._members[category_key]:
+                return False
+            self.categories[category_key]["items"].append(item_no)
+            self._members[category_key].add(item_no)
+            current_key = self._item_index.get(str(item_no))
+            if current_key is None:
+                self._item_index[str(item_no)] = category_key
+            elif current_key != category_key:
+                # Artikel staat in meerdere categorieën: volgorde van categorieën bepaalt
+                self._reindex_item(item_no)
+        elif kind == 'remove':
+            item_no, category_key = args
+            if category_key not in self.categories or item_no not in self._members[category_key]:
+                return False
+            self.categories[category_key]["items"].remove(item_no)
+            self._members[category_key].discard(item_no)
+            if self._item_index.get(str(item_no)) == category_key:
+                self._reindex_item(item_no)
+        elif kind == 'link':
+            item_no, link_type, url = args
+            self.item_links.setdefault(str(item_no), {})[link_type] = url
+        elif kind == 'alternative':
+            category_key, item_no, alternative_product = args
+            if category_key not in self.categories:
+                return False
+            self.categories[category_key].setdefault("alternative_products", {})[str(item_no)] = alternative_product
+        elif kind == 'update':
+            category_key, fields = args
+            if category_key not in self.categories:
+                return False
+            self.categories[category_key].update(fields)
+        return True
+
+    def _execute(self, operation):
+        changed = self._apply(operation)
+        if changed:
+            if self._pending is not None:
+                self._pending.append(operation)
+            else:
+                self._commit([operation])
+        return changed
+
+    def _commit(self, operations):
+        """Schrijf de gewijzigde bestanden één keer weg, onder lock en atomisch."""
+        if not operations:
+            return
+        write_links = any(operation[0] == 'link' for operation in operations)
+        write_categories = any(operation[0] != 'link' for operation in operations)
+        with self.lock:
+            if self._current_signatures() != self._signatures:
+                # Een ander proces heeft geschreven: opnieuw inlezen en onze operaties opnieuw toepassen
+                logging.info("Categorie bestanden extern gewijzigd, wijzigingen worden samengevoegd")
+                self.categories = read_json_or(self.config_file, None) or self.categories
+                self.item_links = read_json_or(self.links_file, None) or self.item_links
+                self.rebuild_item_index()
+                for operation in operations:
+                    self._apply(operation)
+            if write_categories:
+                write_json(self.config_file, self.categories)
+            if write_links:
+                write_json(self.links_file, self.item_links)
+            self._signatures = self._current_signatures()
+
+    @contextmanager
+    def batch(self):
+        """Bundel wijzigingen: één keer wegschrijven, alles terugdraaien bij een fout."""
+        if self._pending is not None:
+            yield self  # Geneste batch hoort bij de buitenste
+            return
+        snapshot = (copy.deepcopy(self.categories), copy.deepcopy(self.item_links))
+        self._pending = []
+        try:
+            yield self
+        except BaseException:
+            self.categories, self.item_links = snapshot
+            self.rebuild_item_index()
+            raise
+        else:
+            self._commit(self._pending)
+        finally:
+            self._pending = None
+
+    def category_info(self):
+        return {key: {field: value for field, value in data.items() if field not in LIST_FIELDS}
+                for key, data in self.categories.items()}
+
+    def categories_dict(self):
+        return self.categories
+
+    def update_category(self, category_key, fields):
+        self._execute(('update', category_key, dict(fields)))
+
+    def items_in_category(self, category_key):
+        return self.categories[category_key]["items"]
+
+    def category_for_item(self, item_no):
+        return self._item_index.get(str(item_no))
+
+    def categories_for_items(self, item_numbers):
+        return {item: self._item_index[item] for item in map(str, item_numbers) if item in self._item_index}
+
+    def add_item(self, item_no, category_key):
+        return self._execute(('add', item_no, category_key))
+
+    def remove_item(self, item_no, category_key):
+        return self._execute(('remove', item_no, category_key))
+
+    def get_link(self, item_no, link_type):
+        return self.item_links.get(str(item_no), {}).get(link_type, "")
+
+    def set_link(self, item_no, link_type, url):
+        self._execute(('link', item_no, link_type, url))
+
+    def get_alternative(self, category_key, item_no):
+        return self.categories[category_key].get("alternative_products", {}).get(str(item_no), "")
+
+    def alternatives(self, category_key):
+        return dict(self.categories[category_key].get("alternative_products", {}))
+
+    def set_alternative(self, category_key, item_no, alternative_product):
+        self._execute(('alternative', category_key, item_no, alternative_product))
+
+    def import_json(self, categories, item_links):
+        self.categories = categories
+        self.item_links = item_links
+        self.rebuild_item_index()
+        with self.lock:
+            write_json(self.config_file, self.categories)
+            write_json(self.links_file, self.item_links)
+            self._signatures = self._current_signatures()
+
+    def export_json(self):
+        return self.categories, self.item_links
+
+    def close(self):
+        pass
+
+    def after_fork(self):
+        """Niets te doen: JSON opslag heeft geen open verbindingen."""
+
+
+class SQLiteCategoryStore:
+    """Categorieën, artikelen, links en alternatieven in een geïndexeerde SQLite catalogus."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Eén verbinding per thread: SQLite verbindingen kunnen niet tussen threads gedeeld worden.
+        # Een lopende batch hoort bij de verbinding en staat daarom ook in _local.
+        self._local = threading.local()
+        self._connections = []
+        self.connection.executescript(SCHEMA)
+        self._load_category_info()
+
+    @property
+    def connection(self):
+        """Verbinding van de huidige thread (met een eigen tijdelijke lookup tabel)."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # check_same_thread uit zodat close() alle verbindingen kan sluiten
+            connection = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (item_no TEXT PRIMARY KEY)")
+            self._local.connection = connection
+            self._connections.append(connection)
+        return connection
+
+    @property
+    def _in_batch(self):
+        """Of de huidige thread een batch open heeft."""
+        return getattr(self._local, 'in_batch', False)
+
+    @contextmanager
+    def _transaction(self):
+        """Losse wijziging: eigen transactie, of onderdeel van de lopende batch van deze thread."""
+        if self._in_batch:
+            yield self.connection
+        else:
+            with self.connection:
+                yield self.connection
+
+    @contextmanager
+    def batch(self):
+        """Bundel wijzigingen in één SQLite transactie (alles of niets)."""
+        if self._in_batch:
+            yield self  # Geneste batch hoort bij de buitenste
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        self._local.in_batch = True
+        try:
+            yield self
+        except BaseException:
+            self.connection.rollback()
+            self._load_category_info()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self._local.in_batch = False
+
+    def _load_category_info(self):
+        # Metadata van de categorieën is klein en wordt in het geheugen gehouden
+        self._info = {}
+        for key, data in self.connection.execute("SELECT key, data FROM categories ORDER BY position"):
+            self._info[key] = json.loads(data)
+
+    def reload_category_info(self):
+        """Lees de metadata opnieuw in (na wijzigingen door een ander proces)."""
+        self._load_category_info()
+
+    def is_empty(self):
+        return not self._info
+
+    def get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._transaction():
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _mark_edited(self):
+        """Markeer (binnen de lopende transactie) dat de catalogus afwijkt van de JSON bestanden."""
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('unexported_edits', '1')")
+
+    def has_unexported_edits(self):
+        """Gewijzigd sinds de laatste import of export van de JSON bestanden."""
+        return self.get_meta("unexported_edits") == "1"
+
+    def mark_synced(self, json_signature):
+        """Catalogus en JSON bestanden zijn gelijk (na import of export)."""
+        with self._transaction():
+            self.connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                        [("json_signature", json_signature), ("unexported_edits", "0")])
+
+    def category_info(self):
+        return {key: dict(data) for key, data in self._info.items()}
+
+    def categories_dict(self):
+        """Alle categorieën in het JSON formaat (inclusief artikelen en alternatieven)."""
+        return self.export_json()[0]
+
+    def update_category(self, category_key, fields):
+        self._info[category_key].update(fields)
+        with self._transaction():
+            self.connection.execute("UPDATE categories SET data = ? WHERE key = ?",
+                                    (json.dumps(self._info[category_key], ensure_ascii=False), category_key))
+            self._mark_edited()
+
+    def items_in_category(self, category_key):
+        return [row[0] for row in self.connection.execute(
+            "SELECT item_no FROM category_items WHERE category_key = ? ORDER BY position", (category_key,))]
+
+    def category_for_item(self, item_no):
+        # Bij dubbele toewijzing wint de eerste categorie
+        row = self.connection.execute(
+            "SELECT ci.category_key FROM category_items ci JOIN categories c ON c.key = ci.category_key "
+            "WHERE ci.item_no = ? ORDER BY c.position LIMIT 1", (str(item_no),)).fetchone()
+        return row[0] if row else None
+
+    def categories_for_items(self, item_numbers):
+        """Categorie sleutel per artikel voor een hele reeks artikelen in één query."""
+        with self._transaction():
+            self.connection.execute("DELETE FROM lookup")
+            self.connection.executemany("INSERT OR IGNORE INTO lookup VALUES (?)",
+                                        ((str(item),) for item in item_numbers))
+            rows = self.connection.execute(
+                "SELECT ci.item_no, ci.category_key FROM lookup l "
+                "JOIN category_items ci ON ci.item_no = l.item_no "
+                "JOIN categories c ON c.key = ci.category_key ORDER BY c.position DESC").fetchall()
+            self.connection.execute("DELETE FROM lookup")
+        # Laatste toewijzing per artikel overschrijft: de eerste categorie wint
+        return dict(rows)
+
+    def add_item(self, item_no, category_key):
+        with self._transaction():
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO category_items VALUES (?, ?, "
+                "(SELECT COALESCE(MAX(position), -1) + 1 FROM category_items WHERE category_key = ?))",
+                (str(item_no), category_key, category_key))
+            if cursor.rowcount > 0:
+                self._mark_edited()
+        return cursor.rowcount > 0
+
+    def remove_item(self, item_no, category_key):
+        with self._transaction():
+            cursor = self.connection.execute(
+                "DELETE FROM category_items WHERE item_no = ? AND category_key = ?", (str(item_no), category_key))
+            if cursor.rowcount > 0:
+                self._mark_edited()
+        return cursor.rowcount > 0
+
+    def get_link(self, item_no, link_type):
+        row = self.connection.execute(
+            "SELECT url FROM item_links WHERE item_no = ? AND link_type = ?", (str(item_no), link_type)).fetchone()
+        return row[0] if row else ""
+
+    def set_link(self, item_no, link_type, url):
+        with self._transaction():
+            self.connection.execute("INSERT OR REPLACE INTO item_links VALUES (?, ?, ?)",
+                                    (str(item_no), link_type, url))
+            self._mark_edited()
+
+    def get_alternative(self, category_key, item_no):
+        row = self.connection.execute(
+            "SELECT alternative FROM alternative_products WHERE category_key = ? AND item_no = ?",
+            (category_key, str(item_no))).fetchone()
+        return row[0] if row else ""
+
+    def alternatives(self, category_key):
+        """Alle alternatieven van een categorie (artikel -> alternatief)."""
+        return dict(self.connection.execute(
+            "SELECT item_no, alternative FROM alternative_products WHERE category_key = ?", (category_key,)))
+
+    def set_alternative(self, category_key, item_no, alternative_product):
+        with self._transaction():
+            self.connection.execute("INSERT OR REPLACE INTO alternative_products VALUES (?, ?, ?)",
+                                    (category_key, str(item_no), alternative_product))
+            self._mark_edited()
+
+    def import_json(self, categories, item_links):
+        """Vervang de volledige catalogus door gegevens in het JSON formaat."""
+        with self._transaction():
+            for table in ('categories', 'category_items', 'item_links', 'alternative_products'):
+                self.connection.execute(f"DELETE FROM {table}")
+            for position, (key, data) in enumerate(categories.items()):
+                info = {field: value for field, value in data.items() if field not in LIST_FIELDS}
+                self.connection.execute("INSERT INTO categories VALUES (?, ?, ?)",
+                                        (key, position, json.dumps(info, ensure_ascii=False)))
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO category_items VALUES (?, ?, ?)",
+                    ((str(item), key, item_position) for item_position, item in enumerate(data.get("items", []))))
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO alternative_products VALUES (?, ?, ?)",
+                    ((key, str(item), alternative)
+                     for item, alternative in data.get("alternative_products", {}).items()))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO item_links VALUES (?, ?, ?)",
+                ((str(item), link_type, url)
+                 for item, links in item_links.items() for link_type, url in links.items()))
+        self._load_category_info()
+
+    def export_json(self):
+        """Geef (categorieën, links) terug in het formaat van category_config.json en item_links.json."""
+        categories = {}
+        for key, info in self._info.items():
+            categories[key] = dict(info)
+            categories[key]["items"] = self.items_in_category(key)
+            alternatives = dict(self.connection.execute(
+                "SELECT item_no, alternative FROM alternative_products WHERE category_key = ?", (key,)))
+            if alternatives:
+                categories[key]["alternative_products"] = alternatives
+        item_links = {}
+        for item_no, link_type, url in self.connection.execute("SELECT item_no, link_type, url FROM item_links"):
+            item_links.setdefault(item_no, {})[link_type] = url
+        return categories, item_links
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self._local = threading.local()
+
+    def after_fork(self):
+        """
+        In een geforkt kindproces: verbindingen van de ouder niet gebruiken (en
+        niet sluiten); het kind opent bij het eerste gebruik een eigen verbinding.
+        """
+        self._connections = []
+        self._local = threading.local()
@@ -6,26 +6,184 @@ Category Manager
 Beheer de backorder categorieën dynamisch.
 """
 
+import hashlib
 import json
+import logging
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+
+from category_catalog import (CorruptJsonError, FileLock, JsonCategoryStore, SQLiteCategoryStore, file_signature,
+                              read_json, read_json_or, write_json)
+from category_rules import DEFAULT_RULES, RuleEngine
+
+# Opslag backend: "sqlite" (geïndexeerde catalogus) of "json" (alleen de JSON bestanden)
+try:
+    from config import CATEGORY_STORAGE, CATEGORY_CATALOG_FILE, CATEGORY_RULES_FILE
+except ImportError:
+    CATEGORY_STORAGE = "sqlite"
+    CATEGORY_CATALOG_FILE = "category_catalog.sqlite"
+    CATEGORY_RULES_FILE = "category_rules.json"
+
 class CategoryManager:
-    def __init__(self, config_file="category_config.json"):
+    def __init__(self, config_file="category_config.json", links_file="item_links.json",
+                 storage=None, catalog_file=None, rules_file=None):
         self.config_file = config_file
-        self.categories = self.load_categories()
-        self.item_links = self.load_item_links()
+        self.links_file = links_file
+        self.rules_file = rules_file or CATEGORY_RULES_FILE
+        self.storage = storage or CATEGORY_STORAGE
+        if self.storage == "sqlite":
+            self.store = SQLiteCategoryStore(catalog_file or CATEGORY_CATALOG_FILE)
+            self.sync_from_json()
+        elif self.storage == "json":
+            self.store = JsonCategoryStore(config_file, links_file, self.load_categories(), self.load_item_links())
+        else:
+            raise ValueError(f"Onbekende opslag voor categorieën: {self.storage} (kies uit ['sqlite', 'json'])")
+        self._category_info = self.store.category_info()
+        self.rules = self.load_rules()
+        self.rule_engine = RuleEngine(self.rules)
+    
+    @property
+    def categories(self):
+        """Alle categorieën in het formaat van category_config.json."""
+        return self.store.categories_dict()
+    
+    @property
+    def item_links(self):
+        """Alle links in het formaat van item_links.json."""
+        return self.store.export_json()[1]
+    
+    def _json_signature(self):
+        """Wijzigingstijd en grootte van de JSON bestanden."""
+        signature = []
+        for path in (self.config_file, self.links_file):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                signature.append([stat.st_mtime_ns, stat.st_size])
+            else:
+                signature.append(None)
+        return json.dumps(signature)
+    
+    def sync_from_json(self):
+        """
+        Importeer de JSON bestanden in de catalogus als die nieuw is, of als de
+        JSON bestanden sinds de laatste import/export buiten de catalogus om
+        gewijzigd zijn en de catalogus zelf niet gewijzigd is. Wijzigingen in de
+        catalogus worden nooit stil overschreven: dan is een expliciete
+        import_json() (of eerst export_json()) nodig.
+        """
+        signature = self._json_signature()
+        empty = self.store.is_empty()
+        if not empty:
+            synced = self.store.get_meta("json_signature")
+            if synced == signature:
+                return False
+            if self.store.has_unexported_edits():
+                logging.warning(f"{self.config_file} of {self.links_file} is gewijzigd, maar de catalogus "
+                                f"heeft wijzigingen die nog niet geëxporteerd zijn; JSON niet ingelezen. "
+                                f"Gebruik category_manager.py --export-json om de catalogus te bewaren "
+                                f"of --import-json om de JSON bestanden te laden")
+                return False
+            # Een bestand dat bij de vorige sync bestond en nu ontbreekt: niet leeg importeren
+            previous = json.loads(synced) if synced else [None, None]
+            missing = [path for path, before, now in zip((self.config_file, self.links_file),
+                                                           previous, json.loads(signature))
+                       if before is not None and now is None]
+            if missing:
+                logging.warning(f"{', '.join(missing)} ontbreekt; catalogus ongewijzigd. "
+                                f"Gebruik category_manager.py --export-json om de bestanden opnieuw te maken")
+                return False
+        try:
+            categories = read_json(self.config_file)
+            item_links = read_json(self.links_file)
+        except CorruptJsonError:
+            if not empty:
+                # Bestand is apart gezet; de catalogus blijft de bron (vorige signature blijft staan)
+                logging.error("Catalogus ongewijzigd; gebruik category_manager.py --export-json om de "
+                              "JSON bestanden opnieuw te maken uit de catalogus")
+                return False
+            categories, item_links = read_json_or(self.config_file, None), read_json_or(self.links_file, None)
+        self.store.import_json(categories if categories is not None else self.default_categories(),
+                               item_links if item_links is not None else self.default_item_links())
+        self.store.mark_synced(self._json_signature())
+        return True
+    
+    def import_json(self):
+        """Lees category_config.json en item_links.json opnieuw in (vervangt de huidige gegevens)."""
+        self.store.import_json(self.load_categories(), self.load_item_links())
+        if self.storage == "sqlite":
+            self.store.mark_synced(self._json_signature())
+        self._category_info = self.store.category_info()
+    
+    def export_json(self):
+        """Schrijf de huidige gegevens naar category_config.json en item_links.json."""
+        categories, item_links = self.store.export_json()
+        with FileLock(f"{self.config_file}.lock"):
+            write_json(self.config_file, categories)
+            write_json(self.links_file, item_links)
+        if self.storage == "sqlite":
+            self.store.mark_synced(self._json_signature())
+    
+    @contextmanager
+    def batch(self):
+        """
+        Bundel wijzigingen (artikelen, links, alternatieven, categorie info).
+        
+        Alle wijzigingen binnen het blok worden in één keer vastgelegd; bij een
+        fout wordt niets vastgelegd.
+        
+            with cm.batch():
+                for item in items:
+                    cm.add_item_to_category(item, "category_1")
+        """
+        try:
+            with self.store.batch():
+                yield self
+        finally:
+            self._category_info = self.store.category_info()
+    
+    def reload(self, changed=None):
+        """
+        Herlaad gewijzigde configuratie en bouw alleen de betrokken indexen opnieuw op.
+        
+        changed: gewijzigde bronnen ('config', 'links', 'rules', 'catalog'); None is alles.
+        """
+        changed = set(changed) if changed is not None else {"config", "links", "rules", "catalog"}
+        if "catalog" in changed:
+            self.store.reload_category_info()
+        if changed & {"config", "links"}:
+            if self.storage == "sqlite":
+                self.sync_from_json()
+            else:
+                self.store = JsonCategoryStore(self.config_file, self.links_file,
+                                               self.load_categories(), self.load_item_links())
+        if "rules" in changed:
+            self.reload_rules()
+        self._category_info = self.store.category_info()
+    
+    def source_files(self):
+        """Bestanden waaruit de configuratie komt, per bron."""
+        files = {"config": self.config_file, "links": self.links_file, "rules": self.rules_file}
+        if self.storage == "sqlite":
+            files["catalog"] = self.store.db_path
+        return files
+    
+    def close(self):
+        self.store.close()
     
     def load_categories(self):
         """Laad categorieën uit config bestand."""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                pass
-        
-        # Default categorieën (leeg - geen artikelen toegewezen)
+        categories = read_json_or(self.config_file, None)
+        if categories is not None:
+            return categories
+        return self.default_categories()
+    
+    def default_categories(self):
+        """Default categorieën (leeg - geen artikelen toegewezen)."""
         return {
             "category_1": {
                 "name": "Bestel bij fabrikant",
@@ -58,17 +216,27 @@ class CategoryManager:
             }
         }
     
+    def load_rules(self):
+        """Laad de categorie regels (prefix, bereik, regex) uit het regels bestand."""
+        rules = read_json_or(self.rules_file, None)
+        if rules is not None:
+            return rules.get("rules", [])
+        return [dict(rule) for rule in DEFAULT_RULES]
+    
+    def reload_rules(self):
+        """Lees het regels bestand opnieuw in en compileer de regels."""
+        self.rules = self.load_rules()
+        self.rule_engine = RuleEngine(self.rules)
+    
     def load_item_links(self):
         """Laad specifieke links per artikel."""
-        links_file = "item_links.json"
-        if os.path.exists(links_file):
-            try:
-                with open(links_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                pass
-        
-        # Default links voor test artikelen
+        item_links = read_json_or(self.links_file, None)
+        if item_links is not None:
+            return item_links
+        return self.default_item_links()
+    
+    def default_item_links(self):
+        """Default links voor test artikelen."""
         return {
             "10701": {
                 "fabrikant": "https://www.shimano.com/nl/products/cycling/",
@@ -102,48 +270,82 @@ class CategoryManager:
     
     def save_categories(self):
         """Sla categorieën op in config bestand."""
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(self.categories, f, indent=2, ensure_ascii=False)
+        write_json(self.config_file, self.categories)
     
     def save_item_links(self):
         """Sla specifieke links op in config bestand."""
-        with open("item_links.json", 'w', encoding='utf-8') as f:
-            json.dump(self.item_links, f, indent=2, ensure_ascii=False)
+        write_json(self.links_file, self.item_links)
     
     def add_item_to_category(self, item_no, category_key):
         """Voeg een item toe aan een categorie."""
-        if category_key in self.categories:
-            if item_no not in self.categories[category_key]["items"]:
-                self.categories[category_key]["items"].append(item_no)
-                self.save_categories()
-                return True
+        if category_key in self._category_info:
+            return self.store.add_item(item_no, category_key)
         return False
     
     def remove_item_from_category(self, item_no, category_key):
         """Verwijder een item uit een categorie."""
-        if category_key in self.categories:
-            if item_no in self.categories[category_key]["items"]:
-                self.categories[category_key]["items"].remove(item_no)
-                self.save_categories()
-                return True
+        if category_key in self._category_info:
+            return self.store.remove_item(item_no, category_key)
         return False
     
     def get_category_for_item(self, item_no):
         """Bepaal de categorie voor een item."""
-        # Converteer item_no naar string voor vergelijking
-        item_str = str(item_no)
-        for category_key, category_data in self.categories.items():
-            if item_str in category_data["items"]:
-                return int(category_key.split("_")[1])
-        return None  # Geen categorie als niet expliciet toegewezen
+        category_key = self.store.category_for_item(item_no)
+        if category_key is not None:
+            return int(category_key.split("_")[1])
+        # Geen expliciete toewijzing: algemene regels (zonder klant)
+        categories, _ = self.rule_engine.classify([item_no])
+        return categories[0]
+    
+    def categorize_items(self, item_numbers, customers=None):
+        """
+        Bepaal categorie, naam en actie voor een reeks artikelnummers in één keer.
+        
+        Expliciete artikellijsten gaan voor; overige artikelen worden met de
+        regels geclassificeerd (klantspecifieke regels alleen als customers,
+        per regel de klant, meegegeven is).
+        
+        Geeft een DataFrame met kolommen Category, Category_Name en Category_Action
+        terug, met dezelfde index als item_numbers (als dat een Series is).
+        """
+        items = item_numbers if isinstance(item_numbers, pd.Series) else pd.Series(item_numbers)
+        
+        # Zoek alleen de unieke artikelnummers op; code -1 (ontbrekend) wijst naar het laatste vak
+        codes, uniques = RuleEngine.factorize(items)
+        category_keys = self.store.categories_for_items(uniques)
+        explicit = np.empty(len(uniques) + 1, dtype=object)
+        for position, item in enumerate(uniques):
+            category_key = category_keys.get(item)
+            explicit[position] = int(category_key.split("_")[1]) if category_key else None
+        categories = explicit[codes]
+        
+        if self.rule_engine.category_rules:
+            open_mask = pd.isna(categories)
+            rule_categories, _ = self.rule_engine.classify_codes(codes, uniques, customers, open_mask)
+            categories[open_mask] = rule_categories[open_mask]
+        
+        # Naam en actie per categorie (een handvol waarden) in plaats van per regel
+        numbers = pd.Series(categories, index=items.index, dtype=object)
+        present = [category for category in pd.unique(numbers) if category is not None]
+        names = {category: self.get_category_name(category) for category in present}
+        actions = {category: self.get_category_action(category) for category in present}
+        return pd.DataFrame({
+            'Category': categories,
+            'Category_Name': numbers.map(names).fillna(self.get_category_name(None)).to_numpy(dtype=object),
+            'Category_Action': numbers.map(actions).fillna(self.get_category_action(None)).to_numpy(dtype=object)
+        }, index=items.index)
+    
+    def tag_items(self, tag, item_numbers, customers=None):
+        """Masker (bool Series) van artikelen waarop een regel met deze tag van toepassing is."""
+        return self.rule_engine.tag_mask(tag, item_numbers, customers)
     
     def get_category_name(self, category_number):
         """Krijg de naam van een categorie."""
         if category_number is None:
             return "Geen categorie"
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
-            return self.categories[category_key]["name"]
+        if category_key in self._category_info:
+            return self._category_info[category_key]["name"]
         return "Onbekend"
     
     def get_category_action(self, category_number):
@@ -151,77 +353,75 @@ class CategoryManager:
         if category_number is None:
             return "Behoud backorder"
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
-            return self.categories[category_key]["action"]
+        if category_key in self._category_info:
+            return self._category_info[category_key]["action"]
         return "Onbekend"
     
     def get_category_color(self, category_number):
         """Krijg de kleur van een categorie."""
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
-            return self.categories[category_key]["color"]
+        if category_key in self._category_info:
+            return self._category_info[category_key]["color"]
         return "FFFFFF"
     
     def get_item_link(self, item_no, link_type="fabrikant"):
         """Krijg de specifieke link voor een artikel."""
-        item_str = str(item_no)
-        if item_str in self.item_links:
-            return self.item_links[item_str].get(link_type, "")
-        return ""
+        return self.store.get_link(item_no, link_type)
     
     def set_item_link(self, item_no, link_type, url):
         """Stel een specifieke link in voor een artikel."""
-        item_str = str(item_no)
-        if item_str not in self.item_links:
-            self.item_links[item_str] = {}
-        self.item_links[item_str][link_type] = url
-        self.save_item_links()
+        self.store.set_link(item_no, link_type, url)
     
     def get_all_items_in_category(self, category_number):
         """Krijg alle items in een categorie."""
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
-            return self.categories[category_key]["items"]
+        if category_key in self._category_info:
+            return self.store.items_in_category(category_key)
         return []
     
     def get_alternative_product(self, category_number, item_no=None):
         """Haal het alternatieve product op voor categorie 4."""
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
+        if category_key in self._category_info:
             if item_no:
                 # Specifiek alternatief voor een item
-                alternative_products = self.categories[category_key].get("alternative_products", {})
-                return alternative_products.get(str(item_no), "")
+                return self.store.get_alternative(category_key, item_no)
             else:
                 # Algemeen alternatief voor de categorie (oude methode voor compatibiliteit)
-                return self.categories[category_key].get("alternative_product", "")
+                return self._category_info[category_key].get("alternative_product", "")
         return ""
     
+    def get_alternatives(self, category_number=4):
+        """Alle alternatieven van een categorie (artikel -> alternatief) in één keer."""
+        category_key = f"category_{category_number}"
+        if category_key not in self._category_info:
+            return {}
+        return {item: alternative for item, alternative in self.store.alternatives(category_key).items()
+                if alternative}
+    
     def set_alternative_product(self, category_number, item_no, alternative_product):
         """Stel een alternatief product in voor een specifiek item in categorie 4."""
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
-            if "alternative_products" not in self.categories[category_key]:
-                self.categories[category_key]["alternative_products"] = {}
-            
-            self.categories[category_key]["alternative_products"][str(item_no)] = alternative_product
-            self.save_categories()
+        if category_key in self._category_info:
+            self.store.set_alternative(category_key, item_no, alternative_product)
             return True
         return False
     
     def update_category_info(self, category_number, name=None, description=None, action=None, color=None):
         """Update categorie informatie."""
         category_key = f"category_{category_number}"
-        if category_key in self.categories:
+        if category_key in self._category_info:
+            fields = {}
             if name:
-                self.categories[category_key]["name"] = name
+                fields["name"] = name
             if description:
-                self.categories[category_key]["description"] = description
+                fields["description"] = description
             if action:
-                self.categories[category_key]["action"] = action
+                fields["action"] = action
             if color:
-                self.categories[category_key]["color"] = color
-            self.save_categories()
+                fields["color"] = color
+            self.store.update_category(category_key, fields)
+            self._category_info[category_key].update(fields)
             return True
         return False
     
@@ -248,6 +448,50 @@ class CategoryManager:
         
         return result
 
+class CategoryConfigProvider:
+    """
+    Gedeelde CategoryManager voor langlopende processen (zoals het dashboard).
+    
+    current() controleert wijzigingstijd en grootte van de configuratie
+    bestanden en herlaadt alleen wat sinds de vorige keer gewijzigd is, zodat
+    wijzigingen uit de GUI zonder herstart zichtbaar worden. version verandert
+    bij elke wijziging en kan gebruikt worden als sleutel voor caches van
+    analyseresultaten.
+    """
+    
+    def __init__(self, **manager_options):
+        self.manager_options = manager_options
+        self.manager = None
+        self.version = None
+        self.reloads = 0
+        self._signatures = None
+        self._lock = threading.Lock()
+    
+    def _current_signatures(self):
+        return {source: file_signature(path) for source, path in self.manager.source_files().items()}
+    
+    def current(self):
+        """De CategoryManager met de actuele configuratie."""
+        with self._lock:
+            if self.manager is None:
+                self.manager = CategoryManager(**self.manager_options)
+            else:
+                signatures = self._current_signatures()
+                changed = [source for source, signature in signatures.items()
+                           if signature != self._signatures.get(source)]
+                if not changed:
+                    return self.manager
+                self.manager.reload(changed)
+                self.reloads += 1
+                logging.info(f"Categorie configuratie gewijzigd ({', '.join(changed)}), opnieuw geladen")
+            
+            # Opnieuw meten: een import vanuit JSON schrijft zelf ook naar de catalogus
+            self._signatures = self._current_signatures()
+            self.version = hashlib.sha256(
+                json.dumps(sorted(self._signatures.items())).encode('utf-8')).hexdigest()[:12]
+            return self.manager
+
+
 def main():
     """Test de CategoryManager."""
     cm = CategoryManager()
@@ -277,4 +521,23 @@ def main():
     print(f"\n✅ Category Manager test voltooid!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Category Manager")
+    parser.add_argument("--import-json", action="store_true",
+                        help="Lees category_config.json en item_links.json opnieuw in de catalogus")
+    parser.add_argument("--export-json", action="store_true",
+                        help="Schrijf de catalogus naar category_config.json en item_links.json")
+    args = parser.parse_args()
+    
+    if args.import_json or args.export_json:
+        cm = CategoryManager()
+        if args.import_json:
+            cm.import_json()
+            print(f"✅ JSON bestanden ingelezen in {cm.storage} opslag")
+        if args.export_json:
+            cm.export_json()
+            print(f"✅ Catalogus geëxporteerd naar {cm.config_file} en {cm.links_file}")
+        cm.close()
+    else:
+        main() 
\ No newline at end of file
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Category Rules
+==============
+
+Declaratieve regels voor categorisering naast de expliciete artikellijsten.
+Een regel matcht op artikelnummer (prefix, numeriek bereik of regex),
+optioneel alleen voor bepaalde klanten, en kent een categorie of een tag toe.
+
+Voorbeeld category_rules.json:
+
+    {
+      "rules": [
+        {"name": "Fietsen en batterijen", "type": "prefix", "values": ["BA", "HP"],
+         "tag": "bike_battery"},
+        {"name": "Oude accu's", "type": "range", "min": 11000, "max": 11999,
+         "category": 3, "priority": 10},
+        {"name": "Olie", "type": "regex", "pattern": "^OIL-", "category": 1},
+        {"name": "Dealer D0001 via fabrikant", "type": "prefix", "values": ["11"],
+         "category": 1, "customers": ["D0001"], "priority": 10}
+      ]
+    }
+
+Regels worden één keer gecompileerd: prefixen per lengte in een hash tabel
+(een platte trie), regexen als gecompileerd patroon en bereiken als grenzen.
+Een export wordt daarna in één keer geclassificeerd met gevectoriseerde
+maskers over de unieke artikelnummers. Bij meerdere matches wint de hoogste
+prioriteit; bij gelijke prioriteit gaat een klantspecifieke regel voor en
+daarna de volgorde in het bestand.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Soorten regels
+RULE_TYPES = ['prefix', 'range', 'regex']
+
+# Standaard regels als er geen category_rules.json is
+DEFAULT_RULES = [
+    {
+        'name': 'Fietsen en batterijen',
+        'type': 'prefix',
+        'values': ['BA', 'HP'],
+        'tag': 'bike_battery'
+    }
+]
+
+# Tag voor fiets/batterij artikelen (blijven als normale backorder staan)
+BIKE_BATTERY_TAG = 'bike_battery'
+
+
+class CompiledRule:
+    def __init__(self, rule, order):
+        self.name = rule.get('name', f"Regel {order + 1}")
+        self.type = rule.get('type')
+        self.category = rule.get('category')
+        self.tag = rule.get('tag')
+        self.priority = rule.get('priority', 0)
+        self.customers = set(str(customer) for customer in rule.get('customers', []))
+        self.order = order
+
+        if self.type not in RULE_TYPES:
+            raise ValueError(f"{self.name}: onbekend type {self.type!r} (kies uit {RULE_TYPES})")
+        if self.category is None and self.tag is None:
+            raise ValueError(f"{self.name}: regel heeft geen 'category' of 'tag'")
+
+        if self.type == 'prefix':
+            # Platte trie: per prefixlengte een set met prefixen
+            self.prefixes = {}
+            for value in rule.get('values', []):
+                self.prefixes.setdefault(len(str(value)), set()).add(str(value))
+        elif self.type == 'range':
+            self.minimum = rule.get('min', -np.inf)
+            self.maximum = rule.get('max', np.inf)
+        else:
+            try:
+                self.pattern = re.compile(rule['pattern'])
+            except (KeyError, re.error) as e:
+                raise ValueError(f"{self.name}: ongeldig patroon ({e})")
+
+    @property
+    def sort_key(self):
+        # Hoogste prioriteit eerst, dan klantspecifiek, dan volgorde in het bestand
+        return (-self.priority, not self.customers, self.order)
+
+    def item_mask(self, items, numbers):
+        """Masker over de unieke artikelnummers (items: tekst, numbers: numeriek of NaN)."""
+        if self.type == 'prefix':
+            mask = np.zeros(len(items), dtype=bool)
+            for length, prefixes in self.prefixes.items():
+                mask |= items.str[:length].isin(prefixes).to_numpy()
+            return mask
+        if self.type == 'range':
+            return ((numbers >= self.minimum) & (numbers <= self.maximum)).to_numpy()
+        return items.str.contains(self.pattern, na=False).to_numpy()
+
+
+class RuleEngine:
+    """Gecompileerde set regels."""
+
+    def __init__(self, rules=None):
+        compiled = [CompiledRule(rule, order) for order, rule in enumerate(rules or [])]
+        self.rules = sorted(compiled, key=lambda rule: rule.sort_key)
+        self.category_rules = [rule for rule in self.rules if rule.category is not None]
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def tags(self):
+        return {rule.tag for rule in self.rules if rule.tag}
+
+    @staticmethod
+    def factorize(item_numbers):
+        """Codes en unieke artikelnummers (als tekst); code -1 is een ontbrekend artikelnummer."""
+        items = item_numbers if isinstance(item_numbers, pd.Series) else pd.Series(item_numbers)
+        return pd.factorize(items.astype(str))
+
+    def _line_masks(self, rules, codes, uniques, customers):
+        """Masker per regel over alle regels van de export (artikelmaskers per uniek artikel)."""
+        unique_items = pd.Series(uniques, dtype=object)
+        numbers = pd.to_numeric(unique_items, errors='coerce')
+        if customers is not None:
+            customers = np.asarray(customers, dtype=object).astype(str)
+        for rule in rules:
+            # Code -1 (ontbrekend artikelnummer) matcht nooit
+            item_mask = np.append(rule.item_mask(unique_items, numbers), False)
+            mask = item_mask[codes]
+            if rule.customers:
+                if customers is None:
+                    mask[:] = False
+                else:
+                    mask &= np.isin(customers, list(rule.customers))
+            yield rule, mask
+
+    def classify(self, item_numbers, customers=None):
+        """
+        Categorie volgens de regels voor elk artikel in item_numbers.
+
+        Geeft (categorieën, regelnamen) als object arrays terug, None waar geen
+        regel matcht.
+        """
+        codes, uniques = self.factorize(item_numbers)
+        return self.classify_codes(codes, uniques, customers)
+
+    def classify_codes(self, codes, uniques, customers=None, open_mask=None):
+        """
+        Als classify(), voor al gefactoriseerde artikelnummers.
+
+        open_mask: alleen deze posities classificeren (bijvoorbeeld artikelen
+        zonder expliciete categorie).
+        """
+        categories = np.full(len(codes), None, dtype=object)
+        names = np.full(len(codes), None, dtype=object)
+        open_mask = np.ones(len(codes), dtype=bool) if open_mask is None else open_mask.copy()
+        if not self.category_rules or not open_mask.any():
+            return categories, names
+
+        for rule, mask in self._line_masks(self.category_rules, codes, uniques, customers):
+            mask &= open_mask
+            categories[mask] = rule.category
+            names[mask] = rule.name
+            open_mask &= ~mask
+            if not open_mask.any():
+                break
+        return categories, names
+
+    def tag_mask(self, tag, item_numbers, customers=None):
+        """Masker (bool Series) van artikelen waarop een regel met deze tag van toepassing is."""
+        items = item_numbers if isinstance(item_numbers, pd.Series) else pd.Series(item_numbers)
+        codes, uniques = self.factorize(items)
+        mask = np.zeros(len(items), dtype=bool)
+        rules = [rule for rule in self.rules if rule.tag == tag]
+        for _, rule_mask in self._line_masks(rules, codes, uniques, customers):
+            mask |= rule_mask
+        return pd.Series(mask, index=items.index)
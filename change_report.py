@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Wijzigingen Rapport
+===================
+
+Vergelijkt de analyse met de vorige run: welke orders volledig verzendbaar
+geworden zijn, welke artikelen van verzendbaar naar backorder gingen (of
+andersom), welke categorieën, aantallen en regels veranderd zijn.
+
+Per run wordt een snapshot op (order, artikel) niveau bewaard. De
+vergelijking is een hash join (merge) van de twee snapshots, dus lineair in
+het aantal regels.
+"""
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# Kolommen van een snapshot (één rij per order en artikel)
+SNAPSHOT_COLUMNS = ['order', 'item', 'customer', 'quantity', 'status', 'category', 'category_name']
+
+# Statussen van een artikel binnen een order
+STATUS_SENDABLE = 'Verzendbaar'
+STATUS_BACKORDER = 'Backorder'
+
+# Soorten wijzigingen, in de volgorde waarin ze per order getoond worden
+CHANGE_TYPES = [
+    'Order volledig verzendbaar',
+    'Backorder → Verzendbaar',
+    'Verzendbaar → Backorder',
+    'Categorie gewijzigd',
+    'Aantal gewijzigd',
+    'Nieuw artikel',
+    'Artikel verdwenen'
+]
+
+# Opmaak in het werkblad: verbeteringen groen, verslechteringen rood
+CHANGE_STYLES = {
+    'Order volledig verzendbaar': 'improved',
+    'Backorder → Verzendbaar': 'improved',
+    'Verzendbaar → Backorder': 'worsened'
+}
+
+
+def build_snapshot(grouped_data):
+    """Snapshot van de analyse: één rij per (order, artikel) met status en categorie."""
+    frames, backorder_flags = [], []
+    for order_info in grouped_data.values():
+        for key in ('sendable', 'backorder'):
+            if len(order_info[key]) > 0:
+                frames.append(order_info[key])
+                backorder_flags.append(np.full(len(order_info[key]), key == 'backorder'))
+    if not frames:
+        return pd.DataFrame(columns=SNAPSHOT_COLUMNS)
+
+    lines = pd.concat(frames)
+    # Status volgt uit het deel van de order (met voorraad toewijzing kan een regel in beide staan)
+    backorder = np.concatenate(backorder_flags)
+    category = lines['Category'] if 'Category' in lines.columns else pd.Series(None, index=lines.index)
+    category_name = lines['Category_Name'] if 'Category_Name' in lines.columns else category
+    snapshot = pd.DataFrame({
+        'order': lines['Sales Order No.'].astype(str).to_numpy(),
+        'item': lines['Item No.'].astype(str).to_numpy(),
+        'customer': lines['Customer Name'].astype(str).to_numpy(),
+        'quantity': lines['Quantity'].astype('float64').to_numpy(),
+        'backorder': backorder,
+        # Categorie alleen voor backorder regels; verzendbare regels hebben er geen
+        'category': category.astype(object).where(backorder, None).to_numpy(),
+        'category_name': category_name.astype(object).where(backorder, None).to_numpy()
+    })
+
+    # Meerdere regels van hetzelfde artikel in één order samenvoegen
+    grouped = snapshot.groupby(['order', 'item'], sort=False).agg(
+        customer=('customer', 'first'),
+        quantity=('quantity', 'sum'),
+        backorder=('backorder', 'any'),
+        category=('category', 'first'),
+        category_name=('category_name', 'first')
+    ).reset_index()
+    grouped['status'] = np.where(grouped['backorder'], STATUS_BACKORDER, STATUS_SENDABLE)
+    return grouped[SNAPSHOT_COLUMNS]
+
+
+def _change_rows(frame, change, was, now):
+    """Wijzigingsrijen voor de regels in frame; was/nu zijn kolommen of een vaste waarde."""
+    def values(value):
+        return value.to_numpy(dtype=object) if isinstance(value, pd.Series) else value
+
+    return pd.DataFrame({
+        'Ordernummer': frame['order'].to_numpy(),
+        'Klant': frame['customer'].to_numpy(),
+        'Artikelnummer': frame['item'].to_numpy(),
+        'Wijziging': change,
+        'Was': values(was),
+        'Nu': values(now)
+    })
+
+
+def _order_backorders(snapshot):
+    """Per order: klant en of er nog backorder artikelen zijn."""
+    return pd.DataFrame({
+        'customer': snapshot['customer'].to_numpy(),
+        'backorder': (snapshot['status'] == STATUS_BACKORDER).to_numpy()
+    }).groupby(snapshot['order'].to_numpy(), sort=False).agg(customer=('customer', 'first'),
+                                                              backorder=('backorder', 'any'))
+
+
+def diff_snapshots(previous, current):
+    """
+    Wijzigingen tussen twee snapshots als DataFrame (kolommen van CHANGE_COLUMNS
+    in excel_writer), gegroepeerd per order in de volgorde van de huidige run.
+    """
+    merged = previous.merge(current, on=['order', 'item'], how='outer',
+                            suffixes=('_was', '_nu'), indicator=True, sort=False)
+    # Klant van de huidige run, of van de vorige als het artikel verdwenen is
+    merged['customer'] = merged['customer_nu'].fillna(merged['customer_was'])
+    both = merged[merged['_merge'] == 'both']
+    new = merged[merged['_merge'] == 'right_only']
+    gone = merged[merged['_merge'] == 'left_only']
+
+    changes = []
+
+    # Orders die nu volledig verzendbaar zijn en in de vorige run nog backorders hadden
+    orders = _order_backorders(current).join(_order_backorders(previous)['backorder'].rename('was_backorder'),
+                                             how='inner')
+    became_sendable = orders[~orders['backorder'] & orders['was_backorder']]
+    changes.append(pd.DataFrame({
+        'Ordernummer': became_sendable.index.to_numpy(),
+        'Klant': became_sendable['customer'].to_numpy(),
+        'Artikelnummer': '',
+        'Wijziging': 'Order volledig verzendbaar',
+        'Was': STATUS_BACKORDER,
+        'Nu': STATUS_SENDABLE
+    }))
+
+    status_changed = both[both['status_was'] != both['status_nu']]
+    for was, now in ((STATUS_BACKORDER, STATUS_SENDABLE), (STATUS_SENDABLE, STATUS_BACKORDER)):
+        rows = status_changed[status_changed['status_nu'] == now]
+        changes.append(_change_rows(rows, f"{was} → {now}", rows['status_was'], rows['status_nu']))
+
+    # Categorie alleen vergelijken als het artikel in beide runs in backorder staat
+    still_backorder = both[(both['status_was'] == STATUS_BACKORDER) & (both['status_nu'] == STATUS_BACKORDER)]
+    category_changed = still_backorder[
+        still_backorder['category_was'].fillna(-1).to_numpy() != still_backorder['category_nu'].fillna(-1).to_numpy()]
+    changes.append(_change_rows(category_changed, 'Categorie gewijzigd',
+                                category_changed['category_name_was'].fillna('Geen categorie'),
+                                category_changed['category_name_nu'].fillna('Geen categorie')))
+
+    quantity_changed = both[both['quantity_was'] != both['quantity_nu']]
+    changes.append(_change_rows(quantity_changed, 'Aantal gewijzigd',
+                                quantity_changed['quantity_was'], quantity_changed['quantity_nu']))
+
+    changes.append(_change_rows(new, 'Nieuw artikel', '', new['status_nu']))
+    changes.append(_change_rows(gone, 'Artikel verdwenen', gone['status_was'], ''))
+
+    report = pd.concat(changes, ignore_index=True)
+
+    # Per order bij elkaar: huidige orders in hun volgorde, verdwenen orders daarna
+    order_rank = {order: rank for rank, order in enumerate(pd.unique(
+        np.concatenate([current['order'].to_numpy(), previous['order'].to_numpy()])))}
+    type_rank = {change: rank for rank, change in enumerate(CHANGE_TYPES)}
+    sort_keys = (report['Wijziging'].map(type_rank).to_numpy(), report['Ordernummer'].map(order_rank).to_numpy())
+    return report.iloc[np.lexsort(sort_keys)].reset_index(drop=True)
+
+
+def summarize_changes(report):
+    """Aantal wijzigingen per soort."""
+    counts = report['Wijziging'].value_counts()
+    return {change: int(counts[change]) for change in CHANGE_TYPES if change in counts.index}
+
+
+def save_change_report(report, file_path, colors, engine="auto"):
+    """Schrijf het wijzigingen rapport als 'Wijzigingen' werkblad in file_path."""
+    from excel_writer import ChangeSheetWriter
+
+    writer = ChangeSheetWriter(file_path, colors, engine=engine)
+    writer.write_frame(report, CHANGE_STYLES)
+    writer.close()
+    return file_path
+
+
+class SnapshotStore:
+    """Snapshots van vorige runs, per naam bewaard in snapshot_dir."""
+
+    def __init__(self, snapshot_dir="Cache/snapshots", name="default"):
+        self.path = os.path.join(snapshot_dir, f"{name}.pkl")
+
+    def load(self):
+        """Snapshot van de vorige run (None als er geen is)."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            return pd.read_pickle(self.path)
+        except Exception as e:
+            logging.warning(f"Snapshot {self.path} onleesbaar, geen wijzigingen rapport: {e}")
+            return None
+
+    def save(self, snapshot):
+        """Bewaar de snapshot van deze run (atomisch)."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            snapshot.to_pickle(tmp_path)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -11,19 +11,90 @@ INPUT_FILE = "Navision_Backorder_Export_QWIC_v2.xlsx"
 # Output bestandsnaam
 OUTPUT_FILE = "Output/Backorder_Analyse_v7.xlsx"
 
+# Excel inleesengine: "auto" (calamine indien geïnstalleerd, anders openpyxl),
+# "calamine" of "openpyxl"
+EXCEL_READER_ENGINE = "auto"
+
+# Excel writer voor de output: "auto" (xlsxwriter indien geïnstalleerd, anders
+# openpyxl write-only), "xlsxwriter" of "openpyxl"
+EXCEL_WRITER_ENGINE = "auto"
+
+# Cache voor ingelezen exports (opnieuw analyseren van hetzelfde bestand gaat
+# dan in milliseconden). Maximale grootte in MB; oudste entries worden verwijderd.
+EXPORT_CACHE_ENABLED = True
+EXPORT_CACHE_DIR = "Cache/exports"
+EXPORT_CACHE_MAX_MB = 500
+
+# Streaming modus voor zeer grote exports: de export wordt in batches gelezen en
+# afgeronde orders worden direct weggeschreven. Het budget begrenst het aantal
+# gebufferde regels van open orders.
+STREAMING_BATCH_ROWS = 50000
+STREAMING_MEMORY_BUDGET_MB = 512
+
+# Engine voor inlezen, filteren en groeperen (--engine): "pandas" of "polars"
+# (lazy query plan met pushdown en multi-threaded uitvoering; vereist polars)
+ANALYSIS_ENGINE = "pandas"
+
+# Batch analyse van een map met exports (python backorder_analyzer.py <map>):
+# aantal parallelle processen (0 = aantal processorkernen) en de output map
+BATCH_WORKERS = 0
+BATCH_OUTPUT_DIR = "Output/Batch"
+
+# Scenario vergelijking (python scenario_sweep.py <export>): de export wordt één
+# keer ingelezen en elk scenario (filters/categorieën) wordt daarop geëvalueerd.
+# Aantal workers (0 = aantal processorkernen) en "threads" of "fork" (processen
+# die de ingelezen export copy-on-write delen; niet op Windows)
+SWEEP_WORKERS = 0
+SWEEP_MODE = "threads"
+
+# Incrementele modus (--incremental): fingerprints en resultaten van de vorige run
+INCREMENTAL_STATE_DIR = "Cache/incremental"
+
+# Wijzigingen t.o.v. de vorige run (per order en artikel) als apart werkboek
+# <analyse>_Wijzigingen.xlsx; snapshots van de vorige run staan in CHANGE_SNAPSHOT_DIR
+CHANGE_REPORT_ENABLED = True
+CHANGE_SNAPSHOT_DIR = "Cache/snapshots"
+
+# Stamgegevens (optioneel, .xlsx of .csv): omschrijving per artikel en naam per dealer.
+# Leeg = niet gebruiken ('Artikel <nummer>' en de dealercode). Per bestand de kolom
+# met de sleutel (artikelnummer / dealercode) en de kolom met de waarde.
+ITEM_MASTER_FILE = ""
+ITEM_MASTER_COLUMNS = {"key": "No.", "value": "Description"}
+DEALER_MASTER_FILE = ""
+DEALER_MASTER_COLUMNS = {"key": "No.", "value": "Name"}
+MASTER_DATA_CACHE_DIR = "Cache/master"
+
+# Voorraad toewijzing: verdeel de beschikbare voorraad van een artikel over alle
+# orderregels die het vragen, in plaats van elke regel met voorraad > 0 als
+# verzendbaar te tonen. Regels worden gesplitst in een verzendbaar en een backorder deel.
+STOCK_ALLOCATION_ENABLED = False
+# Volgorde van toewijzing, belangrijkste eerst: "customer" (CUSTOMER_PRIORITY),
+# "order" (laagste ordernummer eerst) en/of "line" (volgorde in de export)
+STOCK_ALLOCATION_PRIORITY = ["customer", "order"]
+# Prioriteit per klant (lager = eerder aan de beurt); overige klanten komen daarna
+# Voorbeeld: {"D0001": 1, "D0017": 2}
+CUSTOMER_PRIORITY = {}
+
 # =============================================================================
 # FILTER CRITERIA
 # =============================================================================
 
-# Location Code filter (leeg = alle locaties)
+# Location Code filter (leeg = alle locaties; een lijst = één van deze locaties)
 LOCATION_CODE = ""
 
 # Fully Reserved filter (leeg = alle items)
 FULLY_RESERVED = ""
 
-# Order Status filter (leeg = alle statussen)
+# Order Status filter (leeg = alle statussen; een lijst = één van deze statussen)
 ORDER_STATUS = ""
 
+# Extra filters per kolom, bovenop de drie filters hierboven. Per kolom:
+#   "waarde" of ["a", "b"]       gelijk aan / één van
+#   {"not": ["a", "b"]}          geen van
+#   {">": 0, "<=": 100}          numerieke vergelijkingen
+# Voorbeeld: {"Quantity": {">=": 2}, "Customer Name": {"not": ["D0001"]}}
+BACKORDER_FILTERS = {}
+
 # =============================================================================
 # BACKORDER CATEGORIEËN
 # =============================================================================
@@ -68,6 +139,19 @@ CATEGORIES = {
     }
 }
 
+# Opslag van categorieën en links: "sqlite" (geïndexeerde catalogus, snelle
+# wijzigingen) of "json" (category_config.json en item_links.json direct).
+# De catalogus wordt automatisch gevuld vanuit de JSON bestanden als die nieuwer
+# zijn; exporteren naar JSON: python category_manager.py --export-json
+CATEGORY_STORAGE = "sqlite"
+CATEGORY_CATALOG_FILE = "category_catalog.sqlite"
+
+# Categorie regels (prefix, numeriek bereik, regex, per klant) naast de expliciete
+# artikellijsten; zie category_rules.py voor het formaat. Expliciet toegewezen
+# artikelen gaan altijd voor. Zonder dit bestand geldt alleen de BA/HP regel
+# voor fietsen en batterijen.
+CATEGORY_RULES_FILE = "category_rules.json"
+
 # =============================================================================
 # E-MAIL INSTELLINGEN
 # =============================================================================
@@ -130,6 +214,48 @@ QWIC Team
     }
 }
 
+# E-mail modus: "per_item" (één e-mail per backorder artikel) of "digest"
+# (één e-mail per dealer met alle artikelen en links)
+EMAIL_MODE = "per_item"
+
+# Groepering van digest e-mails: "customer" (per dealer) of "order" (per dealer en order)
+EMAIL_DIGEST_GROUPING = "customer"
+
+# Digest templates. Per categorie een sectie met kop en een regel per artikel;
+# {link_text} wordt de 'link' tekst met verkorte URL, of 'no_link' zonder link.
+EMAIL_DIGEST_TEMPLATES = {
+    'subject': 'Backorder artikelen niet meer leverbaar via QWIC - {item_count} artikel(en)',
+    'body': """
+Beste {customer_name},
+
+Van uw backorders zijn {item_count} artikel(en) helaas niet meer leverbaar via QWIC.
+Hieronder vindt u per artikel waar u het kunt bestellen.
+
+{sections}
+
+Ordernummer(s): {order_nos}
+
+Voor vragen kunt u contact opnemen met onze klantenservice.
+
+Met vriendelijke groet,
+QWIC Team
+    """,
+    'sections': {
+        1: {
+            'header': 'Niet meer leverbaar via QWIC - wij raden u aan deze artikelen direct bij de fabrikant te bestellen:',
+            'item': '- {item_description} (Artikelnummer: {item_no}), order {order_no}, aantal {quantity}\n  {link_text}',
+            'link': '🔗 {link} (verkorte link)',
+            'no_link': 'Neem contact op met de fabrikant van dit artikel voor bestelling.'
+        },
+        3: {
+            'header': 'Niet meer beschikbaar via QWIC - wij raden u aan deze artikelen bij een externe verkoper te bestellen:',
+            'item': '- {item_description} (Artikelnummer: {item_no}), order {order_no}, aantal {quantity}\n  {link_text}',
+            'link': '🔗 {link} (verkorte link)',
+            'no_link': 'Zoek een externe verkoper voor dit artikel.'
+        }
+    }
+}
+
 # Salesforce e-mail instellingen
 SALESFORCE_EMAIL_SETTINGS = {
     'enabled': True,
@@ -140,6 +266,34 @@ SALESFORCE_EMAIL_SETTINGS = {
     'bcc': []
 }
 
+# Notification ledger: notificaties die al gemaakt zijn (order, artikel, categorie,
+# template versie) worden bijgehouden, zodat een volgende run alleen nieuwe e-mails
+# maakt. Notificaties ouder dan de bewaartermijn worden opgeruimd (0 = nooit).
+NOTIFICATION_LEDGER_ENABLED = True
+NOTIFICATION_LEDGER_FILE = "Cache/notification_ledger.sqlite"
+NOTIFICATION_LEDGER_RETENTION_DAYS = 90
+
+# Verzending van de e-mails via de outbox (python backorder_analyzer.py --send-emails).
+# Verzonden berichten worden bijgehouden in outbox_file, zodat een onderbroken
+# verzending hervat wordt. Het e-mailadres per dealer staat in dealer_addresses_file
+# ({"D0001": "dealer@voorbeeld.nl"}). Voor testen: python local_smtp_server.py --port 1025
+EMAIL_OUTBOX_SETTINGS = {
+    'smtp_host': 'localhost',
+    'smtp_port': 1025,
+    'use_tls': False,
+    'username': '',
+    'password': '',
+    'timeout_seconds': 30,
+    'max_connections': 4,      # Maximaal aantal gelijktijdige SMTP verbindingen
+    'rate_per_second': 5.0,    # Maximaal aantal e-mails per seconde
+    'max_retries': 3,          # Retries bij tijdelijke fouten
+    'backoff_seconds': 2.0,    # Wachttijd voor de eerste retry (verdubbelt per retry)
+    'max_attempts': 12,        # Maximaal aantal pogingen per bericht over alle runs samen
+    'sent_retention_days': 30, # Verzonden berichten zo lang bewaren in de outbox (0 = altijd)
+    'outbox_file': 'Output/email_outbox.jsonl',
+    'dealer_addresses_file': 'dealer_emails.json'
+}
+
 # =============================================================================
 # EXCEL OPMAAK KLEUREN
 # =============================================================================
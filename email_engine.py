@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+E-mail Engine
+=============
+
+Batch generatie van dealer e-mails. Elke template wordt één keer
+gecompileerd, links en verkorte URLs worden per uniek artikel opgezocht en
+onderwerpen en bodies worden voor alle regels tegelijk opgebouwd uit
+kolommen in plaats van per regel met str.format.
+
+Naast één e-mail per backorder regel kan de engine digests maken: één
+e-mail per dealer (of per dealer en order) met alle artikelen en links.
+"""
+
+import functools
+import hashlib
+import json
+import string
+
+import numpy as np
+import pandas as pd
+
+from excel_writer import EMAIL_COLUMNS, DIGEST_COLUMNS
+
+# Categorieën die een e-mail naar de dealer krijgen
+EMAIL_CATEGORIES = [1, 3]
+
+# Per categorie: template veld met de link tekst, link type in de CategoryManager
+# en de fallback links in EMAIL_TEMPLATES
+LINK_FIELDS = {
+    1: ('manufacturer_message', 'fabrikant', 'manufacturer_links'),
+    3: ('external_seller_message', 'externe_verkoper', 'external_seller_links')
+}
+
+# Standaard links als er geen CategoryManager is en de template geen default heeft
+DEFAULT_LINKS = {
+    1: 'https://www.original-equipment-parts.com',
+    3: 'https://www.autodoc.nl'
+}
+
+# Groepering van digest e-mails: per dealer of per dealer en order
+DIGEST_GROUPINGS = ['customer', 'order']
+
+
+def shorten_url(url):
+    """Verkort een URL door alleen het domein en belangrijke delen te behouden."""
+    if not url or not isinstance(url, str):
+        return url
+
+    # Verwijder protocol
+    if url.startswith('http://'):
+        url = url[7:]
+    elif url.startswith('https://'):
+        url = url[8:]
+
+    # Verwijder www. als aanwezig
+    if url.startswith('www.'):
+        url = url[4:]
+
+    # Als de URL nog steeds te lang is, behoud alleen het domein en eerste pad
+    if len(url) > 50:
+        parts = url.split('/')
+        if len(parts) > 1:
+            # Behoud domein + eerste pad
+            shortened = '/'.join(parts[:2])
+            if len(shortened) > 50:
+                # Als nog steeds te lang, behoud alleen domein
+                shortened = parts[0]
+            return shortened
+        else:
+            return parts[0]
+
+    return url
+
+
+def link_message(category, link):
+    """Tekst met (verkorte) link voor in de e-mail."""
+    if category == 1:
+        if link:
+            return f"Wij raden u aan om dit artikel direct bij de fabrikant te bestellen:\n🔗 {shorten_url(link)} (verkorte link)"
+        return "Wij raden u aan om contact op te nemen met de fabrikant van dit artikel voor bestelling."
+    if link:
+        return f"Wij raden u aan om dit artikel bij een externe verkoper te bestellen:\n🔗 {shorten_url(link)} (verkorte link)"
+    return "Wij raden u aan om een externe verkoper te zoeken voor dit artikel."
+
+
+def as_text(values):
+    """Zet een kolom om naar tekst zoals str.format dat doet, met str() alleen per unieke waarde."""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    texts = np.array([str(value) for value in uniques], dtype=object)
+    return texts[codes]
+
+
+class CompiledTemplate:
+    """Een str.format template, opgesplitst in vaste tekst en velden."""
+
+    def __init__(self, template_string):
+        self.template_string = template_string
+        self.parts = []
+        # Velden met conversie of format spec kunnen niet als kolom samengevoegd worden
+        self.vectorizable = True
+        for literal, field, format_spec, conversion in string.Formatter().parse(template_string):
+            self.parts.append((literal, field))
+            if field is not None and (format_spec or conversion):
+                self.vectorizable = False
+
+    @property
+    def fields(self):
+        return [field for _, field in self.parts if field is not None]
+
+    def render_one(self, values):
+        """Vul de template voor één set waarden."""
+        return self.template_string.format(**values)
+
+    def render(self, columns, length):
+        """
+        Vul de template voor alle regels tegelijk.
+
+        columns: dict met per veld een object array van tekst.
+        """
+        if not self.vectorizable:
+            # Zeldzaam: terugvallen op per regel formatteren
+            keys = self.fields
+            return np.array([self.template_string.format(**dict(zip(keys, row)))
+                             for row in zip(*(columns[key] for key in keys))], dtype=object)
+
+        result = np.full(length, '', dtype=object)
+        for literal, field in self.parts:
+            if literal:
+                result = result + literal
+            if field is not None:
+                result = result + columns[field]
+        return result
+
+
+def template_version(template):
+    """Korte hash van een template; verandert zodra de tekst van de template verandert."""
+    payload = json.dumps(template, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:12]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(template_string):
+    """Compileer een template één keer en hergebruik het resultaat."""
+    return CompiledTemplate(template_string)
+
+
+class EmailEngine:
+    def __init__(self, templates, category_manager=None, digest_templates=None):
+        self.templates = templates
+        self.category_manager = category_manager
+        self.digest_templates = digest_templates or {}
+        self.compiled = {
+            category: (compile_template(template['subject']), compile_template(template['body']))
+            for category, template in templates.items()
+        }
+        # Memoization van links en link teksten per (categorie, artikel)
+        self._links = {}
+        self._link_messages = {}
+
+    def template_versions(self, layout='items'):
+        """Template versie per categorie voor de gegeven layout ('items' of 'digest')."""
+        if layout == 'digest':
+            version = template_version(self.digest_templates)
+            return {category: version for category in self.digest_templates.get('sections', {})}
+        return {
+            category: template_version({'subject': template['subject'], 'body': template['body']})
+            for category, template in self.templates.items()
+        }
+
+    def get_link(self, category, item_no):
+        """Link voor een artikel (CategoryManager of fallback links uit de template)."""
+        key = (category, item_no)
+        if key not in self._links:
+            _, link_type, template_key = LINK_FIELDS[category]
+            if self.category_manager:
+                link = self.category_manager.get_item_link(item_no, link_type)
+            else:
+                # Fallback naar links uit de template
+                links = self.templates.get(category, {}).get(template_key, {})
+                link = links.get(item_no, links.get('default', DEFAULT_LINKS[category]))
+            self._links[key] = link
+        return self._links[key]
+
+    def get_link_message(self, category, item_no):
+        """Link tekst voor een artikel, opgezocht en verkort één keer per artikel."""
+        key = (category, item_no)
+        if key not in self._link_messages:
+            self._link_messages[key] = link_message(category, self.get_link(category, item_no))
+        return self._link_messages[key]
+
+    def _link_texts(self, category, item_numbers, section):
+        """Korte link regel per artikel voor in een digest."""
+        codes, uniques = pd.factorize(pd.Series(item_numbers), use_na_sentinel=False)
+        texts = []
+        for item in uniques:
+            link = self.get_link(category, item)
+            if link:
+                texts.append(section['link'].format(link=shorten_url(link)))
+            else:
+                texts.append(section['no_link'])
+        return np.array(texts, dtype=object)[codes]
+
+    @staticmethod
+    def _text_columns(lines):
+        """Template velden die voor elke regel gelden, als tekst kolommen."""
+        item_text = as_text(lines['Item No.'])
+        if 'Description' in lines.columns:
+            description_text = as_text(lines['Description'])
+        else:
+            description_text = 'Artikel ' + item_text
+        customer_text = as_text(lines['Customer Name'])
+        if 'Dealer Name' in lines.columns:
+            # Dealernaam uit de stamgegevens, de dealercode als die onbekend is
+            names = lines['Dealer Name'].to_numpy(dtype=object)
+            customer_text = np.where(pd.isna(names), customer_text, names)
+        return {
+            'customer_name': customer_text,
+            'item_no': item_text,
+            'item_description': description_text,
+            'order_no': as_text(lines['Sales Order No.']),
+            'quantity': as_text(lines['Quantity'])
+        }
+
+    def render(self, lines):
+        """
+        Genereer e-mails voor alle regels in lines (één e-mail per regel).
+
+        lines: DataFrame met backorder regels inclusief kolom Category.
+        Regels met een categorie zonder template worden overgeslagen.
+        Geeft een DataFrame met EMAIL_COLUMNS terug, in de volgorde van lines.
+        """
+        categories = lines['Category'] if len(lines) else pd.Series(dtype=object)
+        keep = categories.isin(list(self.compiled.keys())).to_numpy()
+        lines = lines[keep]
+        if len(lines) == 0:
+            return pd.DataFrame(columns=EMAIL_COLUMNS)
+
+        base_columns = self._text_columns(lines)
+        description_text = base_columns['item_description']
+
+        category_values = lines['Category'].to_numpy()
+        subjects = np.empty(len(lines), dtype=object)
+        bodies = np.empty(len(lines), dtype=object)
+        for category, (subject_template, body_template) in self.compiled.items():
+            positions = np.flatnonzero(category_values == category)
+            if len(positions) == 0:
+                continue
+            columns = {key: values[positions] for key, values in base_columns.items()}
+            if category in LINK_FIELDS:
+                field = LINK_FIELDS[category][0]
+                # Eén opzoekactie per uniek artikel
+                codes, uniques = pd.factorize(pd.Series(lines['Item No.'].to_numpy()[positions]),
+                                              use_na_sentinel=False)
+                messages = np.array([self.get_link_message(category, item) for item in uniques], dtype=object)
+                columns[field] = messages[codes]
+            subjects[positions] = subject_template.render(columns, len(positions))
+            bodies[positions] = body_template.render(columns, len(positions))
+
+        return pd.DataFrame({
+            'Ordernummer': lines['Sales Order No.'].to_numpy(),
+            'Klant': lines['Customer Name'].to_numpy(),
+            'Artikelnummer': lines['Item No.'].to_numpy(),
+            'Omschrijving': description_text,
+            'Aantal': lines['Quantity'].to_numpy(),
+            'Categorie': category_values,
+            'Onderwerp': subjects,
+            'E-mail Body': pd.Series(bodies, dtype=object).str.strip().to_numpy()
+        })
+
+    def render_digests(self, lines, grouping='customer'):
+        """
+        Genereer één e-mail per dealer (grouping='customer') of per dealer en
+        order (grouping='order') met alle artikelen uit lines.
+
+        Artikelen worden per categorie in een sectie gezet, in de volgorde van
+        lines. Geeft een DataFrame met DIGEST_COLUMNS terug, één rij per digest
+        in de volgorde waarin de dealers (orders) voor het eerst voorkomen.
+        """
+        if grouping not in DIGEST_GROUPINGS:
+            raise ValueError(f"Onbekende digest groepering: {grouping} (kies uit {DIGEST_GROUPINGS})")
+        sections = self.digest_templates.get('sections', {})
+        if len(lines):
+            lines = lines[lines['Category'].isin(list(sections.keys())).to_numpy()]
+        if len(lines) == 0:
+            return pd.DataFrame(columns=DIGEST_COLUMNS)
+
+        # Artikel regels per categorie in één keer opbouwen
+        base_columns = self._text_columns(lines)
+        category_values = lines['Category'].to_numpy()
+        item_lines = np.empty(len(lines), dtype=object)
+        for category, section in sections.items():
+            positions = np.flatnonzero(category_values == category)
+            if len(positions) == 0:
+                continue
+            columns = {key: values[positions] for key, values in base_columns.items()}
+            columns['link_text'] = self._link_texts(
+                category, lines['Item No.'].to_numpy()[positions], section)
+            item_lines[positions] = compile_template(section['item']).render(columns, len(positions))
+
+        # Digest nummer per dealer (of dealer + order), in volgorde van eerste voorkomen
+        if grouping == 'customer':
+            digest_keys = lines['Customer Name']
+        else:
+            digest_keys = pd.MultiIndex.from_arrays([lines['Customer Name'], lines['Sales Order No.']])
+        digest_codes, _ = pd.factorize(digest_keys, use_na_sentinel=False)
+        frame = pd.DataFrame({
+            'digest': digest_codes,
+            'category': category_values,
+            'line': item_lines,
+            'customer': lines['Customer Name'].to_numpy(),
+            'customer_name': base_columns['customer_name'],
+            'order_no': base_columns['order_no']
+        })
+
+        # Secties: kop per categorie gevolgd door de artikel regels
+        section_frame = frame.groupby(['digest', 'category'], sort=True)['line'].agg('\n'.join).reset_index()
+        headers = np.array([sections[category]['header'] for category in section_frame['category']], dtype=object)
+        section_frame['text'] = headers + '\n' + section_frame['line'].to_numpy()
+        by_digest = section_frame.groupby('digest', sort=True)
+
+        per_digest = frame.groupby('digest', sort=True)
+        digests = pd.DataFrame({
+            'customer': per_digest['customer'].first(),
+            'customer_name': per_digest['customer_name'].first(),
+            'orders': per_digest['order_no'].agg(lambda values: ', '.join(dict.fromkeys(values))),
+            'item_count': per_digest.size(),
+            'order_count': per_digest['order_no'].nunique(),
+            'categories': by_digest['category'].agg(lambda values: ', '.join(str(value) for value in values)),
+            'sections': by_digest['text'].agg('\n\n'.join)
+        })
+
+        columns = {
+            'customer_name': as_text(digests['customer_name']),
+            'order_nos': digests['orders'].to_numpy(dtype=object),
+            'item_count': as_text(digests['item_count']),
+            'order_count': as_text(digests['order_count']),
+            'sections': digests['sections'].to_numpy(dtype=object)
+        }
+        subject_template = compile_template(self.digest_templates['subject'])
+        body_template = compile_template(self.digest_templates['body'])
+        subjects = subject_template.render(columns, len(digests))
+        bodies = body_template.render(columns, len(digests))
+
+        return pd.DataFrame({
+            'Klant': digests['customer'].to_numpy(),
+            'Ordernummers': columns['order_nos'],
+            'Aantal artikelen': digests['item_count'].to_numpy(),
+            'Categorieën': digests['categories'].to_numpy(dtype=object),
+            'Onderwerp': subjects,
+            'E-mail Body': pd.Series(bodies, dtype=object).str.strip().to_numpy()
+        })
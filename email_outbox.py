@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+E-mail Outbox
+=============
+
+Verzending van de gegenereerde dealer e-mails via SMTP. Berichten komen eerst
+in een persistente outbox (JSON Lines bestand); elke statuswijziging wordt
+direct achteraan toegevoegd, zodat een onderbroken verzending bij de volgende
+run verder gaat waar hij gestopt is zonder e-mails dubbel te versturen.
+Berichten die door een tijdelijke fout (verbinding, time-out, SMTP 4xx) niet
+verzonden zijn, worden bij de volgende run opnieuw aangeboden tot het maximum
+aantal pogingen; verzonden berichten worden na de bewaartermijn opgeruimd.
+
+De verzending gebruikt een pool van hergebruikte SMTP verbindingen met een
+maximum aantal gelijktijdige verbindingen, een rate limit (e-mails per
+seconde) en retries met exponentiële backoff bij tijdelijke fouten.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+
+import pandas as pd
+
+# Mogelijke statussen van een bericht in de outbox
+OUTBOX_STATUSES = ['pending', 'sent', 'failed', 'skipped']
+
+# Standaard instellingen (overschreven door EMAIL_OUTBOX_SETTINGS uit config.py)
+DEFAULT_OUTBOX_SETTINGS = {
+    'smtp_host': 'localhost',
+    'smtp_port': 1025,
+    'use_tls': False,
+    'username': '',
+    'password': '',
+    'timeout_seconds': 30,
+    'max_connections': 4,
+    'rate_per_second': 5.0,
+    'max_retries': 3,
+    'backoff_seconds': 2.0,
+    'max_attempts': 12,
+    'sent_retention_days': 30,
+    'outbox_file': 'Output/email_outbox.jsonl',
+    'dealer_addresses_file': 'dealer_emails.json'
+}
+
+
+def message_key(to, subject, body):
+    """Stabiele sleutel voor een bericht, zodat hetzelfde bericht maar één keer in de outbox komt."""
+    payload = "\x1f".join(str(part) for part in (to, subject, body))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]
+
+
+def messages_from_report(email_report):
+    """
+    Zet een e-mail rapport om naar outbox berichten.
+
+    Accepteert de lijst van generate_email_report of een e-mail DataFrame
+    (per artikel of digest, beide met de kolommen Klant, Onderwerp en E-mail Body).
+    """
+    if isinstance(email_report, pd.DataFrame):
+        return [{'to': row['Klant'], 'subject': row['Onderwerp'], 'body': row['E-mail Body']}
+                for row in email_report[['Klant', 'Onderwerp', 'E-mail Body']].to_dict('records')]
+    return [{'to': email['to'], 'subject': email['subject'], 'body': email['body']}
+            for email in email_report]
+
+
+def load_dealer_addresses(file_path):
+    """Laad het e-mailadres per dealer ({dealer: adres}) uit een JSON bestand."""
+    if not file_path or not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return {str(dealer): address for dealer, address in json.load(f).items()}
+    except Exception as e:
+        logging.warning(f"Dealer e-mailadressen niet geladen uit {file_path}: {e}")
+        return {}
+
+
+def make_address_resolver(dealer_addresses):
+    """Geef een functie die het e-mailadres voor een ontvanger bepaalt (None als onbekend)."""
+    def resolve(to):
+        to = str(to)
+        if '@' in to:
+            return to
+        return dealer_addresses.get(to)
+    return resolve
+
+
+class Outbox:
+    """Persistente outbox met één regel per bericht of statuswijziging."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.messages = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Half geschreven laatste regel na een crash
+                    logging.warning(f"Onleesbare regel {line_no} in outbox {self.file_path} overgeslagen")
+                    continue
+                if record.get('type') == 'message':
+                    self.messages[record['id']] = record
+                elif record.get('type') == 'status' and record['id'] in self.messages:
+                    self.messages[record['id']].update(
+                        {key: record[key] for key in ('status', 'attempts', 'error', 'transient') if key in record})
+                    if 'time' in record:
+                        self.messages[record['id']]['updated'] = record['time']
+        logging.info(f"Outbox geladen: {self.counts()}")
+
+    def _append(self, record):
+        if self._file is None:
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.file_path, 'a', encoding='utf-8')
+            # Een half geschreven laatste regel afsluiten, anders plakt het volgende record eraan vast
+            if self._file.tell() > 0:
+                with open(self.file_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._file.write("\n")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def add(self, messages, resolve_address):
+        """Voeg berichten toe; berichten die al in de outbox staan worden niet opnieuw toegevoegd."""
+        added = 0
+        with self._lock:
+            for message in messages:
+                key = message_key(message['to'], message['subject'], message['body'])
+                address = resolve_address(message['to'])
+                existing = self.messages.get(key)
+                if existing is not None:
+                    # Overgeslagen berichten opnieuw aanbieden als er nu wel een adres is
+                    if existing['status'] == 'skipped' and address:
+                        existing.update({'address': address, 'status': 'pending', 'error': None})
+                        self._append({'type': 'message', **existing})
+                    continue
+                record = {
+                    'type': 'message',
+                    'id': key,
+                    'to': str(message['to']),
+                    'address': address,
+                    'subject': message['subject'],
+                    'body': message['body'],
+                    'status': 'pending' if address else 'skipped',
+                    'attempts': 0,
+                    'error': None if address else 'Geen e-mailadres voor dealer',
+                    'created': time.time()
+                }
+                self.messages[key] = record
+                self._append(record)
+                added += 1
+        return added
+
+    def mark(self, message_id, status, attempts, error=None, transient=False):
+        """Leg een statuswijziging direct vast in het outbox bestand."""
+        now = time.time()
+        with self._lock:
+            self.messages[message_id].update({'status': status, 'attempts': attempts, 'error': error,
+                                              'transient': transient, 'updated': now})
+            self._append({'type': 'status', 'id': message_id, 'status': status, 'attempts': attempts,
+                          'error': error, 'transient': transient, 'time': now})
+
+    def retry_failed(self, max_attempts):
+        """
+        Bied mislukte berichten met een tijdelijke fout opnieuw aan, zolang ze
+        minder dan max_attempts pogingen hebben gehad. Geeft het aantal terug.
+        """
+        retried = 0
+        with self._lock:
+            for message in self.messages.values():
+                # Oudere outboxen kennen geen 'transient': dan begrensd door max_attempts
+                if message['status'] != 'failed' or not message.get('transient', True) or \
+                        message.get('attempts', 0) >= max_attempts:
+                    continue
+                message['status'] = 'pending'
+                self._append({'type': 'status', 'id': message['id'], 'status': 'pending',
+                              'attempts': message.get('attempts', 0), 'error': message.get('error'),
+                              'time': time.time()})
+                retried += 1
+        return retried
+
+    def pending(self):
+        return [message for message in self.messages.values() if message['status'] == 'pending']
+
+    def counts(self):
+        counts = {status: 0 for status in OUTBOX_STATUSES}
+        for message in self.messages.values():
+            counts[message['status']] = counts.get(message['status'], 0) + 1
+        return counts
+
+    def compact(self, sent_retention_days=0):
+        """
+        Herschrijf het bestand met alleen de huidige stand van elk bericht.
+
+        Verzonden berichten ouder dan sent_retention_days vallen weg (0 = bewaren);
+        dubbel versturen daarna voorkomt de notification ledger.
+        """
+        with self._lock:
+            self.close()
+            if sent_retention_days:
+                cutoff = time.time() - sent_retention_days * 86400
+                expired = [key for key, message in self.messages.items() if message['status'] == 'sent'
+                           and message.get('updated', message.get('created', 0)) < cutoff]
+                for key in expired:
+                    del self.messages[key]
+                if expired:
+                    logging.info(f"{len(expired)} verzonden berichten ouder dan {sent_retention_days} dagen "
+                                 f"uit de outbox verwijderd")
+            tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for message in self.messages.values():
+                    f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.file_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RateLimiter:
+    """Verdeelt verzendmomenten gelijkmatig over de tijd (maximaal rate_per_second)."""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second and rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SMTPConnectionPool:
+    """Pool van hergebruikte SMTP verbindingen met een maximum aantal gelijktijdige verbindingen."""
+
+    def __init__(self, host, port, max_connections=4, use_tls=False, username='', password='', timeout=30):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, max_connections))
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        connection.ehlo()
+        if self.use_tls:
+            connection.starttls()
+            connection.ehlo()
+        if self.username:
+            connection.login(self.username, self.password)
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """Leen een verbinding uit de pool (of open een nieuwe)."""
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            except smtplib.SMTPResponseException:
+                # Server heeft geantwoord: de verbinding is nog bruikbaar na RSET
+                try:
+                    connection.rset()
+                    self._idle.put(connection)
+                except (smtplib.SMTPException, OSError):
+                    self._close(connection)
+                raise
+            except (smtplib.SMTPException, OSError):
+                self._close(connection)
+                raise
+            else:
+                self._idle.put(connection)
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class EmailDispatcher:
+    def __init__(self, outbox, settings, sender_settings, pool=None):
+        self.outbox = outbox
+        self.settings = {**DEFAULT_OUTBOX_SETTINGS, **(settings or {})}
+        self.sender_settings = sender_settings or {}
+        self.pool = pool or SMTPConnectionPool(
+            self.settings['smtp_host'], self.settings['smtp_port'],
+            max_connections=self.settings['max_connections'],
+            use_tls=self.settings['use_tls'],
+            username=self.settings['username'],
+            password=self.settings['password'],
+            timeout=self.settings['timeout_seconds']
+        )
+        self.rate_limiter = RateLimiter(self.settings['rate_per_second'])
+        self._metrics_lock = threading.Lock()
+        self.metrics = {'sent': 0, 'failed': 0, 'retries': 0, 'latencies': []}
+
+    def build_message(self, message):
+        """Maak het e-mail bericht met afzender, cc en reply-to uit SALESFORCE_EMAIL_SETTINGS."""
+        from_email = self.sender_settings.get('from_email', 'backorder@localhost')
+        email_message = EmailMessage()
+        email_message['From'] = formataddr((self.sender_settings.get('from_name', ''), from_email))
+        email_message['To'] = message['address']
+        if self.sender_settings.get('cc'):
+            email_message['Cc'] = ', '.join(self.sender_settings['cc'])
+        if self.sender_settings.get('reply_to'):
+            email_message['Reply-To'] = self.sender_settings['reply_to']
+        email_message['Subject'] = message['subject']
+        email_message['Message-ID'] = make_msgid(idstring=message['id'])
+        email_message.set_content(message['body'])
+        # Bcc alleen in de envelop, niet in de headers
+        recipients = [message['address']] + list(self.sender_settings.get('cc', [])) + \
+            list(self.sender_settings.get('bcc', []))
+        return email_message, from_email, recipients
+
+    def _record(self, key, latency=None):
+        with self._metrics_lock:
+            self.metrics[key] += 1
+            if latency is not None:
+                self.metrics['latencies'].append(latency)
+
+    def send_one(self, message):
+        """Verzend één bericht met retries; de uitkomst wordt in de outbox vastgelegd."""
+        email_message, from_email, recipients = self.build_message(message)
+        max_retries = self.settings['max_retries']
+        attempts = message.get('attempts', 0)
+        error = None
+        transient = True
+
+        for retry in range(max(1, min(max_retries + 1, self.settings['max_attempts'] - attempts))):
+            self.rate_limiter.acquire()
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                with self.pool.connection() as connection:
+                    connection.send_message(email_message, from_email, recipients)
+                self.outbox.mark(message['id'], 'sent', attempts)
+                self._record('sent', time.perf_counter() - start)
+                return 'sent'
+            except smtplib.SMTPRecipientsRefused as e:
+                # Permanente fout: adres wordt niet geaccepteerd
+                error = f"Ontvanger geweigerd: {e.recipients}"
+                transient = False
+                break
+            except smtplib.SMTPResponseException as e:
+                error = f"{e.smtp_code} {e.smtp_error!r}"
+                if e.smtp_code >= 500:
+                    transient = False
+                    break
+            except (smtplib.SMTPException, OSError) as e:
+                error = str(e) or type(e).__name__
+
+            if retry < max_retries and attempts < self.settings['max_attempts']:
+                self._record('retries')
+                time.sleep(self.settings['backoff_seconds'] * (2 ** retry))
+
+        logging.warning(f"E-mail aan {message['to']} niet verzonden na {attempts} poging(en): {error}")
+        self.outbox.mark(message['id'], 'failed', attempts, error, transient)
+        self._record('failed')
+        return 'failed'
+
+    def run(self):
+        """Verzend alle openstaande berichten uit de outbox en geef verzendstatistieken terug."""
+        pending = self.outbox.pending()
+        start = time.perf_counter()
+        if pending:
+            logging.info(f"Verzenden van {len(pending)} e-mails via {self.settings['smtp_host']}:"
+                         f"{self.settings['smtp_port']} (max. {self.settings['max_connections']} verbindingen, "
+                         f"{self.settings['rate_per_second']}/s)")
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, self.settings['max_connections'])) as executor:
+                    list(executor.map(self.send_one, pending))
+            finally:
+                self.pool.close_all()
+        seconds = time.perf_counter() - start
+
+        latencies = sorted(self.metrics['latencies'])
+        stats = {
+            'to_send': len(pending),
+            'sent': self.metrics['sent'],
+            'failed': self.metrics['failed'],
+            'retries': self.metrics['retries'],
+            'connections_opened': self.pool.connections_opened,
+            'seconds': seconds,
+            'throughput_per_second': self.metrics['sent'] / seconds if seconds > 0 else 0.0,
+            'latency_avg_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            'outbox': self.outbox.counts()
+        }
+
+        logging.info("=== E-mail verzending voltooid ===")
+        logging.info(f"Verzonden: {stats['sent']}, mislukt: {stats['failed']}, retries: {stats['retries']}")
+        logging.info(f"Doorvoer: {stats['throughput_per_second']:.1f} e-mails/s in {seconds:.1f}s "
+                     f"({stats['connections_opened']} SMTP verbindingen)")
+        logging.info(f"Latentie per e-mail: gem. {stats['latency_avg_ms']:.0f} ms, p95 {stats['latency_p95_ms']:.0f} ms")
+        logging.info(f"Outbox: {stats['outbox']}")
+        return stats
+
+
+def send_report(email_report, settings=None, sender_settings=None):
+    """
+    Zet een e-mail rapport in de outbox en verzend alle openstaande berichten.
+
+    Een eerder onderbroken verzending wordt hervat: berichten die al
+    verzonden zijn worden niet opnieuw verstuurd, berichten die door een
+    tijdelijke fout mislukt zijn worden opnieuw geprobeerd (tot max_attempts).
+    """
+    settings = {**DEFAULT_OUTBOX_SETTINGS, **(settings or {})}
+    outbox = Outbox(settings['outbox_file'])
+    try:
+        resolve_address = make_address_resolver(load_dealer_addresses(settings['dealer_addresses_file']))
+        added = outbox.add(messages_from_report(email_report), resolve_address)
+        logging.info(f"{added} nieuwe e-mails in de outbox ({outbox.file_path})")
+        retried = outbox.retry_failed(settings['max_attempts'])
+        if retried:
+            logging.info(f"{retried} eerder mislukte e-mails opnieuw in de wachtrij")
+        skipped = outbox.counts()['skipped']
+        if skipped:
+            logging.warning(f"{skipped} e-mails overgeslagen zonder e-mailadres "
+                            f"(vul {settings['dealer_addresses_file']} aan)")
+        stats = EmailDispatcher(outbox, settings, sender_settings).run()
+        outbox.compact(settings['sent_retention_days'])
+        return stats
+    finally:
+        outbox.close()
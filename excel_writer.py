@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Excel Writer
+============
+
+Streaming writers voor de analyse en het e-mail rapport. Rijen worden direct
+naar het bestand geschreven (xlsxwriter constant_memory, of openpyxl write-only
+als xlsxwriter niet geïnstalleerd is), zodat het geheugengebruik niet groeit
+met de grootte van de export.
+
+Alle opmaak wordt één keer als benoemde stijl geregistreerd en daarna per cel
+alleen bij naam toegewezen. Kolombreedtes worden bijgehouden tijdens het
+schrijven.
+"""
+
+import importlib.util
+import math
+import os
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Font, Border, Side
+from openpyxl.utils import get_column_letter
+
+# Kolommen van het e-mail rapport
+EMAIL_COLUMNS = ['Ordernummer', 'Klant', 'Artikelnummer', 'Omschrijving', 'Aantal',
+                 'Categorie', 'Onderwerp', 'E-mail Body']
+
+# Kolommen van het e-mail rapport in digest modus (één rij per dealer)
+DIGEST_COLUMNS = ['Klant', 'Ordernummers', 'Aantal artikelen', 'Categorieën', 'Onderwerp', 'E-mail Body']
+
+# Kolommen van het wijzigingen rapport (één rij per wijziging)
+CHANGE_COLUMNS = ['Ordernummer', 'Klant', 'Artikelnummer', 'Wijziging', 'Was', 'Nu']
+
+# Maximale kolombreedte bij auto-fit
+MAX_COLUMN_WIDTH = 50
+
+# Beschikbare backends in volgorde van voorkeur
+WRITER_ENGINES = ['xlsxwriter', 'openpyxl']
+
+
+def writer_engine_available(engine):
+    """Controleer of een writer backend geïnstalleerd is."""
+    return engine in WRITER_ENGINES and importlib.util.find_spec(engine) is not None
+
+
+def resolve_writer_engine(preferred="auto"):
+    """Kies de writer backend (auto = xlsxwriter indien beschikbaar)."""
+    if preferred and preferred != "auto":
+        if preferred not in WRITER_ENGINES:
+            raise ValueError(f"Onbekende Excel writer: {preferred} (kies uit {WRITER_ENGINES})")
+        if writer_engine_available(preferred):
+            return preferred
+    return 'xlsxwriter' if writer_engine_available('xlsxwriter') else 'openpyxl'
+
+
+def analysis_styles(colors):
+    """Stijldefinities voor het analyse werkblad."""
+    styles = {
+        'order_header': {'fill': colors['order_header'], 'bold': True, 'border': True},
+        'sendable_label': {'fill': colors['sendable'], 'bold': True},
+        'backorder_label': {'fill': colors['backorder'], 'bold': True},
+        'column_header': {'fill': colors['header'], 'bold': True, 'font_color': 'FFFFFF', 'border': True},
+        'sendable': {'fill': colors['sendable'], 'border': True},
+        'no_category': {'fill': colors['backorder'], 'border': True}
+    }
+    for category in range(1, 5):
+        styles[f'category_{category}'] = {'fill': colors[f'category_{category}'], 'border': True}
+    return styles
+
+
+def clean_value(value):
+    """Zet ontbrekende waarden en numpy types om naar waarden die Excel begrijpt."""
+    if value is None:
+        return None
+    if hasattr(value, 'item') and not isinstance(value, str):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def iter_order_rows(order_no, order_info):
+    """
+    Genereer de rijen van één order blok als (waarden, stijlnaam).
+
+    Lege rijen hebben lege waarden en stijl None.
+    """
+    customer = order_info['customer']
+    if order_info.get('customer_name'):
+        customer = f"{customer} - {order_info['customer_name']}"
+
+    backorder = f"Backorder: {order_info['backorder_count']}"
+    if order_info.get('split_count'):
+        backorder += f" (waarvan {order_info['split_count']} deels verzendbaar)"
+    yield [f"Order: {order_no}", f"Klant: {customer}",
+           f"Totaal: {order_info['total_items']}",
+           f"Verzendbaar: {order_info['sendable_count']}",
+           backorder], 'order_header'
+
+    sendable = order_info['sendable']
+    if len(sendable) > 0:
+        yield ["✅ VERZENDBAAR"], 'sendable_label'
+        yield ['Artikelnummer', 'Omschrijving', 'Aantal', 'Beschikbaar'], 'column_header'
+        for item in sendable.to_dict('records'):
+            yield [item['Item No.'], item.get('Description', f'Artikel {item["Item No."]}'),
+                   item['Quantity'], item['Quantity Available']], 'sendable'
+
+    backorder = order_info['backorder']
+    if len(backorder) > 0:
+        yield ["❌ BACKORDER"], 'backorder_label'
+        yield ['Artikelnummer', 'Omschrijving', 'Aantal', 'Beschikbaar', 'Categorie', 'Actie'], 'column_header'
+        for item in backorder.to_dict('records'):
+            category = clean_value(item['Category'])
+            style = f'category_{int(category)}' if category is not None else 'no_category'
+            action = item.get('Category_Action', 'Behoud backorder')
+            # Categorie 4: keten naar het alternatief en of dat geleverd kan worden
+            chain = clean_value(item.get('Alternative_Chain'))
+            if chain is not None:
+                action = f"{action}: {chain} ({item['Alternative_Status']})"
+            yield [item['Item No.'], item.get('Description', f'Artikel {item["Item No."]}'),
+                   item['Quantity'], item['Quantity Available'], item['Category_Name'], action], style
+
+    # Spacing tussen orders
+    yield [], None
+    yield [], None
+
+
+class ColumnWidthTracker:
+    """Houdt per kolom de langste waarde bij voor auto-fit."""
+
+    def __init__(self, max_columns):
+        self.max_lengths = [0] * max_columns
+
+    def update(self, values):
+        for col, value in enumerate(values[:len(self.max_lengths)]):
+            if value:
+                length = len(str(value))
+                if length > self.max_lengths[col]:
+                    self.max_lengths[col] = length
+
+    def widths(self):
+        return [min(length + 2, MAX_COLUMN_WIDTH) for length in self.max_lengths]
+
+
+class OpenpyxlSheetBackend:
+    """openpyxl write-only backend; kolombreedtes moeten vooraf bekend zijn."""
+
+    supports_late_widths = False
+
+    def __init__(self, file_path, sheet_title, styles, column_widths=None):
+        self.file_path = file_path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(sheet_title)
+        self.style_names = {}
+        for name, definition in styles.items():
+            self.style_names[name] = self._register_style(name, definition)
+        # Kolombreedtes moeten in write-only modus vóór de eerste rij gezet worden
+        for col, width in enumerate(column_widths or [], 1):
+            self.ws.column_dimensions[get_column_letter(col)].width = width
+
+    def _register_style(self, name, definition):
+        named_style = NamedStyle(name=f"backorder_{name}")
+        if definition.get('fill'):
+            color = definition['fill']
+            named_style.fill = PatternFill(start_color=color, end_color=color, fill_type='solid')
+        named_style.font = Font(name='Calibri', size=11, bold=definition.get('bold', False),
+                                color=definition.get('font_color'))
+        if definition.get('border'):
+            side = Side(style='thin')
+            named_style.border = Border(left=side, right=side, top=side, bottom=side)
+        self.wb.add_named_style(named_style)
+        return named_style.name
+
+    def append(self, values, style=None):
+        if style is None:
+            self.ws.append(values)
+            return
+        style_name = self.style_names[style]
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(self.ws, value=value)
+            cell.style = style_name
+            cells.append(cell)
+        self.ws.append(cells)
+
+    def close(self, column_widths=None):
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        self.wb.save(self.file_path)
+
+
+class XlsxwriterSheetBackend:
+    """xlsxwriter constant_memory backend; kolombreedtes worden bij afsluiten gezet."""
+
+    supports_late_widths = True
+
+    def __init__(self, file_path, sheet_title, styles, column_widths=None):
+        import xlsxwriter
+
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        self.wb = xlsxwriter.Workbook(file_path, {
+            'constant_memory': True,
+            # Waarden letterlijk overnemen, zoals openpyxl dat doet
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+            'strings_to_numbers': False
+        })
+        self.ws = self.wb.add_worksheet(sheet_title)
+        self.formats = {name: self._register_format(definition) for name, definition in styles.items()}
+        self.row = 0
+        if column_widths:
+            self._set_widths(column_widths)
+
+    def _register_format(self, definition):
+        properties = {'bold': definition.get('bold', False)}
+        if definition.get('fill'):
+            properties.update({'pattern': 1, 'bg_color': f"#{definition['fill']}"})
+        if definition.get('font_color'):
+            properties['font_color'] = f"#{definition['font_color']}"
+        if definition.get('border'):
+            properties['border'] = 1
+        return self.wb.add_format(properties)
+
+    def _set_widths(self, column_widths):
+        for col, width in enumerate(column_widths):
+            self.ws.set_column(col, col, width)
+
+    def append(self, values, style=None):
+        cell_format = self.formats[style] if style is not None else None
+        for col, value in enumerate(values):
+            self.ws.write(self.row, col, value, cell_format)
+        self.row += 1
+
+    def close(self, column_widths=None):
+        if column_widths:
+            self._set_widths(column_widths)
+        self.wb.close()
+
+
+def _create_backend(engine, file_path, sheet_title, styles, column_widths):
+    if resolve_writer_engine(engine) == 'xlsxwriter':
+        return XlsxwriterSheetBackend(file_path, sheet_title, styles, column_widths)
+    return OpenpyxlSheetBackend(file_path, sheet_title, styles, column_widths)
+
+
+def measure_grouped_data(grouped_data, max_columns=6):
+    """Bepaal auto-fit kolombreedtes vooraf (voor backends zonder late breedtes)."""
+    tracker = ColumnWidthTracker(max_columns)
+    for order_no, order_info in grouped_data.items():
+        for values, _ in iter_order_rows(order_no, order_info):
+            tracker.update([clean_value(value) for value in values])
+    return tracker.widths()
+
+
+class AnalysisSheetWriter:
+    """
+    Schrijft orders één voor één naar het 'Backorder Analyse' werkblad.
+
+    column_widths: vaste breedtes; None = auto-fit op basis van de geschreven
+    waarden. Auto-fit kan alleen met xlsxwriter; met openpyxl worden dan de
+    fallback_widths gebruikt (of vooraf meten met measure_grouped_data).
+    """
+
+    def __init__(self, file_path, colors, column_widths=None, fallback_widths=None, engine="auto"):
+        self.file_path = file_path
+        if column_widths is None and resolve_writer_engine(engine) != 'xlsxwriter':
+            column_widths = fallback_widths
+        self.backend = _create_backend(engine, file_path, "Backorder Analyse",
+                                       analysis_styles(colors), column_widths)
+        self.fixed_widths = column_widths is not None
+        self.width_tracker = ColumnWidthTracker(6)
+        self.orders_written = 0
+
+    def write_order(self, order_no, order_info):
+        """Schrijf één order blok (header, verzendbaar en backorder)."""
+        for values, style in iter_order_rows(order_no, order_info):
+            values = [clean_value(value) for value in values]
+            self.width_tracker.update(values)
+            self.backend.append(values, style)
+        self.orders_written += 1
+
+    def close(self):
+        """Sla het werkboek op."""
+        widths = None
+        if not self.fixed_widths and self.backend.supports_late_widths:
+            widths = self.width_tracker.widths()
+        self.backend.close(widths)
+
+
+class EmailSheetWriter:
+    """Schrijft e-mails in batches naar het 'E-mails' werkblad."""
+
+    # Kolommen en breedtes (als de backend niet achteraf kan auto-fitten) per layout
+    LAYOUTS = {
+        'items': (EMAIL_COLUMNS, [15, 15, 15, 30, 10, 12, 50, 50]),
+        'digest': (DIGEST_COLUMNS, [15, 30, 16, 12, 50, 50])
+    }
+
+    def __init__(self, file_path, engine="auto", layout="items"):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Onbekende e-mail layout: {layout} (kies uit {list(self.LAYOUTS)})")
+        self.file_path = file_path
+        self.engine = engine
+        self.layout = layout
+        self.columns, self.default_widths = self.LAYOUTS[layout]
+        self.backend = None
+        self.width_tracker = ColumnWidthTracker(len(self.columns))
+        self.emails_written = 0
+
+    def _open(self):
+        styles = {'column_header': {'bold': True, 'border': True}}
+        widths = None if resolve_writer_engine(self.engine) == 'xlsxwriter' else self.default_widths
+        self.backend = _create_backend(self.engine, self.file_path, "E-mails", styles, widths)
+        self.width_tracker.update(self.columns)
+        self.backend.append(self.columns, 'column_header')
+
+    def write_rows(self, rows):
+        """Voeg rijen toe (in de volgorde van de kolommen van de layout)."""
+        if self.backend is None:
+            self._open()
+        for values in rows:
+            values = [clean_value(value) for value in values]
+            self.width_tracker.update(values)
+            self.backend.append(values)
+        self.emails_written += len(rows)
+
+    def write_frame(self, email_frame):
+        """Voeg e-mails toe uit een DataFrame met de kolommen van de layout."""
+        if len(email_frame) == 0:
+            return
+        self.write_rows(list(email_frame[self.columns].itertuples(index=False, name=None)))
+
+    def write_emails(self, email_report):
+        """Voeg e-mails toe; het bestand wordt pas aangemaakt bij de eerste e-mail."""
+        if not email_report:
+            return
+        self.write_rows([[
+            email['item_data']['Sales Order No.'],
+            email['to'],
+            email['item_data']['Item No.'],
+            email['item_data'].get('Description', f'Artikel {email["item_data"]["Item No."]}'),
+            email['item_data']['Quantity'],
+            email['category'],
+            email['subject'],
+            email['body']
+        ] for email in email_report])
+
+    def close(self):
+        """Sla het werkboek op (alleen als er e-mails geschreven zijn)."""
+        if self.backend is None:
+            return
+        widths = self.width_tracker.widths() if self.backend.supports_late_widths else None
+        self.backend.close(widths)
+
+
+class ChangeSheetWriter:
+    """
+    Schrijft het 'Wijzigingen' werkblad. Verbeteringen (naar verzendbaar) krijgen
+    de verzendbaar kleur, verslechteringen (naar backorder) de backorder kleur.
+    """
+
+    DEFAULT_WIDTHS = [15, 15, 15, 28, 18, 18]
+
+    def __init__(self, file_path, colors, engine="auto"):
+        self.file_path = file_path
+        styles = {
+            'column_header': {'fill': colors['header'], 'bold': True, 'font_color': 'FFFFFF', 'border': True},
+            'improved': {'fill': colors['sendable']},
+            'worsened': {'fill': colors['backorder']}
+        }
+        widths = None if resolve_writer_engine(engine) == 'xlsxwriter' else self.DEFAULT_WIDTHS
+        self.backend = _create_backend(engine, file_path, "Wijzigingen", styles, widths)
+        self.width_tracker = ColumnWidthTracker(len(CHANGE_COLUMNS))
+        self.width_tracker.update(CHANGE_COLUMNS)
+        self.backend.append(CHANGE_COLUMNS, 'column_header')
+        self.changes_written = 0
+
+    def write_frame(self, change_frame, row_styles=None):
+        """
+        Voeg wijzigingen toe uit een DataFrame met CHANGE_COLUMNS.
+
+        row_styles: dict soort wijziging -> stijl ('improved' / 'worsened').
+        """
+        row_styles = row_styles or {}
+        for values in change_frame[CHANGE_COLUMNS].itertuples(index=False, name=None):
+            values = [clean_value(value) for value in values]
+            self.width_tracker.update(values)
+            self.backend.append(values, row_styles.get(values[3]))
+        self.changes_written += len(change_frame)
+
+    def close(self):
+        """Sla het werkboek op."""
+        widths = self.width_tracker.widths() if self.backend.supports_late_widths else None
+        self.backend.close(widths)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Export Cache
+============
+
+Persistente cache voor ingelezen en gemapte Navision exports. Entries worden
+opgeslagen als Parquet (of pickle als pyarrow niet geïnstalleerd is) en zijn
+geadresseerd op de SHA-256 van het bronbestand plus een mapping versie.
+Bij overschrijding van de maximale grootte worden de minst recent gebruikte
+entries verwijderd.
+"""
+
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+# Bestandsextensies die de cache herkent
+CACHE_EXTENSIONS = ['.parquet', '.pkl']
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Bereken de SHA-256 hash van een bestand."""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def parquet_available():
+    """Controleer of pyarrow geïnstalleerd is voor Parquet opslag."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+class ExportCache:
+    def __init__(self, cache_dir="Cache/exports", max_size_mb=500):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+    def key_for(self, file_path, mapping_version):
+        """Bepaal de cache sleutel voor een bronbestand."""
+        return f"{file_sha256(file_path)}_{mapping_version}"
+
+    def _entry_path(self, key):
+        """Zoek het bestaande cache bestand voor een sleutel."""
+        for ext in CACHE_EXTENSIONS:
+            path = os.path.join(self.cache_dir, key + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def get(self, key, filters=None):
+        """
+        Haal een DataFrame uit de cache (None als niet aanwezig).
+
+        filters: pyarrow filters die bij Parquet entries al tijdens het lezen
+        worden toegepast (pushdown); pickle entries worden volledig ingelezen.
+        """
+        path = self._entry_path(key)
+        if path is None:
+            return None
+
+        start = time.perf_counter()
+        try:
+            if path.endswith('.parquet'):
+                df = self._read_parquet(path, filters)
+            else:
+                df = pd.read_pickle(path)
+        except Exception as e:
+            logging.warning(f"Cache entry {os.path.basename(path)} onleesbaar, wordt verwijderd: {e}")
+            self._remove(path)
+            return None
+
+        # Markeer als recent gebruikt voor LRU eviction
+        os.utime(path, None)
+        logging.info(f"Export geladen uit cache in {time.perf_counter() - start:.3f}s ({os.path.basename(path)})")
+        return df
+
+    def parquet_entry(self, key):
+        """
+        Pad van de Parquet entry voor een sleutel (None als er geen is), voor
+        engines die de entry zelf scannen.
+        """
+        path = self._entry_path(key)
+        if path is None or not path.endswith('.parquet'):
+            return None
+        os.utime(path, None)
+        return path
+
+    def row_count(self, key):
+        """
+        Aantal regels van de entry zonder filters, uit de Parquet metadata
+        (None als er geen Parquet entry is).
+        """
+        path = self._entry_path(key)
+        if path is None or not path.endswith('.parquet'):
+            return None
+        import pyarrow.parquet as pq
+        return pq.read_metadata(path).num_rows
+
+    def _read_parquet(self, path, filters):
+        if filters:
+            import pyarrow.parquet as pq
+            # Alleen filters op kolommen die in de entry staan
+            columns = set(pq.read_schema(path).names)
+            filters = [condition for condition in filters if condition[0] in columns]
+        if filters:
+            try:
+                return pd.read_parquet(path, filters=filters)
+            except Exception as e:
+                # Bijvoorbeeld een vergelijking die niet bij het type van de kolom past
+                logging.info(f"Pushdown filters niet toepasbaar, volledige entry inlezen: {e}")
+        return pd.read_parquet(path)
+
+    def put(self, key, df):
+        """Sla een DataFrame op in de cache."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Cache bevat alleen de data, geen metadata van de inleesstap
+        df = df.copy(deep=False)
+        df.attrs = {}
+
+        path = None
+        if parquet_available():
+            path = os.path.join(self.cache_dir, key + '.parquet')
+            try:
+                self._write_atomic(path, lambda tmp: df.to_parquet(tmp, index=False))
+            except Exception as e:
+                logging.warning(f"Parquet opslag mislukt, terugvallen op pickle: {e}")
+                path = None
+        if path is None:
+            path = os.path.join(self.cache_dir, key + '.pkl')
+            self._write_atomic(path, lambda tmp: df.to_pickle(tmp))
+
+        logging.info(f"Export opgeslagen in cache: {os.path.basename(path)}")
+        self.evict()
+        return path
+
+    def _write_atomic(self, path, writer):
+        """Schrijf via een tijdelijk bestand zodat een half geschreven entry nooit zichtbaar is."""
+        # Proces en thread in de naam: gelijktijdige analyses van dezelfde export
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def entries(self):
+        """Geef alle cache entries als (pad, grootte, laatst gebruikt), oudste eerst."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        result = []
+        for name in os.listdir(self.cache_dir):
+            if os.path.splitext(name)[1] not in CACHE_EXTENSIONS:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            result.append((path, stat.st_size, stat.st_mtime))
+        return sorted(result, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Verwijder minst recent gebruikte entries tot de cache binnen de maximale grootte valt."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        if removed:
+            logging.info(f"Cache opgeschoond: {removed} entries verwijderd")
+        return removed
+
+    def clear(self):
+        """Verwijder alle cache entries."""
+        entries = self.entries()
+        for path, _, _ in entries:
+            self._remove(path)
+        logging.info(f"Cache gewist: {len(entries)} entries verwijderd")
+        return len(entries)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Filter Spec
+===========
+
+Declaratieve filters op de export, gecompileerd tot één gecombineerd masker.
+Per kolom een criterium:
+
+    "DSV"                        gelijk aan
+    ["DSV", "NL01"]              één van
+    {"not": "Cancelled"}         niet gelijk aan (ook met een lijst: geen van)
+    {">": 0, "<=": 10}           numerieke vergelijkingen (">", ">=", "<", "<=", "==", "!=")
+
+Een lege waarde ("", None of een lege lijst) betekent: niet filteren.
+
+Categorical kolommen worden per categorie geëvalueerd en daarna via de codes
+naar de regels vertaald. Kolommen die niet in de export staan (vaste default
+waarde) worden één keer op de default geëvalueerd. Waar de bron het
+ondersteunt (Parquet cache) worden de criteria als pushdown filters
+meegegeven, zodat weggefilterde regels niet eens ingelezen worden.
+"""
+
+import operator
+
+import numpy as np
+import pandas as pd
+
+# Vergelijkingen die in een criterium gebruikt kunnen worden
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+
+def is_empty_criterion(criterion):
+    """Lege criteria filteren niet."""
+    if criterion is None:
+        return True
+    if isinstance(criterion, (str, list, tuple, set, dict)):
+        return len(criterion) == 0
+    return False
+
+
+class Predicate:
+    """Eén criterium op één kolom."""
+
+    def __init__(self, column, criterion):
+        self.column = column
+        self.values = None
+        self.negate = False
+        self.comparisons = []
+
+        if isinstance(criterion, dict):
+            for key, value in criterion.items():
+                if key == 'not':
+                    self.negate = True
+                    self.values = self._as_list(value)
+                elif key in COMPARISONS:
+                    self.comparisons.append((key, value))
+                else:
+                    raise ValueError(f"Filter op '{column}': onbekende operator {key!r} "
+                                     f"(kies uit {['not'] + list(COMPARISONS)})")
+        else:
+            self.values = self._as_list(criterion)
+
+    @staticmethod
+    def _as_list(value):
+        return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+    def describe(self):
+        parts = []
+        if self.values is not None:
+            values = ', '.join(str(value) for value in self.values)
+            parts.append(f"niet in [{values}]" if self.negate else f"in [{values}]")
+        parts.extend(f"{key} {value}" for key, value in self.comparisons)
+        return f"{self.column} {' en '.join(parts)}"
+
+    def evaluate(self, values):
+        """Evalueer op een Series (of numpy array) zonder categorical codes."""
+        mask = np.ones(len(values), dtype=bool)
+        if self.values is not None:
+            matches = pd.Series(values).isin(self.values).to_numpy()
+            mask &= ~matches if self.negate else matches
+        for key, value in self.comparisons:
+            result = COMPARISONS[key](pd.Series(values), value)
+            mask &= result.fillna(False).to_numpy(dtype=bool)
+        return mask
+
+    def evaluate_scalar(self, value):
+        return bool(self.evaluate(pd.Series([value], dtype=object))[0])
+
+    def mask(self, column_values):
+        """
+        Masker voor een kolom. column_values is een Series, of een scalar als de
+        kolom niet aangemaakt is (vaste default waarde).
+        """
+        if not isinstance(column_values, pd.Series):
+            return self.evaluate_scalar(column_values)
+        if isinstance(column_values.dtype, pd.CategoricalDtype):
+            # Eén evaluatie per categorie; code -1 (ontbrekend) krijgt de uitkomst voor NaN
+            categories = column_values.cat.categories
+            category_mask = np.append(self.evaluate(pd.Series(categories, dtype=object)),
+                                      self.evaluate_scalar(np.nan))
+            return category_mask[column_values.cat.codes.to_numpy()]
+        return self.evaluate(column_values)
+
+    def pushdown(self):
+        """
+        Criterium als pyarrow filters (lijst van (kolom, operator, waarde)).
+
+        Een 'not' criterium wordt niet doorgegeven: pyarrow laat dan ook lege
+        waarden weg, terwijl het masker die behoudt.
+        """
+        filters = []
+        if self.values is not None:
+            if self.negate:
+                return []
+            filters.append((self.column, 'in', list(self.values)))
+        filters.extend((self.column, key, value) for key, value in self.comparisons)
+        return filters
+
+
+class CompiledFilter:
+    """Alle criteria, geëvalueerd als één gecombineerd masker."""
+
+    def __init__(self, spec):
+        self.predicates = [Predicate(column, criterion) for column, criterion in (spec or {}).items()
+                           if not is_empty_criterion(criterion)]
+
+    def __bool__(self):
+        return bool(self.predicates)
+
+    def describe(self):
+        return [predicate.describe() for predicate in self.predicates]
+
+    def mask(self, df, column_values):
+        """
+        Gecombineerd masker (numpy bool array) voor df.
+
+        column_values(df, kolom) geeft de kolom of de default waarde als scalar.
+        Geeft ook het aantal regels per criterium terug voor de log.
+        """
+        mask = np.ones(len(df), dtype=bool)
+        counts = []
+        for predicate in self.predicates:
+            # Een scalar (kolom met vaste default) geldt voor alle regels
+            predicate_mask = np.broadcast_to(predicate.mask(column_values(df, predicate.column)), len(df))
+            mask &= predicate_mask
+            counts.append((predicate.describe(), int(predicate_mask.sum())))
+        return mask, counts
+
+    def pushdown(self, columns=None):
+        """
+        pyarrow filters voor de criteria (alleen op columns als die opgegeven
+        zijn); None als er niets door te geven is.
+        """
+        filters = []
+        for predicate in self.predicates:
+            if columns is None or predicate.column in columns:
+                filters.extend(predicate.pushdown())
+        return filters or None
+
+
+def compile_filter(spec):
+    """Compileer een filter spec (dict kolom -> criterium)."""
+    return CompiledFilter(spec)
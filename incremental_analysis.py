@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Incrementele Analyse
+====================
+
+Van dag tot dag verandert het grootste deel van de orders in de export niet.
+In incrementele modus krijgt elke order een fingerprint over zijn regels
+(ordernummer, klant, artikel, aantal, beschikbaar, in volgorde). De
+fingerprints, categorieën en e-mails van de vorige run worden bewaard;
+alleen nieuwe of gewijzigde orders worden opnieuw gecategoriseerd en krijgen
+nieuwe e-mails, voor de rest worden de resultaten van de vorige run gebruikt.
+
+De bewaarde resultaten gelden alleen voor dezelfde configuratie: bij een
+andere categorie versie, andere templates of een andere e-mail modus wordt
+alles opnieuw berekend.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# Kolommen die samen de inhoud van een orderregel bepalen
+FINGERPRINT_COLUMNS = ['Sales Order No.', 'Customer Name', 'Item No.', 'Quantity', 'Quantity Available']
+
+# Gecachete categorie kolommen per backorder regel
+CATEGORY_COLUMNS = ['Category', 'Category_Name', 'Category_Action']
+
+# Menger voor de positie van een regel binnen de order (gulden snede constante)
+POSITION_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def order_fingerprints(df):
+    """
+    Fingerprint per order en regelnummer (positie binnen de order) per regel.
+
+    Geeft (fingerprints, regelnummers) terug: een Series per ordernummer en een
+    Series met dezelfde index als df.
+    """
+    # Regels zonder ordernummer worden niet gegroepeerd
+    df = df[df['Sales Order No.'].notna()]
+    keys = df[FINGERPRINT_COLUMNS].copy(deep=False)
+    # Aantallen als float64 zodat het gekozen (verkleinde) type niet meetelt
+    for col in ['Quantity', 'Quantity Available']:
+        keys[col] = keys[col].astype('float64')
+    line_hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+    orders = df['Sales Order No.']
+    line_numbers = orders.groupby(orders, sort=False, observed=True).cumcount()
+    # Volgorde telt mee: regel hash gemengd met de positie en opnieuw gehasht
+    with np.errstate(over='ignore'):
+        mixed = line_hashes ^ (line_numbers.to_numpy().astype(np.uint64) * POSITION_MIX)
+    positioned = pd.Series(pd.util.hash_array(mixed), index=df.index)
+    fingerprints = positioned.groupby(orders, sort=False, observed=True).sum()
+    fingerprints.index = fingerprints.index.astype(str)
+    return fingerprints, line_numbers
+
+
+class IncrementalState:
+    """Fingerprints en resultaten van de vorige run, per naam bewaard in state_dir."""
+
+    def __init__(self, state_dir="Cache/incremental", name="default"):
+        self.path = os.path.join(state_dir, f"{name}.pkl")
+        self.previous = self._load()
+        self.key = None
+        self.fingerprints = None
+        self.line_numbers = None
+        self.reused_orders = set()
+        self.changed_orders = set()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            return pd.read_pickle(self.path)
+        except Exception as e:
+            logging.warning(f"Incrementele staat {self.path} onleesbaar, alles wordt opnieuw berekend: {e}")
+            return None
+
+    @staticmethod
+    def make_key(**settings):
+        """Sleutel van de configuratie waarvoor bewaarde resultaten geldig zijn."""
+        return json.dumps(settings, sort_keys=True, default=str)
+
+    def cached_categories(self, df, key):
+        """
+        Bepaal welke orders ongewijzigd zijn en geef hun bewaarde categorieën.
+
+        Geeft een DataFrame met de categorie kolommen voor de backorder regels
+        van ongewijzigde orders, met dezelfde index als die regels in df.
+        """
+        self.key = key
+        self.fingerprints, self.line_numbers = order_fingerprints(df)
+        orders = set(self.fingerprints.index)
+
+        previous = self.previous
+        if previous is None or previous.get('key') != key:
+            if previous is not None:
+                logging.info("Configuratie gewijzigd sinds de vorige run, alle orders worden opnieuw berekend")
+            self.reused_orders, self.changed_orders = set(), orders
+            return None
+
+        old = previous['fingerprints']
+        common = self.fingerprints.index.intersection(old.index)
+        unchanged = self.fingerprints.loc[common].to_numpy() == old.loc[common].to_numpy()
+        self.reused_orders = set(common[unchanged])
+        self.changed_orders = orders - self.reused_orders
+        logging.info(f"Incrementeel: {len(self.reused_orders)} orders hergebruikt, "
+                     f"{len(self.changed_orders)} nieuw of gewijzigd")
+        if not self.reused_orders:
+            return None
+
+        # Regels van ongewijzigde orders koppelen aan hun bewaarde categorie via (order, regelnummer)
+        order_text = df.loc[self.line_numbers.index, 'Sales Order No.'].astype(str)
+        lines = pd.DataFrame({'order': order_text.to_numpy(), 'line': self.line_numbers.to_numpy()},
+                             index=self.line_numbers.index)
+        lines = lines[lines['order'].isin(self.reused_orders).to_numpy()]
+        merged = lines.reset_index().merge(previous['categories'], on=['order', 'line'], how='inner')
+        return merged.set_index(merged.columns[0])[CATEGORY_COLUMNS].rename_axis(df.index.name)
+
+    def changed_subset(self, grouped_data):
+        """Alleen de nieuwe of gewijzigde orders uit grouped_data."""
+        return {order_no: order_info for order_no, order_info in grouped_data.items()
+                if str(order_no) in self.changed_orders}
+
+    def merge_emails(self, grouped_data, new_rows):
+        """
+        E-mail rapport (één rij per artikel) van de nieuwe rijen plus de bewaarde
+        rijen van ongewijzigde orders, in de volgorde van grouped_data.
+        """
+        previous = self.previous
+        if previous is None or previous.get('key') != self.key or previous.get('emails') is None:
+            return new_rows
+        cached = previous['emails']
+        cached = cached[cached['Ordernummer'].astype(str).isin(self.reused_orders)]
+        if len(cached) == 0:
+            return new_rows
+        combined = pd.concat([cached, new_rows], ignore_index=True)
+        rank = {str(order_no): position for position, order_no in enumerate(grouped_data)}
+        order_rank = combined['Ordernummer'].astype(str).map(rank)
+        return combined.iloc[np.argsort(order_rank.to_numpy(), kind='stable')].reset_index(drop=True)
+
+    def save(self, grouped_data, emails=None):
+        """Bewaar fingerprints, categorieën en (optioneel) e-mails van deze run."""
+        frames = []
+        for order_no, order_info in grouped_data.items():
+            backorder = order_info['backorder']
+            if len(backorder) == 0 or 'Category' not in backorder.columns:
+                continue
+            frames.append(pd.DataFrame({
+                'order': str(order_no),
+                'line': self.line_numbers.loc[backorder.index].to_numpy(),
+                **{col: backorder[col].to_numpy(dtype=object) for col in CATEGORY_COLUMNS}
+            }))
+        categories = (pd.concat(frames, ignore_index=True) if frames
+                      else pd.DataFrame(columns=['order', 'line'] + CATEGORY_COLUMNS))
+        state = {
+            'key': self.key,
+            'fingerprints': self.fingerprints,
+            'categories': categories,
+            'emails': emails
+        }
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            pd.to_pickle(state, tmp_path)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.previous = state
+        logging.info(f"Incrementele staat opgeslagen: {len(self.fingerprints)} orders ({self.path})")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Lokale SMTP Server
+==================
+
+Eenvoudige SMTP server om de e-mail outbox lokaal te testen zonder echte
+e-mails te versturen. Ontvangen berichten worden in het geheugen bewaard
+(en op het scherm getoond bij gebruik vanaf de command line). Met
+fail_every kan een tijdelijke fout (451) gesimuleerd worden om retries te
+testen.
+
+Gebruik:
+    python local_smtp_server.py --port 1025
+
+Als aiosmtpd geïnstalleerd is kan ook `python -m aiosmtpd -n -l localhost:1025`
+gebruikt worden.
+"""
+
+import email
+import email.policy
+import logging
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Verwerkt één SMTP sessie (HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT)."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode('utf-8'))
+
+    def handle(self):
+        server = self.server
+        self.reply("220 localhost Lokale SMTP server")
+        sender = None
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', errors='replace').strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self.reply("250-localhost")
+                self.reply("250-8BITMIME")
+                self.reply("250 SMTPUTF8")
+            elif verb == 'HELO':
+                self.reply("250 localhost")
+            elif verb == 'MAIL':
+                sender = command.split(':', 1)[1].strip().split(' ')[0].strip('<>')
+                recipients = []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 Einde met <CRLF>.<CRLF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    if data_line.startswith(b".."):
+                        data_line = data_line[1:]
+                    data.append(data_line)
+                if server.delay:
+                    time.sleep(server.delay)
+                if server.should_fail():
+                    self.reply("451 Tijdelijke fout (gesimuleerd)")
+                else:
+                    server.store(sender, recipients, b"".join(data))
+                    self.reply("250 OK")
+                sender = None
+                recipients = []
+            elif verb == 'RSET':
+                sender = None
+                recipients = []
+                self.reply("250 OK")
+            elif verb == 'NOOP':
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Tot ziens")
+                return
+            else:
+                self.reply("502 Commando niet geïmplementeerd")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="localhost", port=0, fail_every=0, delay=0.0, echo=False):
+        super().__init__((host, port), _SMTPHandler)
+        self.fail_every = fail_every
+        self.delay = delay
+        self.echo = echo
+        self.messages = []
+        self.data_commands = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server_address[0], self.server_address[1]
+
+    def should_fail(self):
+        """Simuleer een tijdelijke fout voor elke fail_every-ste DATA opdracht."""
+        with self._lock:
+            self.data_commands += 1
+            return bool(self.fail_every) and self.data_commands % self.fail_every == 0
+
+    def store(self, sender, recipients, raw):
+        message = email.message_from_bytes(raw, policy=email.policy.default)
+        with self._lock:
+            self.messages.append({'from': sender, 'to': list(recipients), 'message': message})
+        if self.echo:
+            logging.info(f"Ontvangen: {message['Subject']} -> {', '.join(recipients)}")
+
+    def start(self):
+        """Start de server in een achtergrond thread; geeft (host, poort) terug."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lokale SMTP server voor het testen van de e-mail outbox")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--fail-every", type=int, default=0, help="Geef elke N-de e-mail een tijdelijke fout (451)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = LocalSMTPServer(args.host, args.port, fail_every=args.fail_every, echo=True)
+    logging.info(f"Lokale SMTP server luistert op {args.host}:{args.port} (Ctrl+C om te stoppen)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"{len(server.messages)} e-mails ontvangen")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Stamgegevens
+============
+
+Optionele artikel- en dealerbestanden (.xlsx of .csv) die op de export
+gekoppeld worden: de omschrijving per artikel en de naam per dealer. Zonder
+deze bestanden toont de analyse 'Artikel <nummer>' en de dealercode.
+
+Een ingelezen bestand wordt als opzoektabel (sleutel -> waarde) in de cache
+bewaard, geadresseerd op de SHA-256 van het bestand en de gekozen kolommen.
+Binnen één proces wordt de tabel hergebruikt zolang het bestand niet
+verandert. De koppeling zelf is één opzoekactie per unieke sleutel in de
+export.
+"""
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from export_cache import ExportCache, file_sha256
+from navision_reader import read_export
+
+# Verhoog bij wijzigingen in het inlezen, zodat oude cache entries niet meer gebruikt worden
+MASTER_CACHE_VERSION = 1
+
+# Ingelezen tabellen in dit proces: (pad, kolommen) -> (signatuur, cache sleutel, tabel)
+_loaded_tables = {}
+
+
+def read_master_file(file_path, key_column, value_column, engine="auto"):
+    """Lees de sleutel- en waardekolom van een stambestand (.xlsx/.xls/.csv) als tekst."""
+    columns = [key_column, value_column]
+    if file_path.lower().endswith(('.csv', '.txt')):
+        # Scheidingsteken (; of ,) automatisch herkennen
+        df = pd.read_csv(file_path, sep=None, engine='python', dtype=str,
+                         usecols=lambda col: col in columns)
+    else:
+        df, _ = read_export(file_path, columns=columns, dtypes={column: str for column in columns}, engine=engine)
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Kolommen {missing} ontbreken in {file_path} (beschikbaar: {list(df.columns)})")
+    return df[columns]
+
+
+class MasterTable:
+    """Opzoektabel sleutel -> waarde uit een stambestand, gecachet op de hash van het bestand."""
+
+    def __init__(self, file_path, key_column, value_column, cache_dir="Cache/master", engine="auto"):
+        self.file_path = file_path
+        self.key_column = key_column
+        self.value_column = value_column
+        self.cache = ExportCache(cache_dir)
+        self.engine = engine
+        self.cache_key, self.table = self._load()
+
+    def _cache_key(self):
+        columns = f"{MASTER_CACHE_VERSION}|{self.key_column}|{self.value_column}"
+        return f"{file_sha256(self.file_path)}_{hashlib.sha256(columns.encode('utf-8')).hexdigest()[:12]}"
+
+    def _load(self):
+        stat = os.stat(self.file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        memo_key = (os.path.abspath(self.file_path), self.key_column, self.value_column)
+        loaded = _loaded_tables.get(memo_key)
+        if loaded is not None and loaded[0] == signature:
+            return loaded[1], loaded[2]
+
+        cache_key = self._cache_key()
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            table = cached.set_index('key')['value']
+        else:
+            df = read_master_file(self.file_path, self.key_column, self.value_column, self.engine)
+            keys = df[self.key_column].str.strip()
+            frame = pd.DataFrame({'key': keys, 'value': df[self.value_column].str.strip()})
+            # Lege sleutels overslaan; bij dubbele sleutels telt de eerste
+            frame = frame[frame['key'].notna() & (frame['key'] != '')].drop_duplicates('key')
+            self.cache.put(cache_key, frame)
+            table = frame.set_index('key')['value']
+            logging.info(f"Stamgegevens ingelezen: {self.file_path} ({len(table)} sleutels)")
+
+        _loaded_tables[memo_key] = (signature, cache_key, table)
+        return cache_key, table
+
+    @property
+    def version(self):
+        """Versie van de tabel (voor caches van analyseresultaten)."""
+        return self.cache_key
+
+    def lookup(self, keys, missing_format=None):
+        """
+        Waarde per sleutel als numpy object array, met één opzoekactie per unieke sleutel.
+
+        missing_format: tekst voor onbekende sleutels, bijvoorbeeld "Artikel {key}"
+        (None = geen waarde).
+        """
+        codes, uniques = pd.factorize(pd.Series(keys), use_na_sentinel=True)
+        unique_keys = pd.Index(np.asarray(uniques, dtype=object)).astype(str)
+        values = self.table.reindex(unique_keys).to_numpy(dtype=object)
+        found = ~pd.isna(values)
+        if missing_format is not None:
+            values[~found] = [missing_format.format(key=key) for key in unique_keys[~found]]
+        else:
+            values[~found] = None
+        logging.info(f"Stamgegevens {os.path.basename(self.file_path)}: "
+                     f"{int(found.sum())} van {len(unique_keys)} sleutels gevonden")
+        # Code -1 (ontbrekende sleutel) wijst naar het laatste vak
+        return np.append(values, None)[codes]
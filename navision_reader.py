@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Navision Reader
+===============
+
+Inleeslaag voor Navision exports. Kiest een snelle Excel engine (calamine) als
+die beschikbaar is en valt terug op openpyxl. Alleen de kolommen die de
+analyse gebruikt worden ingelezen, met vaste dtypes voor de identificatie
+kolommen.
+"""
+
+import importlib.util
+import logging
+import time
+
+import pandas as pd
+
+# Engines in volgorde van voorkeur
+READER_ENGINES = ['calamine', 'openpyxl']
+
+# Module die per engine geïnstalleerd moet zijn
+ENGINE_MODULES = {
+    'calamine': 'python_calamine',
+    'openpyxl': 'openpyxl'
+}
+
+
+def engine_available(engine):
+    """Controleer of een engine geïnstalleerd is en door pandas ondersteund wordt."""
+    module_name = ENGINE_MODULES.get(engine)
+    if module_name is None:
+        return False
+    if importlib.util.find_spec(module_name) is None:
+        return False
+    if engine == 'calamine':
+        # pandas ondersteunt calamine pas vanaf versie 2.2
+        major, minor = (int(part) for part in pd.__version__.split('.')[:2])
+        return (major, minor) >= (2, 2)
+    return True
+
+
+def available_engines():
+    """Geef alle beschikbare engines terug in volgorde van voorkeur."""
+    return [engine for engine in READER_ENGINES if engine_available(engine)]
+
+
+def resolve_engines(preferred="auto"):
+    """Bepaal de volgorde waarin engines geprobeerd worden."""
+    engines = available_engines()
+    if not preferred or preferred == "auto":
+        return engines
+    if preferred not in READER_ENGINES:
+        raise ValueError(f"Onbekende Excel engine: {preferred} (kies uit {READER_ENGINES})")
+    if preferred not in engines:
+        logging.warning(f"Excel engine '{preferred}' niet beschikbaar, terugvallen op {engines}")
+        return engines
+    # Gekozen engine eerst, de rest blijft beschikbaar als fallback
+    return [preferred] + [engine for engine in engines if engine != preferred]
+
+
+def read_export(file_path, columns=None, dtypes=None, engine="auto"):
+    """
+    Lees een Navision export in.
+
+    columns: kolomnamen die ingelezen moeten worden (None = alle kolommen).
+    Kolommen die niet in het bestand staan worden genegeerd.
+    dtypes: dict met dtype per kolomnaam.
+
+    Geeft (DataFrame, info) terug, waarbij info de gebruikte engine en de
+    parse tijd in seconden bevat.
+    """
+    engines = resolve_engines(engine)
+    if not engines:
+        raise RuntimeError("Geen Excel engine beschikbaar (installeer python-calamine of openpyxl)")
+
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda col: col in wanted
+
+    last_error = None
+    for engine_name in engines:
+        start = time.perf_counter()
+        try:
+            df = pd.read_excel(file_path, engine=engine_name, usecols=usecols, dtype=dtypes)
+        except OSError:
+            # Bestand niet gevonden of niet leesbaar: geen zin om een andere engine te proberen
+            raise
+        except Exception as e:
+            # Engine kan dit bestand niet lezen, probeer de volgende
+            logging.warning(f"Excel engine '{engine_name}' faalde: {e}")
+            last_error = e
+            continue
+
+        info = {
+            'engine': engine_name,
+            'seconds': time.perf_counter() - start,
+            'rows': len(df),
+            'columns': list(df.columns)
+        }
+        logging.info(f"Export ingelezen met engine '{engine_name}' in {info['seconds']:.2f}s "
+                     f"({info['rows']} rijen, {len(info['columns'])} kolommen)")
+        return df, info
+
+    raise last_error
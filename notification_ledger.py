@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Notification Ledger
+===================
+
+Persistente administratie (SQLite) van dealer notificaties die al gemaakt
+zijn, zodat een dagelijkse run alleen nieuwe e-mails oplevert. Een notificatie
+is uniek op (ordernummer, artikelnummer, categorie, template versie); een
+gewijzigde template levert dus opnieuw een e-mail op.
+
+Kandidaten worden in één batch tegen de ledger gehouden (anti-join via een
+tijdelijke tabel op de primaire sleutel), zodat de kosten per kandidaat niet
+afhangen van de grootte van de ledger. Notificaties ouder dan de bewaartermijn
+worden opgeruimd.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    order_no TEXT NOT NULL,
+    item_no TEXT NOT NULL,
+    category INTEGER NOT NULL,
+    template_version TEXT NOT NULL,
+    produced_at REAL NOT NULL,
+    PRIMARY KEY (order_no, item_no, category, template_version)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS notifications_produced_at ON notifications (produced_at);
+"""
+
+# Bij opruimen van meer dan dit deel van de ledger wordt het bestand ook verkleind (VACUUM)
+VACUUM_FRACTION = 0.1
+
+
+class NotificationLedger:
+    def __init__(self, db_path="Cache/notification_ledger.sqlite", retention_days=90):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS candidates ("
+            "pos INTEGER PRIMARY KEY, order_no TEXT, item_no TEXT, category INTEGER, template_version TEXT)")
+        # Nieuwe notificaties van deze run, vastgelegd bij commit()
+        self._staged = []
+
+    @staticmethod
+    def _keys(lines, versions):
+        """Sleutels (order, artikel, categorie, template versie) voor elke regel."""
+        categories = [int(category) for category in lines['Category']]
+        return list(zip(
+            (str(order_no) for order_no in lines['Sales Order No.']),
+            (str(item_no) for item_no in lines['Item No.']),
+            categories,
+            (versions.get(category, '') for category in categories)
+        ))
+
+    def exclude_notified(self, lines, versions):
+        """
+        Geef alleen de regels terug waarvoor nog geen notificatie gemaakt is.
+
+        versions: template versie per categorie. De nieuwe regels worden
+        klaargezet en pas met commit() in de ledger vastgelegd.
+        """
+        if len(lines) == 0:
+            return lines
+        keys = self._keys(lines, versions)
+        with self.connection:
+            self.connection.execute("DELETE FROM candidates")
+            self.connection.executemany(
+                "INSERT INTO candidates VALUES (?, ?, ?, ?, ?)",
+                ((pos, *key) for pos, key in enumerate(keys)))
+            new_positions = [row[0] for row in self.connection.execute(
+                "SELECT c.pos FROM candidates c WHERE NOT EXISTS ("
+                "SELECT 1 FROM notifications n WHERE n.order_no = c.order_no AND n.item_no = c.item_no "
+                "AND n.category = c.category AND n.template_version = c.template_version) ORDER BY c.pos")]
+            self.connection.execute("DELETE FROM candidates")
+
+        skipped = len(keys) - len(new_positions)
+        if skipped:
+            logging.info(f"{skipped} notificaties al eerder gemaakt, overgeslagen")
+        self._staged.extend(keys[pos] for pos in new_positions)
+        return lines.iloc[np.asarray(new_positions, dtype=np.intp)]
+
+    def commit(self):
+        """Leg de klaargezette notificaties vast en ruim verlopen notificaties op."""
+        produced_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO notifications VALUES (?, ?, ?, ?, ?)",
+                ((*key, produced_at) for key in self._staged))
+        recorded = len(self._staged)
+        self._staged = []
+        if recorded:
+            logging.info(f"{recorded} notificaties vastgelegd in {self.db_path}")
+        self.prune()
+        return recorded
+
+    def discard(self):
+        """Vergeet de klaargezette notificaties (bijvoorbeeld als wegschrijven mislukte)."""
+        self._staged = []
+
+    def prune(self, retention_days=None):
+        """Verwijder notificaties ouder dan de bewaartermijn; verklein het bestand na grote opruimingen."""
+        retention_days = self.retention_days if retention_days is None else retention_days
+        if not retention_days:
+            return 0
+        cutoff = time.time() - retention_days * 86400
+        with self.connection:
+            removed = self.connection.execute(
+                "DELETE FROM notifications WHERE produced_at < ?", (cutoff,)).rowcount
+        if removed:
+            remaining = self.count()
+            logging.info(f"Notification ledger opgeschoond: {removed} notificaties ouder dan {retention_days} dagen")
+            if removed > VACUUM_FRACTION * (remaining + removed):
+                self.connection.execute("VACUUM")
+        return removed
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+
+    def clear(self):
+        """Verwijder alle notificaties (volgende run maakt alle e-mails opnieuw)."""
+        with self.connection:
+            removed = self.connection.execute("DELETE FROM notifications").rowcount
+        self.connection.execute("VACUUM")
+        logging.info(f"Notification ledger gewist: {removed} notificaties verwijderd")
+        return removed
+
+    def close(self):
+        self.connection.close()
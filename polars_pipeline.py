@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Polars Engine
+=============
+
+Alternatieve engine (--engine polars) voor het inlezen, filteren en groeperen
+van de export. De stappen worden als één lazy query plan uitgedrukt: een
+Parquet cache entry wordt gescand met projection en predicate pushdown, de
+filters uit de filter spec worden polars expressies en het plan wordt
+multi-threaded met de streaming engine uitgevoerd. Tellingen per order en de
+posities van de regels per order komen uit een group_by in hetzelfde soort plan.
+
+Categorie regels, voorraad toewijzing, alternatieven en de Excel/e-mail output
+zijn gedeeld met de pandas engine; het resultaat (grouped_data) is gelijk.
+Zonder cache entry wordt de export via de gewone inleeslaag gelezen en daarna
+als lazy frame verwerkt.
+"""
+
+import importlib.metadata
+import importlib.util
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+from filter_spec import COMPARISONS, compile_filter
+
+# Engines die gekozen kunnen worden
+ENGINES = ['pandas', 'polars']
+
+# collect_all(engine='streaming') bestaat sinds polars 1.25.2 (zie requirements.txt)
+POLARS_MIN_VERSION = (1, 25, 2)
+
+
+def polars_available():
+    """Controleer of polars geïnstalleerd is, in minimaal POLARS_MIN_VERSION."""
+    if importlib.util.find_spec('polars') is None:
+        return False
+    version = importlib.metadata.version('polars')
+    parts = tuple(int(part) for part in re.findall(r'\d+', version)[:3])
+    return parts >= POLARS_MIN_VERSION
+
+
+def resolve_engine(engine):
+    """Gekozen engine, of 'pandas' als polars niet (in de juiste versie) geïnstalleerd is."""
+    if engine not in ENGINES:
+        raise ValueError(f"Onbekende engine: {engine!r} (kies uit {ENGINES})")
+    if engine == 'polars' and not polars_available():
+        logging.warning("polars is niet geïnstalleerd (of ouder dan "
+                        f"{'.'.join(map(str, POLARS_MIN_VERSION))}), terugvallen op de pandas engine")
+        return 'pandas'
+    return engine
+
+
+def scan_export(file_path, use_cache=True):
+    """
+    LazyFrame van de gevalideerde export: de Parquet cache entry als die er is,
+    anders ingelezen via load_export (dat de cache vult voor de volgende run).
+    """
+    import polars as pl
+
+    import backorder_analyzer as analyzer
+
+    if use_cache and analyzer.EXPORT_CACHE_ENABLED:
+        cache = analyzer.get_export_cache()
+        path = cache.parquet_entry(cache.key_for(file_path, analyzer.get_mapping_version()))
+        if path is not None:
+            logging.info(f"Polars: export gescand uit cache ({path})")
+            return pl.scan_parquet(path)
+    return pl.from_pandas(analyzer.load_export(file_path, use_cache=use_cache)).lazy()
+
+
+def predicate_expression(predicate, schema, defaults):
+    """Eén filter criterium als polars expressie (zelfde uitkomst als Predicate.mask)."""
+    import polars as pl
+
+    if predicate.column not in schema:
+        # Kolom met vaste default waarde: één evaluatie voor alle regels
+        return pl.lit(predicate.evaluate_scalar(defaults[predicate.column]))
+
+    column = pl.col(predicate.column)
+    expression = pl.lit(True)
+    if predicate.values is not None:
+        present = [value for value in predicate.values if not pd.isna(value)]
+        matches = column.is_in(present).fill_null(False)
+        if len(present) < len(predicate.values):
+            # isin in pandas laat een lege waarde in de lijst ook lege cellen matchen
+            matches = matches | column.is_null()
+        expression = expression & (~matches if predicate.negate else matches)
+    for key, value in predicate.comparisons:
+        expression = expression & COMPARISONS[key](column, value).fill_null(False)
+    return expression
+
+
+def filter_plan(lf, filter_spec):
+    """Projectie op de verplichte kolommen plus alle filter criteria als één predicaat."""
+    import polars as pl
+
+    import backorder_analyzer as analyzer
+
+    schema = lf.collect_schema()
+    compiled = compile_filter(filter_spec)
+    unknown_columns = [predicate.column for predicate in compiled.predicates
+                       if predicate.column not in schema and predicate.column not in analyzer.COLUMN_DEFAULTS]
+    if unknown_columns:
+        raise ValueError(f"Filter op onbekende kolom(men): {unknown_columns}")
+
+    lf = lf.select([column for column in schema.names() if column in analyzer.REQUIRED_COLUMNS])
+    if compiled:
+        for description in compiled.describe():
+            logging.info(f"Filter {description}")
+        lf = lf.filter(pl.all_horizontal([predicate_expression(predicate, schema, analyzer.COLUMN_DEFAULTS)
+                                          for predicate in compiled.predicates]))
+    return lf
+
+
+def load_filtered_export(file_path, use_cache=True, filter_spec=None):
+    """
+    Inlezen en filteren als lazy plan, uitgevoerd met de streaming engine.
+    Geeft (gefilterde pandas DataFrame, aantal ingelezen regels) terug.
+    """
+    import polars as pl
+
+    import backorder_analyzer as analyzer
+
+    lf = scan_export(file_path, use_cache)
+    plan = filter_plan(lf, analyzer.get_filter_spec() if filter_spec is None else filter_spec)
+    logging.debug(f"Polars query plan:\n{plan.explain()}")
+
+    # Aantal regels komt bij Parquet uit de metadata
+    rows_read, filtered = pl.collect_all([lf.select(pl.len()), plan], engine='streaming')
+    rows_read = rows_read.item()
+    # Aantallen houden het (verkleinde) type van de bron; identificaties als categorical
+    df = filtered.to_pandas()
+    for column in analyzer.CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    logging.info(f"Filtering voltooid (polars): {rows_read} -> {len(df)} rijen")
+    return df, rows_read
+
+
+def _positions(frame):
+    """Dict order -> numpy array met posities uit een (order, lijst van posities) frame."""
+    lengths = frame['position'].list.len().to_numpy()
+    positions = np.split(frame['position'].explode().to_numpy(), np.cumsum(lengths)[:-1])
+    return dict(zip(frame['order'].to_list(), positions))
+
+
+def order_layout(orders, sendable_mask, backorder_mask, split_mask, ba_hp_mask):
+    """
+    Tellingen per order (in volgorde van eerste voorkomen) en de posities van
+    de regels van elke order binnen het verzendbare en het backorder deel.
+    Zelfde resultaat als de pandas variant in group_by_sales_order.
+    """
+    import polars as pl
+
+    lines = pl.DataFrame({
+        'order': pl.Series(np.asarray(orders, dtype=object), dtype=pl.String),
+        'sendable': np.asarray(sendable_mask, dtype=bool),
+        'backorder': np.asarray(backorder_mask, dtype=bool),
+        'split': np.asarray(split_mask, dtype=bool),
+        'ba_hp_backorder': np.asarray(ba_hp_mask, dtype=bool) & np.asarray(backorder_mask, dtype=bool)
+    }).lazy()
+
+    stats = lines.group_by('order', maintain_order=True).agg(
+        total=pl.len().cast(pl.Int64),
+        sendable=pl.col('sendable').sum().cast(pl.Int64),
+        backorder=pl.col('backorder').sum().cast(pl.Int64),
+        split=pl.col('split').sum().cast(pl.Int64),
+        ba_hp_backorder=pl.col('ba_hp_backorder').sum().cast(pl.Int64)
+    )
+    parts = [lines.filter(pl.col(part)).with_row_index('position')
+             .group_by('order', maintain_order=True).agg(pl.col('position').cast(pl.Int64))
+             for part in ('sendable', 'backorder')]
+    stats, sendable, backorder = pl.collect_all([stats] + parts)
+
+    order_stats = stats.to_pandas().set_index('order')
+    order_stats.index.name = 'Sales Order No.'
+    return order_stats, _positions(sendable), _positions(backorder)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Scenario Vergelijking
+=====================
+
+Vergelijk meerdere filter- of categorie configuraties op dezelfde export,
+bijvoorbeeld per locatie of Fully Reserved = Yes tegenover No. De export wordt
+één keer ingelezen en genormaliseerd; elk scenario filtert, groepeert en
+categoriseert daarna op dezelfde (alleen gelezen) frames. Scenario's draaien
+parallel in threads, of in geforkte processen die de ingelezen export
+copy-on-write delen. Het resultaat is één werkboek met een regel per scenario.
+
+Scenario's komen uit een JSON bestand (lijst van objecten) en/of uit --vary
+opties, die alle combinaties van de opgegeven waarden maken:
+
+    [
+        {"name": "DSV", "filters": {"Location Code": "DSV"}},
+        {"name": "Met toewijzing", "stock_allocation": true},
+        {"name": "Nieuwe indeling", "category_config": "category_config_nieuw.json"}
+    ]
+
+"filters" vult de filters uit config.py aan (een lege waarde = niet filteren),
+"category_config" gebruikt een ander categorie bestand; overige sleutels zijn
+velden van AnalysisSettings.
+
+Gebruik:
+    python scenario_sweep.py export.xlsx --scenarios scenarios.json
+    python scenario_sweep.py export.xlsx --vary "Location Code=DSV,NL01" --vary "Fully Reserved=Yes,No"
+"""
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import backorder_analyzer as analyzer
+from analysis_api import AnalysisSettings
+from email_engine import EMAIL_CATEGORIES
+from filter_spec import compile_filter
+from polars_pipeline import resolve_engine
+
+# Kolommen van het vergelijkingswerkboek
+SWEEP_COLUMNS = [
+    'Scenario', 'Status', 'Filters', 'Regels', 'Orders', 'Volledig verzendbaar', 'Met backorder',
+    'Verzendbare regels', 'Backorder regels', 'Verzendbaar aantal', 'Backorder aantal',
+    'Categorie 1', 'Categorie 2', 'Categorie 3', 'Categorie 4', 'Geen categorie', 'E-mails',
+    'Seconden', 'Fout'
+]
+
+# Gedeelde, alleen gelezen data voor de workers (bij fork geërfd door de kindprocessen)
+_shared = {}
+
+
+def parse_vary(options):
+    """
+    Scenario's uit --vary opties ("Kolom=waarde1,waarde2"): alle combinaties.
+    Een lege waarde betekent: niet filteren op die kolom.
+    """
+    axes = []
+    for option in options or []:
+        column, separator, values = option.partition('=')
+        if not separator or not column.strip():
+            raise ValueError(f"Ongeldige --vary optie: {option!r} (verwacht Kolom=waarde1,waarde2)")
+        axes.append((column.strip(), [value.strip() for value in values.split(',')]))
+    if not axes:
+        return []
+    scenarios = []
+    for combination in itertools.product(*(values for _, values in axes)):
+        filters = {column: value for (column, _), value in zip(axes, combination)}
+        name = ", ".join(f"{column}={value or 'alle'}" for column, value in filters.items())
+        scenarios.append({'name': name, 'filters': filters})
+    return scenarios
+
+
+def load_scenarios(file_path):
+    """Scenario's uit een JSON bestand (lijst van objecten met minstens een naam)."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        scenarios = json.load(f)
+    if not isinstance(scenarios, list):
+        raise ValueError(f"{file_path}: verwacht een lijst van scenario's")
+    return scenarios
+
+
+def prepare_scenario(scenario, number, base_settings, providers):
+    """Instellingen, filter spec en categorie provider van één scenario."""
+    options = dict(scenario)
+    name = options.pop('name', None) or f"Scenario {number}"
+    filters = options.pop('filters', {}) or {}
+    category_config = options.pop('category_config', None)
+    unknown = [key for key in options if key not in AnalysisSettings.__dataclass_fields__]
+    if unknown:
+        raise ValueError(f"Scenario {name!r}: onbekende instelling(en) {unknown}")
+
+    settings = base_settings.replace(**options)
+    filter_spec = settings.filter_spec()
+    filter_spec.update(filters)
+
+    provider = analyzer.category_provider
+    if category_config:
+        if category_config not in providers:
+            from category_manager import CategoryConfigProvider
+            # Eigen JSON configuratie, los van de gedeelde SQLite catalogus
+            providers[category_config] = CategoryConfigProvider(config_file=category_config, storage="json")
+        provider = providers[category_config]
+    return {'name': name, 'settings': settings, 'filter_spec': filter_spec, 'provider': provider}
+
+
+def summarize_scenario(name, grouped_data, rows, filter_spec):
+    """Eén regel van het vergelijkingswerkboek."""
+    backorder = [order['backorder'] for order in grouped_data.values() if len(order['backorder']) > 0]
+    sendable = [order['sendable'] for order in grouped_data.values() if len(order['sendable']) > 0]
+    backorder_lines = pd.concat(backorder) if backorder else pd.DataFrame(columns=['Quantity', 'Category'])
+    sendable_lines = pd.concat(sendable) if sendable else pd.DataFrame(columns=['Quantity'])
+    counts = backorder_lines['Category'].astype(object).value_counts(dropna=False) \
+        if 'Category' in backorder_lines.columns else pd.Series(dtype=int)
+    categories = {None if pd.isna(category) else int(category): int(count) for category, count in counts.items()}
+    return {
+        'Scenario': name,
+        'Status': 'ok',
+        'Filters': "; ".join(compile_filter(filter_spec).describe()),
+        'Regels': rows,
+        'Orders': len(grouped_data),
+        'Volledig verzendbaar': sum(1 for order in grouped_data.values()
+                                    if order['backorder_count'] == 0 and order['sendable_count'] > 0),
+        'Met backorder': sum(1 for order in grouped_data.values() if order['backorder_count'] > 0),
+        'Verzendbare regels': sum(order['sendable_count'] for order in grouped_data.values()),
+        'Backorder regels': sum(order['backorder_count'] for order in grouped_data.values()),
+        'Verzendbaar aantal': float(sendable_lines['Quantity'].astype('float64').sum()),
+        'Backorder aantal': float(backorder_lines['Quantity'].astype('float64').sum()),
+        'Categorie 1': categories.get(1, 0),
+        'Categorie 2': categories.get(2, 0),
+        'Categorie 3': categories.get(3, 0),
+        'Categorie 4': categories.get(4, 0),
+        'Geen categorie': categories.get(None, 0),
+        # E-mails zonder ledger: alle backorder regels van de e-mail categorieën
+        'E-mails': sum(categories.get(category, 0) for category in EMAIL_CATEGORIES)
+    }
+
+
+def evaluate_scenario(index):
+    """Evalueer scenario index op de gedeelde export; fouten worden als resultaat teruggegeven."""
+    start = time.perf_counter()
+    scenario = _shared['scenarios'][index]
+    try:
+        settings = scenario['settings']
+        manager = scenario['provider'].current() if scenario['provider'] else None
+        filtered = analyzer.filter_backorder_data(_shared['df'], scenario['filter_spec'])
+        grouped_data = analyzer.group_by_sales_order(
+            filtered, allocate=settings.stock_allocation, engine=resolve_engine(settings.engine),
+            manager=manager, priority=list(settings.allocation_priority),
+            customer_priority=dict(settings.customer_priority))
+        row = summarize_scenario(scenario['name'], grouped_data, len(filtered), scenario['filter_spec'])
+    except Exception as e:
+        logging.error(f"Scenario {scenario['name']}: {traceback.format_exc()}")
+        row = {'Scenario': scenario['name'], 'Status': 'fout', 'Fout': f"{type(e).__name__}: {e}"}
+    row['Seconden'] = round(time.perf_counter() - start, 2)
+    return row
+
+
+def _after_fork():
+    """Initializer van een geforkte worker: eigen SQLite verbindingen voor de categorieën."""
+    providers = {id(scenario['provider']): scenario['provider']
+                 for scenario in _shared['scenarios'] if scenario['provider']}
+    for provider in providers.values():
+        if provider.manager is not None:
+            provider.manager.store.after_fork()
+
+
+def write_comparison(rows, file_path, engine="auto"):
+    """Schrijf het vergelijkingswerkboek: één regel per scenario."""
+    from excel_writer import resolve_writer_engine
+
+    comparison = pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with pd.ExcelWriter(file_path, engine=resolve_writer_engine(engine)) as writer:
+        comparison.to_excel(writer, sheet_name='Scenario vergelijking', index=False)
+    logging.info(f"Scenario vergelijking opgeslagen: {file_path}")
+    return file_path
+
+
+def run_sweep(input_file, scenarios, settings=None, output_file=None, workers=None, mode=None):
+    """
+    Evalueer alle scenario's op één keer ingelezen export input_file.
+
+    scenarios: lijst van dicts (zie de module documentatie).
+    mode: "threads" of "fork" (standaard SWEEP_MODE). Geeft een dict met de
+    regels per scenario, het werkboek en de tijden terug.
+    """
+    if not scenarios:
+        raise ValueError("Geen scenario's opgegeven")
+    settings = settings or AnalysisSettings()
+    mode = mode or analyzer.SWEEP_MODE
+    if mode not in ('threads', 'fork'):
+        raise ValueError(f"Onbekende sweep modus: {mode} (kies uit ['threads', 'fork'])")
+    if mode == 'fork' and 'fork' not in multiprocessing.get_all_start_methods():
+        logging.warning("Fork wordt op dit platform niet ondersteund, terugvallen op threads")
+        mode = 'threads'
+
+    start = time.perf_counter()
+    analyzer.refresh_category_manager()
+    providers = {}
+    prepared = [prepare_scenario(scenario, number, settings, providers)
+                for number, scenario in enumerate(scenarios, start=1)]
+    if mode == 'fork' and any(scenario['settings'].engine == 'polars' for scenario in prepared):
+        # De thread pool van polars overleeft een fork niet betrouwbaar
+        logging.warning("Polars engine wordt in fork modus niet gebruikt; scenario's draaien met pandas")
+        for scenario in prepared:
+            scenario['settings'] = scenario['settings'].replace(engine='pandas')
+    # Categorie configuraties laden vóór het starten van de workers (gedeeld of geërfd)
+    for scenario in prepared:
+        if scenario['provider']:
+            scenario['provider'].current()
+
+    # Eén keer inlezen, normaliseren en stamgegevens koppelen; de scenario's filteren daarna zelf
+    df = analyzer.load_export(input_file, use_cache=settings.use_cache)
+    df = analyzer.join_master_data(df)
+    load_seconds = time.perf_counter() - start
+    logging.info(f"Scenario vergelijking: {len(prepared)} scenario's op {len(df)} regels "
+                 f"(ingelezen in {load_seconds:.1f}s)")
+
+    workers = workers or analyzer.SWEEP_WORKERS or os.cpu_count() or 1
+    workers = max(1, min(workers, len(prepared)))
+    _shared.update(df=df, scenarios=prepared)
+    try:
+        if mode == 'fork':
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                       initializer=_after_fork)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        with pool:
+            rows = list(pool.map(evaluate_scenario, range(len(prepared))))
+    finally:
+        _shared.clear()
+
+    if not output_file:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(os.path.dirname(analyzer.OUTPUT_FILE) or "Output",
+                                   f"Scenario_Vergelijking_v{timestamp}.xlsx")
+    comparison_file = write_comparison(rows, output_file, analyzer.EXCEL_WRITER_ENGINE)
+
+    failed = sum(1 for row in rows if row['Status'] != 'ok')
+    wall_seconds = time.perf_counter() - start
+    logging.info("=== Scenario vergelijking voltooid ===")
+    logging.info(f"Scenario's: {len(rows)} ({failed} met fouten), {workers} {mode} workers, "
+                 f"doorlooptijd {wall_seconds:.1f}s")
+    for row in rows:
+        if row['Status'] == 'ok':
+            logging.info(f"  - {row['Scenario']}: {row['Orders']} orders, {row['Volledig verzendbaar']} volledig "
+                         f"verzendbaar, {row['Backorder regels']} backorder regels")
+
+    return {
+        'rows': rows,
+        'comparison_file': comparison_file,
+        'load_seconds': load_seconds,
+        'wall_seconds': wall_seconds,
+        'workers': workers,
+        'mode': mode,
+        'failed': failed
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vergelijk filter- en categorie scenario's op één export")
+    parser.add_argument("input_file", nargs="?", help="Navision export (standaard: INPUT_FILE uit config.py)")
+    parser.add_argument("--scenarios", help="JSON bestand met een lijst van scenario's")
+    parser.add_argument("--vary", action="append",
+                        help='Kolom met te vergelijken waarden, bijvoorbeeld "Location Code=DSV,NL01" '
+                             '(meerdere keren: alle combinaties)')
+    parser.add_argument("--workers", type=int, help="Aantal workers (standaard: SWEEP_WORKERS of aantal kernen)")
+    parser.add_argument("--mode", choices=["threads", "fork"], help="Threads of geforkte processen (standaard: SWEEP_MODE)")
+    parser.add_argument("--output", help="Pad van het vergelijkingswerkboek")
+    parser.add_argument("--no-cache", action="store_true", help="Export opnieuw inlezen zonder cache")
+    args = parser.parse_args()
+
+    if not args.scenarios and not args.vary:
+        parser.error("Geef --scenarios en/of --vary op")
+    scenarios = (load_scenarios(args.scenarios) if args.scenarios else []) + parse_vary(args.vary)
+    sweep = run_sweep(args.input_file or analyzer.INPUT_FILE, scenarios,
+                      settings=AnalysisSettings(use_cache=not args.no_cache),
+                      output_file=args.output, workers=args.workers, mode=args.mode)
+    raise SystemExit(1 if sweep['failed'] else 0)
@@ -23,7 +23,7 @@ import subprocess
 
 # Import het hoofdscript
 try:
-    from backorder_analyzer import main as run_analysis
+    from analysis_api import Analyzer
     from config import *
 except ImportError as e:
     print(f"Fout: Kan hoofdscript niet laden: {e}")
@@ -41,6 +41,10 @@ class SimpleDashboard:
         # Queue voor thread communicatie
         self.message_queue = queue.Queue()
         
+        # Eén analyzer voor alle runs: categorie configuratie wordt één keer geladen
+        self.analyzer = Analyzer()
+        self.last_result = None
+        
         # Setup UI
         self.setup_ui()
         
@@ -205,9 +209,17 @@ class SimpleDashboard:
 
         # Order Status
         ttk.Label(config_grid, text="📋 Order Status:").grid(row=0, column=4, sticky=tk.W, padx=(0, 10), pady=5)
-        self.status_var = tk.StringVar(value=ORDER_STATUS)
-        status_entry = ttk.Entry(config_grid, textvariable=self.status_var, width=15)
+        self.order_status_var = tk.StringVar(value=ORDER_STATUS)
+        status_entry = ttk.Entry(config_grid, textvariable=self.order_status_var, width=15)
         status_entry.grid(row=0, column=5, sticky=tk.W, pady=5)
+
+        # Export cache
+        self.cache_var = tk.BooleanVar(value=EXPORT_CACHE_ENABLED)
+        cache_check = ttk.Checkbutton(config_grid, text="⚡ Cache gebruiken", variable=self.cache_var)
+        cache_check.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        clear_cache_button = ttk.Button(config_grid, text="🧹 Cache Wissen", command=self.clear_cache)
+        clear_cache_button.grid(row=1, column=2, columnspan=2, sticky=tk.W, pady=5)
         
     def setup_categories_section(self, parent):
         """Setup de categorieën sectie."""
@@ -336,19 +348,15 @@ class SimpleDashboard:
     def run_analysis_thread(self):
         """Run de analyse in een aparte thread."""
         try:
-            # Update configuratie
-            global LOCATION_CODE, FULLY_RESERVED, ORDER_STATUS
-            LOCATION_CODE = self.location_var.get()
-            FULLY_RESERVED = self.reserved_var.get()
-            ORDER_STATUS = self.status_var.get()
-
-            # Update input file
-            global INPUT_FILE
-            INPUT_FILE = self.file_path
-
-            # Run analyse met aangepaste file path
-            from backorder_analyzer import main
-            main(input_file=self.file_path)
+            # Instellingen uit het scherm voor deze run
+            analyzer = self.analyzer.with_settings(
+                input_file=self.file_path,
+                location_code=self.location_var.get(),
+                fully_reserved=self.reserved_var.get(),
+                order_status=self.order_status_var.get(),
+                use_cache=self.cache_var.get()
+            )
+            self.last_result = analyzer.run()
 
             # Success message
             self.message_queue.put(("success", "Analyse succesvol voltooid! 🎉"))
@@ -385,6 +393,15 @@ class SimpleDashboard:
         # Check elke 100ms
         self.root.after(100, self.check_messages)
 
+    def clear_cache(self):
+        """Wis de export cache."""
+        try:
+            from backorder_analyzer import get_export_cache
+            removed = get_export_cache().clear()
+            self.log(f"🧹 Cache gewist ({removed} bestanden verwijderd).")
+        except Exception as e:
+            messagebox.showerror("❌ Fout", f"Kan cache niet wissen: {e}")
+
     def log(self, message):
         """Voeg bericht toe aan log."""
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -397,8 +414,9 @@ class SimpleDashboard:
         self.log("🗑️ Log gewist.")
             
     def open_output(self):
-        """Open het output bestand."""
-        output_path = os.path.abspath(OUTPUT_FILE)
+        """Open het output bestand (van de laatste analyse)."""
+        output_file = self.last_result.output_file if self.last_result else OUTPUT_FILE
+        output_path = os.path.abspath(output_file)
         if os.path.exists(output_path):
             try:
                 os.startfile(output_path)
@@ -409,7 +427,8 @@ class SimpleDashboard:
             
     def open_emails(self):
         """Open het e-mail rapport bestand."""
-        email_path = OUTPUT_FILE.replace('.xlsx', '_Emails.xlsx')
+        email_path = (self.last_result.email_file if self.last_result and self.last_result.email_file
+                      else OUTPUT_FILE.replace('.xlsx', '_Emails.xlsx'))
         email_path = os.path.abspath(email_path)
         if os.path.exists(email_path):
             try:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Voorraad Toewijzing
+===================
+
+Verdeelt de beschikbare voorraad van een artikel over alle orderregels die
+dat artikel vragen, in een instelbare volgorde (klant prioriteit, ordernummer
+of volgorde in de export). Zonder toewijzing is elke regel met voorraad > 0
+verzendbaar, ook als tien orders samen meer vragen dan er ligt.
+
+Per artikel worden de regels in prioriteitsvolgorde gezet; de cumulatieve
+vraag vóór een regel bepaalt hoeveel voorraad er voor die regel overblijft.
+Alles gebeurt met numpy op de hele export tegelijk, zonder lus per artikel.
+
+De voorraad van een artikel is de hoogste Quantity Available van zijn regels
+(in de export staat per regel de beschikbare voorraad van het artikel).
+Ordernummers worden op hun numerieke deel gesorteerd, zodat VO9 vóór VO10 komt.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Sorteersleutels voor de toewijzingsvolgorde
+PRIORITY_KEYS = ['customer', 'order', 'line']
+
+
+def _priority_key(df, key, customer_priority):
+    """Sorteerwaarden (laag = eerst aan de beurt) voor één prioriteitssleutel."""
+    if key == 'customer':
+        # Klanten zonder prioriteit komen na alle genoemde klanten
+        ranks = df['Customer Name'].map(customer_priority or {})
+        return pd.to_numeric(ranks, errors='coerce').astype('float64').fillna(np.inf).to_numpy()
+    if key == 'order':
+        # Laagste ordernummer eerst (FIFO)
+        return _order_number_rank(df['Sales Order No.'])
+    if key == 'line':
+        return np.arange(len(df))
+    raise ValueError(f"Onbekende toewijzingsprioriteit: {key!r} (kies uit {PRIORITY_KEYS})")
+
+
+def _order_number_rank(orders):
+    """
+    Rang van elk ordernummer in natuurlijke volgorde: op prefix, dan het getal
+    (VO9 < VO10 < VO100), dan de rest als tekst.
+    """
+    codes, uniques = pd.factorize(orders, use_na_sentinel=False)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(r'^(\D*)(\d*)(.*)$')
+    parts[1] = pd.to_numeric(parts[1], errors='coerce').fillna(-1)
+    sorted_codes = parts.sort_values([0, 1, 2], kind='stable').index.to_numpy()
+    ranks = np.empty(len(uniques), dtype=np.int64)
+    ranks[sorted_codes] = np.arange(len(uniques))
+    return ranks[codes]
+
+
+def allocate_stock(df, priority=None, customer_priority=None):
+    """
+    Verdeel de voorraad per artikel over de regels van df.
+
+    priority: lijst van sleutels uit PRIORITY_KEYS, belangrijkste eerst.
+    customer_priority: dict klant -> prioriteit (lager = eerder).
+    Geeft (toegewezen, rest) als numpy arrays in de volgorde van df; bij
+    gehele aantallen in het type van de Quantity kolom.
+    """
+    n = len(df)
+    quantity = df['Quantity']
+    integer_quantities = pd.api.types.is_integer_dtype(quantity.dtype)
+    # Verkleinde types (int8) eerst ophogen zodat de cumulatieve som niet overloopt
+    demand = np.clip(np.nan_to_num(quantity.to_numpy(dtype='float64', na_value=np.nan)), 0, None)
+    available = np.clip(np.nan_to_num(df['Quantity Available'].to_numpy(dtype='float64', na_value=np.nan)), 0, None)
+    if integer_quantities:
+        available = np.floor(available)
+
+    item_codes = pd.factorize(df['Item No.'], use_na_sentinel=False)[0]
+    stock = pd.Series(available).groupby(item_codes).max().to_numpy()[item_codes]
+
+    # np.lexsort: laatste sleutel is de belangrijkste; artikel groepeert, regelpositie beslist bij gelijkstand
+    keys = [np.arange(n)]
+    keys.extend(_priority_key(df, key, customer_priority) for key in reversed(priority or ['order']))
+    keys.append(item_codes)
+    order = np.lexsort(keys)
+
+    sorted_demand = demand[order]
+    sorted_items = item_codes[order]
+    # Vraag vóór elke regel binnen zijn artikel: totale cumulatieve som min die aan het begin van de groep
+    preceding = np.cumsum(sorted_demand) - sorted_demand
+    starts = np.flatnonzero(np.r_[True, sorted_items[1:] != sorted_items[:-1]]) if n else np.array([], dtype=int)
+    group_offset = np.repeat(preceding[starts], np.diff(np.r_[starts, n]))
+    sorted_allocated = np.clip(stock[order] - (preceding - group_offset), 0, sorted_demand)
+
+    allocated = np.empty(n, dtype='float64')
+    allocated[order] = sorted_allocated
+    remaining = demand - allocated
+    if integer_quantities:
+        allocated = allocated.astype(quantity.dtype)
+        remaining = remaining.astype(quantity.dtype)
+
+    full = int(((remaining == 0) & (allocated > 0)).sum())
+    partial = int(((remaining > 0) & (allocated > 0)).sum())
+    logging.info(f"Voorraad toegewezen: {full} regels volledig, {partial} gedeeltelijk, "
+                 f"{n - full - partial} zonder voorraad")
+    return allocated, remaining
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Streaming Pipeline
+==================
+
+Analyse van zeer grote Navision exports met begrensd geheugengebruik. De export
+wordt in batches gelezen (openpyxl read-only), alleen de regels van nog open
+orders worden vastgehouden en afgeronde orders gaan na elke batch naar de Excel
+writers. Een export gesorteerd op ordernummer (standaard bij Navision) is
+afgerond zodra een volgende order begint.
+
+Is de export niet gesorteerd, dan worden de oudste orders weggeschreven zodra
+het geheugenbudget vol is. Orders die pas na het wegschrijven opnieuw
+voorkomen krijgen dan een extra blok in de output. Welke orders al weggeschreven
+zijn wordt in een begrensde index bijgehouden; e-mail regels voor digests gaan
+per dealer naar tijdelijke bestanden op schijf.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from openpyxl import load_workbook
+
+import backorder_analyzer as analyzer
+from excel_writer import AnalysisSheetWriter, EmailSheetWriter
+
+# Geschat geheugengebruik per gebufferde exportregel (tuple met waarden)
+STREAMING_ROW_BYTES = 400
+
+# Aantal weggeschreven orders dat onthouden wordt om gesplitste orders te herkennen
+STREAMING_ORDER_INDEX_SIZE = 100000
+
+# Aantal bestanden waarover de digest regels (per dealer) verdeeld worden
+STREAMING_DIGEST_BUCKETS = 64
+
+
+def _id_to_str(value):
+    """Converteer een identificatie waarde naar tekst, zoals read_export dat doet."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def iter_export_batches(file_path, batch_size):
+    """Lees de export in batches van gemapte DataFrames."""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        # Bepaal welke bronkolommen nodig zijn en onder welke naam
+        positions = {}
+        for index, name in enumerate(header):
+            target = analyzer.COLUMN_MAPPING.get(name, name)
+            if name in analyzer.COLUMN_MAPPING or name in analyzer.REQUIRED_COLUMNS:
+                positions.setdefault(target, index)
+        columns = list(positions.keys())
+        indexes = list(positions.values())
+        id_columns = [col for col in columns if col in analyzer.SOURCE_DTYPES]
+        logging.info(f"Streaming inlezen van kolommen: {columns}")
+
+        batch = []
+        for row in rows:
+            if not row or all(value is None for value in row):
+                continue
+            batch.append([row[i] if i < len(row) else None for i in indexes])
+            if len(batch) >= batch_size:
+                yield _batch_frame(batch, columns, id_columns)
+                batch = []
+        if batch:
+            yield _batch_frame(batch, columns, id_columns)
+    finally:
+        wb.close()
+
+
+def _batch_frame(batch, columns, id_columns):
+    df = pd.DataFrame(batch, columns=columns)
+    for col in id_columns:
+        df[col] = df[col].map(_id_to_str)
+    return df
+
+
+class DigestSpool:
+    """
+    E-mail regels voor digests, op schijf verdeeld over buckets per dealer.
+
+    Alle regels van één dealer staan in dezelfde bucket, zodat de digests per
+    bucket gerenderd kunnen worden zonder alle regels tegelijk in het geheugen.
+    """
+
+    def __init__(self, buckets=STREAMING_DIGEST_BUCKETS):
+        self.buckets = buckets
+        self.directory = tempfile.mkdtemp(prefix="backorder_digest_")
+        self.parts = 0
+
+    def add(self, lines, order_positions):
+        """
+        Schrijf de regels van één flush weg, per bucket een bestand.
+
+        order_positions geeft per order de positie van de eerste regel in de
+        export, zodat een gesplitste order in de digest op zijn plek blijft.
+        """
+        if len(lines) == 0:
+            return
+        lines = lines.assign(_order_position=lines['Sales Order No.'].map(order_positions).to_numpy())
+        buckets = pd.util.hash_pandas_object(lines['Customer Name'], index=False).to_numpy() % self.buckets
+        for bucket in pd.unique(buckets):
+            lines[buckets == bucket].to_pickle(os.path.join(self.directory, f"{bucket}_{self.parts}.pkl"))
+        self.parts += 1
+
+    def groups(self):
+        """Regels per bucket, in volgorde van eerste voorkomen van de order in de export."""
+        files = {}
+        for name in os.listdir(self.directory):
+            bucket, part = name[:-len('.pkl')].split('_')
+            files.setdefault(int(bucket), []).append((int(part), name))
+        for bucket in sorted(files):
+            lines = pd.concat([pd.read_pickle(os.path.join(self.directory, name))
+                               for _, name in sorted(files[bucket])], ignore_index=True)
+            yield lines.sort_values('_order_position', kind='stable').drop(columns='_order_position')
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def run_streaming_analysis(file_path, output_file, email_file, batch_size=50000, memory_budget_mb=512,
+                           email_mode=None, use_ledger=True):
+    """
+    Voer de analyse uit in streaming modus.
+
+    In digest modus gaan de e-mail regels (categorie 1 en 3) naar een
+    DigestSpool en worden ze aan het eind per bucket van dealers samengevoegd.
+
+    Geeft een dict met samenvattende statistieken terug.
+    """
+    start = time.perf_counter()
+    analyzer.refresh_category_manager()
+    budget_rows = max(1, int(memory_budget_mb * 1024 * 1024 / STREAMING_ROW_BYTES))
+    # Een batch telt ook mee in het budget
+    batch_size = max(1, min(batch_size, budget_rows))
+    logging.info(f"Streaming analyse gestart: batches van {batch_size} rijen, "
+                 f"budget {memory_budget_mb} MB (~{budget_rows} gebufferde regels)")
+    if analyzer.STOCK_ALLOCATION_ENABLED:
+        # Toewijzing heeft alle regels van een artikel nodig, die zijn hier nooit tegelijk in het geheugen
+        logging.warning("Voorraad toewijzing wordt in streaming modus niet ondersteund; "
+                        "regels met voorraad > 0 zijn verzendbaar")
+    # Alternatieven van categorie 4 zijn alleen op te zoeken met de hele export in het geheugen
+    logging.info("Streaming modus: leverbaarheid van alternatieven (categorie 4) wordt niet bepaald")
+
+    writer = AnalysisSheetWriter(output_file, analyzer.COLORS, fallback_widths=analyzer.COLUMN_WIDTHS[:6],
+                                 engine=analyzer.EXCEL_WRITER_ENGINE)
+    # Eén engine voor de hele run, zodat links per artikel maar één keer opgezocht worden
+    email_engine = analyzer.get_email_engine()
+    email_layout = analyzer.resolve_email_layout(email_mode)
+    email_versions = email_engine.template_versions(email_layout)
+    ledger = analyzer.get_notification_ledger() if use_ledger else None
+    email_writer = EmailSheetWriter(email_file, engine=analyzer.EXCEL_WRITER_ENGINE, layout=email_layout)
+    master_tables = analyzer.get_master_tables()
+    digest_spool = DigestSpool() if email_layout == 'digest' else None
+
+    open_orders = {}  # ordernummer -> lijst met regels, in volgorde van eerste voorkomen
+    first_positions = {}  # ordernummer -> positie van de eerste regel in de export, voor open orders
+    written_orders = OrderedDict()  # begrensde index van recent weggeschreven orders -> eerste positie
+    position = 0
+    sorted_export = True
+    last_order = None
+    columns = None
+    stats = {
+        'rows_read': 0,
+        'rows_after_filter': 0,
+        'orders': 0,
+        'sendable': 0,
+        'backorder': 0,
+        'emails': 0,
+        'peak_buffered_rows': 0,
+        'split_orders': 0,
+        'category_counts': {}
+    }
+    buffered = 0
+
+    def flush(target_rows, keep=None):
+        """
+        Schrijf de oudste open orders weg tot er hooguit target_rows gebufferd
+        zijn; keep (de order die nog loopt) blijft staan.
+        """
+        nonlocal buffered
+        rows = []
+        flushed_positions = {}
+        while open_orders and buffered > target_rows:
+            order_no = next(iter(open_orders))
+            if order_no == keep:
+                break
+            order_rows = open_orders.pop(order_no)
+            buffered -= len(order_rows)
+            flushed_positions[order_no] = written_orders[order_no] = first_positions.pop(order_no)
+            if len(written_orders) > STREAMING_ORDER_INDEX_SIZE:
+                written_orders.popitem(last=False)
+            rows.extend(order_rows)
+        if not rows:
+            return
+
+        grouped_data = analyzer.group_by_sales_order(pd.DataFrame.from_records(rows, columns=columns),
+                                                     allocate=False, substitutes=False)
+        for order_no, order_info in grouped_data.items():
+            writer.write_order(order_no, order_info)
+            stats['orders'] += 1
+            stats['sendable'] += order_info['sendable_count']
+            stats['backorder'] += order_info['backorder_count']
+            if 'Category' in order_info['backorder'].columns:
+                for category in order_info['backorder']['Category']:
+                    key = None if pd.isna(category) else int(category)
+                    stats['category_counts'][key] = stats['category_counts'].get(key, 0) + 1
+
+        if digest_spool is not None:
+            digest_spool.add(analyzer.collect_email_lines(grouped_data, ledger, email_versions), flushed_positions)
+        else:
+            email_frame = analyzer.generate_email_frame(grouped_data, engine=email_engine, ledger=ledger)
+            email_writer.write_frame(email_frame)
+            stats['emails'] += len(email_frame)
+
+    for batch in iter_export_batches(file_path, batch_size):
+        stats['rows_read'] += len(batch)
+        batch = analyzer.join_master_data(analyzer.filter_backorder_data(analyzer.apply_column_defaults(batch)),
+                                          master_tables)
+        stats['rows_after_filter'] += len(batch)
+        if columns is None:
+            columns = list(batch.columns)
+        order_index = columns.index('Sales Order No.')
+
+        for row in batch.itertuples(index=False, name=None):
+            order_no = row[order_index]
+            if order_no is None or order_no != order_no:
+                continue
+            interleaved = False
+            if order_no not in open_orders:
+                first_positions[order_no] = position
+                if order_no in written_orders:
+                    # Een gesplitste order houdt de positie van zijn eerste blok
+                    first_positions[order_no] = written_orders.pop(order_no)
+                    stats['split_orders'] += 1
+                    logging.warning(f"Order {order_no} komt opnieuw voor na wegschrijven; extra blok in output")
+                    # Een order die groter is dan het budget wordt ook gesplitst, ook als de export gesorteerd is
+                    interleaved = order_no != last_order
+            elif order_no != last_order:
+                interleaved = True
+            if interleaved and sorted_export:
+                sorted_export = False
+                logging.warning("Export is niet gesorteerd op ordernummer; orders worden weggeschreven "
+                                "zodra het geheugenbudget vol is")
+            last_order = order_no
+            position += 1
+            open_orders.setdefault(order_no, []).append(row)
+            buffered += 1
+            if buffered > budget_rows:
+                stats['peak_buffered_rows'] = max(stats['peak_buffered_rows'], buffered)
+                flush(budget_rows // 2)
+
+        stats['peak_buffered_rows'] = max(stats['peak_buffered_rows'], buffered)
+        if sorted_export:
+            # Alle orders behalve de laatste zijn afgerond
+            flush(0, keep=last_order)
+
+    flush(0)
+    try:
+        if digest_spool is not None:
+            for lines in digest_spool.groups():
+                digest_frame = email_engine.render_digests(lines, analyzer.EMAIL_DIGEST_GROUPING)
+                email_writer.write_frame(digest_frame)
+                stats['emails'] += len(digest_frame)
+    finally:
+        if digest_spool is not None:
+            digest_spool.close()
+    writer.close()
+    email_writer.close()
+    if ledger is not None:
+        # Pas vastleggen als het e-mail rapport volledig weggeschreven is
+        ledger.commit()
+        ledger.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['output_file'] = output_file
+    stats['email_file'] = email_file if stats['emails'] else None
+
+    logging.info("=== Streaming analyse voltooid ===")
+    logging.info(f"Gelezen regels: {stats['rows_read']} ({stats['rows_after_filter']} na filtering)")
+    logging.info(f"Totaal orders: {stats['orders']}")
+    logging.info(f"Totaal verzendbare artikelen: {stats['sendable']}")
+    logging.info(f"Totaal backorder artikelen: {stats['backorder']}")
+    logging.info(f"Max. gebufferde regels: {stats['peak_buffered_rows']} "
+                 f"(~{stats['peak_buffered_rows'] * STREAMING_ROW_BYTES / 1024 / 1024:.1f} MB)")
+    logging.info(f"Output bestand: {output_file}")
+    if stats['emails']:
+        logging.info(f"E-mails om te verzenden: {stats['emails']}")
+        logging.info(f"E-mail rapport: {email_file}")
+    logging.info(f"Doorlooptijd: {stats['seconds']:.1f}s")
+
+    return stats
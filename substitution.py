@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Alternatieven (categorie 4)
+===========================
+
+Koppelt backorder regels van categorie 4 ("Vervang door alternatief") aan
+hun alternatieve product en zoekt in dezelfde export op of dat alternatief
+geleverd kan worden.
+
+Alternatieven kunnen zelf weer een alternatief hebben (A → B → C), met
+cyclusdetectie (A → B → A). Elke keten wordt één keer opgelost en als
+(artikel, positie, kandidaat) stappen met één merge aan de regels gekoppeld.
+Per regel wordt het eerste alternatief in de keten gekozen dat genoeg voorraad
+heeft. Gekozen voorraad wordt geclaimd zoals in stock_allocation.py: per
+kandidaat een cumulatieve som van de aantallen in regelvolgorde, zodat twee
+regels niet dezelfde voorraad toegezegd krijgen. Dat gebeurt per positie in
+de keten (een paar rondes), niet per regel.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Uitkomst per regel
+STATUS_SHIPPABLE = 'Leverbaar'
+STATUS_INSUFFICIENT = 'Onvoldoende voorraad'
+STATUS_NOT_IN_EXPORT = 'Niet in export'
+STATUS_CYCLE = 'Cyclus in alternatieven'
+STATUS_NO_ALTERNATIVE = 'Geen alternatief'
+
+# Kolommen die aan de backorder regels toegevoegd worden
+SUBSTITUTION_COLUMNS = ['Alternative', 'Alternative_Chain', 'Alternative_Available', 'Alternative_Status']
+
+
+def resolve_chains(alternatives):
+    """
+    Volg de ketens van alternatieven (dict artikel -> alternatief).
+
+    Geeft een DataFrame met per artikel de keten als tekst, de keten als tuple
+    (het artikel zelf eerst) en of de keten in een cyclus eindigt.
+    """
+    alternatives = {str(item): str(alternative) for item, alternative in alternatives.items() if alternative}
+    resolved = {}  # artikel -> (keten vanaf dit artikel, cyclus)
+    for start in alternatives:
+        path, on_path = [], set()
+        item = start
+        while item in alternatives and item not in resolved and item not in on_path:
+            path.append(item)
+            on_path.add(item)
+            item = alternatives[item]
+
+        if item in on_path:
+            # Cyclus: artikelen in de cyclus tonen de ronde terug naar zichzelf
+            start_of_cycle = path.index(item)
+            for position in range(len(path)):
+                closing = path[start_of_cycle:position + 1] if position >= start_of_cycle else [item]
+                resolved[path[position]] = (tuple(path[position:] + closing), True)
+            continue
+        chain, cycle = resolved[item] if item in resolved else ((item,), False)
+        # Alle artikelen op het pad delen de uitkomst (memoization)
+        for position in range(len(path) - 1, -1, -1):
+            chain = (path[position],) + chain
+            resolved[path[position]] = (chain, cycle)
+
+    in_cycle = [item for item, (_, cycle) in resolved.items() if cycle]
+    if in_cycle:
+        logging.warning(f"Cyclus in de alternatieven van {len(in_cycle)} artikelen: {', '.join(in_cycle[:10])}")
+
+    return pd.DataFrame({
+        'item': list(resolved),
+        'chain': [' → '.join(chain) for chain, _ in resolved.values()],
+        'path': [chain for chain, _ in resolved.values()],
+        'cycle': [cycle for _, cycle in resolved.values()]
+    }, columns=['item', 'chain', 'path', 'cycle'])
+
+
+def chain_steps(chains):
+    """
+    De kandidaten van elke keten als rijen (item, position, candidate, chain):
+    positie 1 is het directe alternatief, chain de keten tot en met de
+    kandidaat. Een artikel dat in een cyclus terugkomt telt één keer.
+    """
+    steps = [(item, position, path[position], ' → '.join(path[:position + 1]))
+             for item, path in zip(chains['item'], chains['path'])
+             for position in range(1, len(path)) if path[position] not in path[:position]]
+    return pd.DataFrame(steps, columns=['item', 'position', 'candidate', 'chain'])
+
+
+def export_availability(df, allocated=None):
+    """
+    Beschikbare voorraad per artikel (str) in de export: de hoogste Quantity
+    Available van zijn regels, minus wat al aan regels toegewezen is.
+    """
+    available = df['Quantity Available'].to_numpy(dtype='float64', na_value=np.nan)
+    frame = pd.DataFrame({'item': df['Item No.'].astype(str).to_numpy(),
+                          'available': np.clip(np.nan_to_num(available), 0, None),
+                          'allocated': 0.0 if allocated is None else np.asarray(allocated, dtype='float64')})
+    per_item = frame.groupby('item', sort=False).agg(available=('available', 'max'),
+                                                      allocated=('allocated', 'sum'))
+    return (per_item['available'] - per_item['allocated']).clip(lower=0)
+
+
+def resolve_substitutes(lines, alternatives, availability):
+    """
+    Alternatief en leverbaarheid per regel.
+
+    lines: backorder regels van categorie 4 (kolommen Item No. en Quantity),
+    in de volgorde waarin ze voorraad mogen claimen.
+    alternatives: dict artikel -> alternatief.
+    availability: Series artikel -> beschikbare voorraad (export_availability).
+
+    Per regel het eerste alternatief in de keten met genoeg voorraad (die
+    voorraad wordt geclaimd); anders het eerste alternatief dat in de export
+    staat (onvoldoende voorraad) of het laatste van de keten (niet in export).
+    Zoals bij de toewijzing gaat een eerdere regel voor, ook als hij zelf niet
+    past: een latere regel krijgt wat er na de vraag van de eerdere regels
+    overblijft (Alternative_Available).
+    Geeft een DataFrame met SUBSTITUTION_COLUMNS en de index van lines.
+    """
+    chains = resolve_chains(alternatives)
+    frame = pd.DataFrame({'line': np.arange(len(lines)),
+                          'item': lines['Item No.'].astype(str).to_numpy(),
+                          'quantity': lines['Quantity'].to_numpy(dtype='float64', na_value=np.nan)})
+    frame = frame.merge(chains, on='item', how='left')
+
+    # Alle kandidaten van alle regels die in de export staan, op volgorde van regel en positie
+    steps = (frame[['line', 'item', 'quantity']]
+             .merge(chain_steps(chains), on='item')
+             .merge(availability.rename('stock'), left_on='candidate', right_index=True)
+             .sort_values(['line', 'position'], kind='stable')
+             .reset_index(drop=True))
+    steps['seen'] = np.nan
+    steps['fits'] = False
+
+    # Per positie in de keten: regels die nog geen alternatief hebben claimen voorraad in regelvolgorde
+    remaining = availability.astype('float64')
+    resolved = np.zeros(len(frame), dtype=bool)
+    for position in np.unique(steps['position']):
+        round_steps = steps[(steps['position'].to_numpy() == position) & ~resolved[steps['line'].to_numpy()]]
+        if len(round_steps) == 0:
+            continue
+        demand = round_steps['quantity'].fillna(0)
+        preceding = demand.groupby(round_steps['candidate'], sort=False).cumsum() - demand
+        seen = np.clip(remaining.reindex(round_steps['candidate']).to_numpy() - preceding.to_numpy(), 0, None)
+        fits = round_steps['quantity'].to_numpy() <= seen
+        steps.loc[round_steps.index, 'seen'] = seen
+        steps.loc[round_steps.index[fits], 'fits'] = True
+        resolved[round_steps['line'].to_numpy()[fits]] = True
+        claimed = demand[fits].groupby(round_steps['candidate'][fits]).sum()
+        remaining = remaining.sub(claimed, fill_value=0)
+
+    # Zonder passende kandidaat: de keten als geheel (cyclus of niet in export)
+    has_chain = frame['path'].notna().to_numpy()
+    cycle = frame['cycle'].eq(True).to_numpy()
+    alternative = frame['path'].str[-1].to_numpy(dtype=object, copy=True)
+    alternative[~has_chain | cycle] = None
+    chain_text = frame['chain'].to_numpy(dtype=object, copy=True)
+    chain_text[~has_chain] = None
+    available = np.full(len(frame), np.nan)
+    status = np.select([~has_chain, cycle], [STATUS_NO_ALTERNATIVE, STATUS_CYCLE],
+                       default=STATUS_NOT_IN_EXPORT).astype(object)
+
+    # Gekozen kandidaat, anders de eerste die in de export staat (behalve bij een cyclus)
+    chosen = pd.concat([steps[steps['fits']], steps]).drop_duplicates('line')
+    chosen = chosen[chosen['fits'].to_numpy() | ~cycle[chosen['line'].to_numpy()]]
+    positions = chosen['line'].to_numpy()
+    alternative[positions] = chosen['candidate'].to_numpy(dtype=object)
+    chain_text[positions] = chosen['chain'].to_numpy(dtype=object)
+    available[positions] = chosen['seen'].to_numpy()
+    status[positions] = np.where(chosen['fits'].to_numpy(), STATUS_SHIPPABLE, STATUS_INSUFFICIENT)
+
+    result = pd.DataFrame({
+        'Alternative': pd.Series(alternative, index=lines.index, dtype=object),
+        'Alternative_Chain': pd.Series(chain_text, index=lines.index, dtype=object),
+        'Alternative_Available': available,
+        'Alternative_Status': pd.Series(status, index=lines.index, dtype=object)
+    }, index=lines.index)
+
+    counts = result['Alternative_Status'].value_counts()
+    if len(counts):
+        logging.info("Alternatieven categorie 4: " + ", ".join(f"{status}: {count}" for status, count in counts.items()))
+    return result
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test dat wijzigingen in de SQLite catalogus niet stil overschreven worden door de JSON bestanden
+"""
+
+import os
+import shutil
+import threading
+
+import pytest
+
+from category_manager import CategoryManager
+
+
+@pytest.fixture
+def files(tmp_path):
+    config_file = str(tmp_path / "category_config.json")
+    links_file = str(tmp_path / "item_links.json")
+    shutil.copy("category_config.json", config_file)
+    shutil.copy("item_links.json", links_file)
+    return {'config_file': config_file, 'links_file': links_file, 'storage': 'sqlite',
+            'catalog_file': str(tmp_path / "catalog.sqlite")}
+
+
+def open_manager(files):
+    return CategoryManager(**files)
+
+
+def touch(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_catalog_edit_survives_touched_json(files):
+    cm = open_manager(files)
+    cm.add_item_to_category("ZZ999", "category_2")
+    cm.close()
+
+    touch(files['config_file'])
+    cm = open_manager(files)
+    assert cm.get_category_for_item("ZZ999") == 2
+    cm.close()
+
+
+def test_export_then_json_change_is_imported(files):
+    cm = open_manager(files)
+    cm.add_item_to_category("ZZ999", "category_2")
+    cm.export_json()
+    cm.close()
+
+    # Na de export is de catalogus gelijk aan de JSON: een latere JSON wijziging wordt ingelezen
+    other = CategoryManager(config_file=files['config_file'], links_file=files['links_file'], storage='json')
+    other.remove_item_from_category("ZZ999", "category_2")
+    other.add_item_to_category("ZZ998", "category_1")
+    touch(files['config_file'])
+
+    cm = open_manager(files)
+    assert cm.get_category_for_item("ZZ999") is None
+    assert cm.get_category_for_item("ZZ998") == 1
+    cm.close()
+
+
+def test_explicit_import_replaces_catalog_edits(files):
+    cm = open_manager(files)
+    cm.add_item_to_category("ZZ999", "category_2")
+    cm.import_json()
+    assert cm.get_category_for_item("ZZ999") is None
+    cm.close()
+
+
+def item_counts(cm):
+    return {key: len(info.get('items', [])) for key, info in cm.categories.items()}
+
+
+@pytest.mark.parametrize("damage", ["corrupt", "missing"])
+def test_unreadable_json_leaves_catalog_unchanged(files, damage):
+    cm = open_manager(files)
+    before = item_counts(cm)
+    cm.close()
+    assert sum(before.values()) > 0
+
+    if damage == "corrupt":
+        with open(files['config_file'], 'w', encoding='utf-8') as f:
+            f.write('{"category_1": {"items": [')
+    else:
+        os.remove(files['config_file'])
+
+    # Twee keer: ook de run na het apart zetten laat de catalogus staan
+    for _ in range(2):
+        cm = open_manager(files)
+        assert item_counts(cm) == before
+        cm.close()
+
+
+def test_batch_in_one_thread_does_not_hold_back_edits_of_another(files):
+    cm = open_manager(files)
+    in_batch = threading.Event()
+    release = threading.Event()
+
+    def batch_thread():
+        with cm.batch():
+            cm.add_item_to_category("ZZ001", "category_1")
+            in_batch.set()
+            release.wait(5)
+
+    batcher = threading.Thread(target=batch_thread)
+    batcher.start()
+    in_batch.wait(5)
+    # Losse wijziging in een andere thread: wacht op de batch en wordt daarna zelf vastgelegd
+    editor = threading.Thread(target=cm.add_item_to_category, args=("ZZ002", "category_2"))
+    editor.start()
+    release.set()
+    batcher.join()
+    editor.join()
+
+    other = open_manager(files)
+    assert other.get_category_for_item("ZZ001") == 1
+    assert other.get_category_for_item("ZZ002") == 2
+    other.close()
+    cm.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test de categorie regels (prefix, bereik, regex, tags) en hun volgorde
+"""
+
+import json
+import shutil
+
+import pytest
+
+from category_manager import CategoryManager
+from category_rules import BIKE_BATTERY_TAG, DEFAULT_RULES, RuleEngine
+
+
+def classify(rules, items, customers=None):
+    return RuleEngine(rules).classify(items, customers)[0].tolist()
+
+
+def test_rule_types():
+    rules = [
+        {'name': 'Olie', 'type': 'prefix', 'values': ['OIL', 'SMEER'], 'category': 1},
+        {'name': 'Accu', 'type': 'range', 'min': 11000, 'max': 11999, 'category': 3},
+        {'name': 'Uitlaat', 'type': 'regex', 'pattern': r'^EXH(?:AUST)?-\d+$', 'category': 2}
+    ]
+    items = ['OIL-5W30', 'SMEERMIDDEL', 'OI', '11000', '11999', '12000', '10999.5', 'EXHAUST-12', 'EXH-1',
+             'EXHAUST-X', None]
+    assert classify(rules, items) == [1, 1, None, 3, 3, None, None, 2, 2, None, None]
+
+
+def test_range_bounds_optional():
+    assert classify([{'type': 'range', 'min': 500, 'category': 2}], ['499', '500', '9999999', 'A500']) == \
+        [None, 2, 2, None]
+    assert classify([{'type': 'range', 'max': 10, 'category': 2}], ['-3', '10', '11']) == [2, 2, None]
+
+
+def test_priority_then_customer_then_file_order():
+    rules = [
+        {'name': 'Alle 11', 'type': 'prefix', 'values': ['11'], 'category': 2},
+        {'name': 'Alle 11 later', 'type': 'prefix', 'values': ['11'], 'category': 3},
+        {'name': 'D0001', 'type': 'prefix', 'values': ['11'], 'category': 1, 'customers': ['D0001']},
+        {'name': 'Belangrijk', 'type': 'regex', 'pattern': '^115', 'category': 4, 'priority': 10}
+    ]
+    items = ['11100', '11100', '11500', '11500']
+    customers = ['D0001', 'D0002', 'D0001', 'D0002']
+    # Prioriteit wint; bij gelijke prioriteit de klantregel; daarna de eerste in het bestand
+    assert classify(rules, items, customers) == [1, 2, 4, 4]
+    categories, names = RuleEngine(rules).classify(items, customers)
+    assert names.tolist() == ['D0001', 'Alle 11', 'Belangrijk', 'Belangrijk']
+
+
+def test_customer_rule_needs_customers():
+    rules = [{'type': 'prefix', 'values': ['11'], 'category': 1, 'customers': ['D0001']}]
+    assert classify(rules, ['11100']) == [None]
+    assert classify(rules, ['11100', '11100'], ['D0001', 'D0002']) == [1, None]
+
+
+def test_tags_separate_from_categories():
+    engine = RuleEngine(DEFAULT_RULES + [{'type': 'prefix', 'values': ['BA'], 'category': 2}])
+    assert engine.tag_mask(BIKE_BATTERY_TAG, ['BA-1001', 'HP-200', 'XBA', None]).tolist() == \
+        [True, True, False, False]
+    assert engine.classify(['BA-1001', 'HP-200'])[0].tolist() == [2, None]
+    assert engine.tags() == {BIKE_BATTERY_TAG}
+
+
+@pytest.mark.parametrize("rule", [
+    {'type': 'suffix', 'values': ['X'], 'category': 1},
+    {'type': 'prefix', 'values': ['X']},
+    {'type': 'regex', 'pattern': '([', 'category': 1},
+    {'type': 'regex', 'category': 1}
+])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        RuleEngine([rule])
+
+
+def test_explicit_lists_before_rules(tmp_path):
+    config_file = str(tmp_path / "category_config.json")
+    links_file = str(tmp_path / "item_links.json")
+    rules_file = str(tmp_path / "category_rules.json")
+    shutil.copy("category_config.json", config_file)
+    shutil.copy("item_links.json", links_file)
+    with open(rules_file, 'w', encoding='utf-8') as f:
+        json.dump({'rules': [{'type': 'prefix', 'values': ['ZZ'], 'category': 3}]}, f)
+
+    cm = CategoryManager(config_file=config_file, links_file=links_file, storage='sqlite',
+                         catalog_file=str(tmp_path / "catalog.sqlite"), rules_file=rules_file)
+    try:
+        cm.add_item_to_category("ZZ100", "category_2")
+        result = cm.categorize_items(['ZZ100', 'ZZ200', 'YY300'])
+        assert result['Category'].tolist() == [2, 3, None]
+        assert cm.get_category_for_item("ZZ100") == 2
+        assert cm.get_category_for_item("ZZ200") == 3
+    finally:
+        cm.close()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test de vergelijking van snapshots en de staat per export en filters
+"""
+
+import pandas as pd
+
+import backorder_analyzer as analyzer
+from change_report import build_snapshot, diff_snapshots, summarize_changes
+
+
+def order(lines, sendable_count):
+    frame = pd.DataFrame(lines, columns=['Sales Order No.', 'Customer Name', 'Item No.', 'Quantity',
+                                         'Category', 'Category_Name'])
+    return {'sendable': frame.iloc[:sendable_count], 'backorder': frame.iloc[sendable_count:]}
+
+
+def test_diff_snapshots():
+    previous = build_snapshot({
+        'VO1': order([('VO1', 'D1', 'A', 1, None, None), ('VO1', 'D1', 'B', 2, 1, 'Cat 1')], 1),
+        'VO2': order([('VO2', 'D2', 'C', 3, None, None), ('VO2', 'D2', 'D', 1, 3, 'Cat 3'),
+                      ('VO2', 'D2', 'E', 1, 1, 'Cat 1')], 1),
+        'VO3': order([('VO3', 'D3', 'F', 1, 1, 'Cat 1')], 0)
+    })
+    current = build_snapshot({
+        'VO1': order([('VO1', 'D1', 'A', 1, None, None), ('VO1', 'D1', 'B', 2, None, None)], 2),
+        'VO2': order([('VO2', 'D2', 'C', 5, 2, 'Cat 2'), ('VO2', 'D2', 'D', 1, 1, 'Cat 1'),
+                      ('VO2', 'D2', 'G', 1, 1, 'Cat 1')], 0)
+    })
+    report = diff_snapshots(previous, current)
+    rows = list(report[['Ordernummer', 'Artikelnummer', 'Wijziging']].itertuples(index=False, name=None))
+    assert rows == [
+        ('VO1', '', 'Order volledig verzendbaar'),
+        ('VO1', 'B', 'Backorder → Verzendbaar'),
+        ('VO2', 'C', 'Verzendbaar → Backorder'),
+        ('VO2', 'D', 'Categorie gewijzigd'),
+        ('VO2', 'C', 'Aantal gewijzigd'),
+        ('VO2', 'G', 'Nieuw artikel'),
+        ('VO2', 'E', 'Artikel verdwenen'),
+        ('VO3', 'F', 'Artikel verdwenen')
+    ]
+    assert summarize_changes(report)['Artikel verdwenen'] == 2
+    assert len(diff_snapshots(current, current)) == 0
+
+
+def test_same_item_twice_in_order_is_combined():
+    snapshot = build_snapshot({'VO1': order([('VO1', 'D1', 'A', 1, None, None), ('VO1', 'D1', 'A', 2, 1, 'Cat 1')], 1)})
+    assert snapshot[['order', 'item', 'quantity', 'status']].values.tolist() == [['VO1', 'A', 3.0, 'Backorder']]
+
+
+def test_state_name_per_export_and_filters():
+    spec = {'Location Code': 'DSV', 'Order Status': ['Backorder']}
+    name = analyzer.default_state_name("exports/dag.xlsx", spec)
+    assert name.startswith("dag_")
+    assert name == analyzer.default_state_name("andere_map/dag.xlsx", dict(reversed(list(spec.items()))))
+    assert name != analyzer.default_state_name("exports/week.xlsx", spec)
+    assert name != analyzer.default_state_name("exports/dag.xlsx", dict(spec, **{'Location Code': 'NL01'}))
+
+
+def test_alternating_exports_compare_with_own_previous_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(analyzer, 'CHANGE_SNAPSHOT_DIR', str(tmp_path))
+    spec = analyzer.get_filter_spec()
+    daily = {'VO1': order([('VO1', 'D1', 'A', 1, 1, 'Cat 1')], 0)}
+    other = {'VO9': order([('VO9', 'D9', 'Z', 1, 1, 'Cat 1')], 0)}
+    for _ in range(2):
+        for file_name, grouped_data in (("dag.xlsx", daily), ("ander.xlsx", other)):
+            _, counts = analyzer.write_change_report(grouped_data, str(tmp_path / "out.xlsx"),
+                                                     analyzer.default_state_name(file_name, spec))
+            assert counts == {}
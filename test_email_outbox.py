@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test het hervatten van mislukte verzendingen en het opruimen van de outbox
+"""
+
+import smtplib
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import pytest
+
+import email_outbox
+from email_outbox import EmailDispatcher, Outbox, send_report
+from local_smtp_server import LocalSMTPServer
+
+
+class FakePool:
+    """SMTP pool die een vooraf ingestelde fout geeft of het bericht 'verzendt'."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+        self.connections_opened = 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def send_message(self, message, from_email, recipients):
+        if self.error is not None:
+            raise self.error
+        self.sent.append(message['To'])
+
+    def close_all(self):
+        pass
+
+
+SETTINGS = {'max_retries': 1, 'backoff_seconds': 0, 'rate_per_second': 0, 'max_attempts': 4}
+MESSAGES = [{'to': 'dealer@voorbeeld.nl', 'subject': 'Backorder', 'body': 'Tekst'}]
+
+
+def dispatch(outbox_file, error=None):
+    outbox = Outbox(outbox_file)
+    try:
+        outbox.add(MESSAGES, lambda to: to)
+        outbox.retry_failed(SETTINGS['max_attempts'])
+        pool = FakePool(error)
+        EmailDispatcher(outbox, SETTINGS, {}, pool=pool).run()
+        outbox.compact()
+        return pool, list(outbox.messages.values())[0]
+    finally:
+        outbox.close()
+
+
+def test_transient_failure_retried_next_run(tmp_path):
+    outbox_file = str(tmp_path / "outbox.jsonl")
+    _, message = dispatch(outbox_file, ConnectionRefusedError())
+    assert (message['status'], message['attempts'], message['transient']) == ('failed', 2, True)
+
+    pool, message = dispatch(outbox_file)
+    assert pool.sent == ['dealer@voorbeeld.nl']
+    assert (message['status'], message['attempts']) == ('sent', 3)
+
+    # Verzonden berichten worden niet opnieuw verstuurd
+    pool, _ = dispatch(outbox_file)
+    assert pool.sent == []
+
+
+def test_attempts_capped(tmp_path):
+    outbox_file = str(tmp_path / "outbox.jsonl")
+    for _ in range(4):
+        _, message = dispatch(outbox_file, smtplib.SMTPResponseException(451, b"Probeer later"))
+    assert (message['status'], message['attempts']) == ('failed', 4)
+
+
+def test_permanent_failure_not_retried(tmp_path):
+    outbox_file = str(tmp_path / "outbox.jsonl")
+    dispatch(outbox_file, smtplib.SMTPResponseException(550, b"Onbekend adres"))
+    pool, message = dispatch(outbox_file)
+    assert pool.sent == []
+    assert (message['status'], message['attempts'], message['transient']) == ('failed', 1, False)
+
+
+def test_compact_prunes_old_sent_messages(tmp_path, monkeypatch):
+    outbox_file = str(tmp_path / "outbox.jsonl")
+    dispatch(outbox_file)
+    outbox = Outbox(outbox_file)
+    outbox.add([{'to': 'ander@voorbeeld.nl', 'subject': 'Backorder', 'body': 'Tekst'}], lambda to: to)
+    later = time.time() + 31 * 86400
+    monkeypatch.setattr(email_outbox.time, 'time', lambda: later)
+    outbox.compact(sent_retention_days=30)
+    outbox.close()
+    assert [message['status'] for message in Outbox(outbox_file).messages.values()] == ['pending']
+
+
+@pytest.fixture
+def smtp_server(request):
+    server = LocalSMTPServer(fail_every=request.param)
+    server.start()
+    yield server
+    server.stop()
+
+
+def smtp_settings(server, tmp_path, max_retries):
+    host, port = server.address
+    # Eén verbinding: de volgorde van de DATA opdrachten (en dus van de gesimuleerde fouten) ligt vast
+    return {'smtp_host': host, 'smtp_port': port, 'max_connections': 1, 'rate_per_second': 0,
+            'max_retries': max_retries, 'backoff_seconds': 0, 'max_attempts': 4,
+            'outbox_file': str(tmp_path / "outbox.jsonl"), 'dealer_addresses_file': None}
+
+
+REPORT = [{'to': f'dealer{i}@voorbeeld.nl', 'subject': f'Backorder VO{i}', 'body': 'Tekst'} for i in range(6)]
+
+
+def received_subjects(server):
+    return Counter(message['message']['Subject'] for message in server.messages)
+
+
+@pytest.mark.parametrize("smtp_server", [3], indirect=True)
+def test_smtp_retries_transient_failures(smtp_server, tmp_path):
+    # Elke derde DATA opdracht geeft 451: bericht 3 en 5 slagen bij de retry
+    stats = send_report(REPORT, smtp_settings(smtp_server, tmp_path, max_retries=2))
+    assert (stats['sent'], stats['failed'], stats['retries']) == (6, 0, 2)
+    assert smtp_server.data_commands == 8
+    assert received_subjects(smtp_server) == Counter(message['subject'] for message in REPORT)
+    # Na een 451 blijft de verbinding bruikbaar (RSET)
+    assert stats['connections_opened'] == 1
+
+
+@pytest.mark.parametrize("smtp_server", [3], indirect=True)
+def test_smtp_resumed_run_sends_each_message_once(smtp_server, tmp_path):
+    settings = smtp_settings(smtp_server, tmp_path, max_retries=0)
+    stats = send_report(REPORT, settings)
+    assert (stats['sent'], stats['failed'], stats['retries']) == (4, 2, 0)
+
+    # Volgende run met hetzelfde rapport: alleen de twee mislukte berichten opnieuw
+    stats = send_report(REPORT, settings)
+    assert (stats['to_send'], stats['sent'], stats['failed']) == (2, 2, 0)
+    assert stats['outbox']['sent'] == 6
+    assert received_subjects(smtp_server) == Counter(message['subject'] for message in REPORT)
+    assert max(received_subjects(smtp_server).values()) == 1
+
+    # Derde run: niets meer te verzenden
+    stats = send_report(REPORT, settings)
+    assert stats['to_send'] == 0
+    assert len(smtp_server.messages) == 6
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test de filter compiler en de pushdown naar de Parquet cache
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from export_cache import ExportCache, parquet_available
+from filter_spec import compile_filter
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'Location Code': pd.Categorical(['DSV', 'NL01', 'BE02', None, 'DSV']),
+        'Order Status': ['Backorder', 'Cancelled', 'Backorder', 'Open', None],
+        'Quantity': [1, 5, 10, np.nan, 3]
+    })
+
+
+def mask(df, spec, defaults=None):
+    defaults = defaults or {}
+    return compile_filter(spec).mask(
+        df, lambda frame, column: frame[column] if column in frame.columns else defaults[column])[0].tolist()
+
+
+def test_criteria(df):
+    assert mask(df, {'Location Code': 'DSV'}) == [True, False, False, False, True]
+    assert mask(df, {'Location Code': ['DSV', 'NL01']}) == [True, True, False, False, True]
+    # Negatie laat lege waarden staan (categorical en object)
+    assert mask(df, {'Location Code': {'not': 'DSV'}}) == [False, True, True, True, False]
+    assert mask(df, {'Order Status': {'not': ['Cancelled', 'Open']}}) == [True, False, True, False, True]
+    # Vergelijkingen: NaN valt weg
+    assert mask(df, {'Quantity': {'>': 1, '<=': 5}}) == [False, True, False, False, True]
+    assert mask(df, {'Location Code': 'DSV', 'Quantity': {'>=': 3}}) == [False, False, False, False, True]
+
+
+def test_empty_criteria_do_not_filter(df):
+    spec = {'Location Code': '', 'Order Status': None, 'Quantity': []}
+    assert not compile_filter(spec)
+    assert mask(df, spec) == [True] * 5
+
+
+def test_default_column_evaluated_once(df):
+    assert mask(df, {'Fully Reserved': 'No'}, {'Fully Reserved': 'No'}) == [True] * 5
+    assert mask(df, {'Fully Reserved': 'Yes'}, {'Fully Reserved': 'No'}) == [False] * 5
+
+
+def test_unknown_operator():
+    with pytest.raises(ValueError):
+        compile_filter({'Quantity': {'~': 1}})
+
+
+def test_pushdown_skips_negation():
+    pushdown = compile_filter({'Location Code': ['DSV'], 'Order Status': {'not': 'Cancelled'},
+                               'Quantity': {'>': 1}}).pushdown()
+    assert pushdown == [('Location Code', 'in', ['DSV']), ('Quantity', '>', 1)]
+    assert compile_filter({'Order Status': {'not': 'Cancelled'}}).pushdown() is None
+    assert compile_filter({'Location Code': 'DSV'}).pushdown(columns=['Quantity']) is None
+
+
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow niet geïnstalleerd")
+def test_cache_pushdown_matches_mask(tmp_path, df):
+    cache = ExportCache(str(tmp_path))
+    cache.put('export', df)
+    spec = {'Location Code': ['DSV', 'NL01'], 'Quantity': {'<': 5},
+            # Niet in de entry: wordt niet doorgegeven
+            'Fully Reserved': 'No'}
+    read = cache.get('export', filters=compile_filter(spec).pushdown())
+    expected = df[mask(df, {'Location Code': ['DSV', 'NL01'], 'Quantity': {'<': 5}})]
+    assert read['Quantity'].tolist() == expected['Quantity'].tolist()
+    assert read['Location Code'].astype(str).tolist() == ['DSV', 'DSV']
+    # Het aantal regels van de export komt uit de metadata, niet uit de gefilterde regels
+    assert cache.row_count('export') == len(df)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test dat incrementele analyse alleen gewijzigde orders opnieuw berekent
+"""
+
+import pandas as pd
+import pytest
+
+import backorder_analyzer as analyzer
+from incremental_analysis import IncrementalState, order_fingerprints
+
+
+def make_lines():
+    return pd.DataFrame({
+        'Sales Order No.': ['VO1', 'VO1', 'VO2', 'VO3', 'VO3'],
+        'Customer Name': ['D1', 'D1', 'D2', 'D3', 'D3'],
+        'Item No.': ['11115', 'BA-1', '12248', '30001', '11115'],
+        'Quantity': [1, 2, 3, 4, 5],
+        'Quantity Available': [0.0, 0.0, 5.0, -1.0, 0.0]
+    })
+
+
+def test_fingerprints_change_with_content_and_order():
+    base, line_numbers = order_fingerprints(make_lines())
+    assert line_numbers.tolist() == [0, 1, 0, 0, 1]
+
+    changed = make_lines()
+    changed.loc[3, 'Quantity'] = 40
+    fingerprints, _ = order_fingerprints(changed)
+    assert (fingerprints != base).tolist() == [False, False, True]
+
+    # Zelfde regels in een andere volgorde binnen de order
+    swapped = make_lines().iloc[[1, 0, 2, 3, 4]].reset_index(drop=True)
+    fingerprints, _ = order_fingerprints(swapped)
+    assert (fingerprints != base).tolist() == [True, False, False]
+
+    # Ander type voor de aantallen telt niet mee
+    downcast = make_lines().astype({'Quantity': 'int8', 'Quantity Available': 'float32'})
+    assert order_fingerprints(downcast)[0].equals(base)
+
+
+def run(state_dir, df, key='k1'):
+    state = IncrementalState(str(state_dir), "test")
+    cached = state.cached_categories(df, key)
+    grouped_data = analyzer.group_by_sales_order(df, cached, allocate=False, substitutes=False)
+    state.save(grouped_data)
+    return state, cached, grouped_data
+
+
+def categories(grouped_data):
+    return {order_no: order_info['backorder']['Category'].tolist() for order_no, order_info in grouped_data.items()
+            if len(order_info['backorder']) > 0}
+
+
+def test_unchanged_orders_reuse_saved_categories(tmp_path):
+    df = make_lines()
+    state, cached, expected = run(tmp_path, df)
+    assert cached is None and state.changed_orders == {'VO1', 'VO2', 'VO3'}
+
+    # Bewaarde categorie aanpassen: een hergebruikte order neemt die over
+    saved = pd.read_pickle(state.path)
+    saved['categories'].loc[saved['categories']['order'] == 'VO1', 'Category'] = 3
+    pd.to_pickle(saved, state.path)
+
+    df.loc[3, 'Quantity'] = 40
+    state, cached, grouped_data = run(tmp_path, df)
+    assert state.reused_orders == {'VO1', 'VO2'}
+    assert state.changed_orders == {'VO3'}
+    assert sorted(cached.index) == [0, 1]
+    assert categories(grouped_data)['VO1'] == [3, 3]
+    assert categories(grouped_data)['VO3'] == categories(expected)['VO3']
+
+
+def test_other_configuration_recomputes_everything(tmp_path):
+    run(tmp_path, make_lines())
+    state, cached, _ = run(tmp_path, make_lines(), key='k2')
+    assert cached is None
+    assert state.reused_orders == set()
+
+
+@pytest.mark.parametrize("changed_order", ['VO1', 'VO3'])
+def test_merge_emails_keeps_report_order(tmp_path, changed_order):
+    df = make_lines()
+    state, _, grouped_data = run(tmp_path, df)
+    emails = pd.DataFrame({'Ordernummer': ['VO1', 'VO3'], 'E-mail Body': ['oud 1', 'oud 3']})
+    state.save(grouped_data, emails)
+
+    state = IncrementalState(str(tmp_path), "test")
+    state.cached_categories(df, 'k1')
+    state.reused_orders -= {changed_order}
+    state.changed_orders = {changed_order}
+    new_rows = pd.DataFrame({'Ordernummer': [changed_order], 'E-mail Body': ['nieuw']})
+    merged = state.merge_emails(grouped_data, new_rows)
+    assert merged['Ordernummer'].tolist() == ['VO1', 'VO3']
+    assert merged.set_index('Ordernummer').loc[changed_order, 'E-mail Body'] == 'nieuw'
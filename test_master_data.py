@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test het inlezen, cachen en koppelen van de artikel- en dealer stamgegevens
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backorder_analyzer as analyzer
+import master_data
+from excel_writer import iter_order_rows
+from master_data import MasterTable
+
+
+@pytest.fixture(autouse=True)
+def fresh_process(monkeypatch):
+    # Elke test begint zonder tabellen die eerder in dit proces ingelezen zijn
+    monkeypatch.setattr(master_data, '_loaded_tables', {})
+
+
+def write_dealers_csv(path):
+    path.write_text("Dealer;Naam;Plaats\n"
+                    " D0001 ;Fietsen Jansen ;Utrecht\n"
+                    "D0002;Bike Shop;Gouda\n"
+                    "D0001;Dubbel;Delft\n"
+                    ";Zonder sleutel;Zwolle\n", encoding='utf-8')
+    return str(path)
+
+
+def test_csv_keys_stripped_and_first_duplicate_wins(tmp_path):
+    table = MasterTable(write_dealers_csv(tmp_path / "dealers.csv"), 'Dealer', 'Naam', str(tmp_path / "cache"))
+    assert table.table.to_dict() == {'D0001': 'Fietsen Jansen', 'D0002': 'Bike Shop'}
+
+
+def test_xlsx(tmp_path):
+    path = str(tmp_path / "items.xlsx")
+    pd.DataFrame({'Artikel': ['10701', '10705'], 'Omschrijving': ['Remblok', 'Ketting'],
+                  'Prijs': [1, 2]}).to_excel(path, index=False)
+    table = MasterTable(path, 'Artikel', 'Omschrijving', str(tmp_path / "cache"))
+    assert table.table.to_dict() == {'10701': 'Remblok', '10705': 'Ketting'}
+
+
+def test_missing_column(tmp_path):
+    with pytest.raises(ValueError):
+        MasterTable(write_dealers_csv(tmp_path / "dealers.csv"), 'Dealer', 'Klantnaam', str(tmp_path / "cache"))
+
+
+def test_lookup_missing_format(tmp_path):
+    table = MasterTable(write_dealers_csv(tmp_path / "dealers.csv"), 'Dealer', 'Naam', str(tmp_path / "cache"))
+    keys = pd.Series(['D0002', 'D9999', None, 'D0002'], dtype=object)
+    assert table.lookup(keys, missing_format="Dealer {key}").tolist() == [
+        'Bike Shop', 'Dealer D9999', None, 'Bike Shop']
+    assert table.lookup(keys).tolist() == ['Bike Shop', None, None, 'Bike Shop']
+
+
+def test_cache_hit(tmp_path, monkeypatch):
+    path = write_dealers_csv(tmp_path / "dealers.csv")
+    cache_dir = str(tmp_path / "cache")
+    first = MasterTable(path, 'Dealer', 'Naam', cache_dir)
+
+    # Nieuw proces: de tabel komt uit de cache, het bestand wordt niet opnieuw gelezen
+    monkeypatch.setattr(master_data, '_loaded_tables', {})
+    monkeypatch.setattr(master_data, 'read_master_file', lambda *args: pytest.fail("bestand opnieuw gelezen"))
+    second = MasterTable(path, 'Dealer', 'Naam', cache_dir)
+    assert second.version == first.version
+    assert second.table.to_dict() == first.table.to_dict()
+
+    # Andere kolom is een andere cache entry
+    monkeypatch.undo()
+    monkeypatch.setattr(master_data, '_loaded_tables', {})
+    assert MasterTable(path, 'Dealer', 'Plaats', cache_dir).version != first.version
+
+
+def test_unknown_dealer_keeps_code_in_header(tmp_path):
+    dealers = MasterTable(write_dealers_csv(tmp_path / "dealers.csv"), 'Dealer', 'Naam', str(tmp_path / "cache"))
+    df = pd.DataFrame({'Sales Order No.': ['VO1', 'VO2'], 'Customer Name': ['D0001', 'D0000'],
+                       'Item No.': ['A', 'B'], 'Quantity': [1, 1], 'Quantity Available': [5.0, np.nan]})
+    df = analyzer.join_master_data(df, {'items': None, 'dealers': dealers})
+    grouped = analyzer.group_by_sales_order(df, allocate=False, substitutes=False)
+
+    headers = {order_no: next(iter_order_rows(order_no, order_info))[0][1]
+               for order_no, order_info in grouped.items()}
+    assert headers == {'VO1': 'Klant: D0001 - Fietsen Jansen', 'VO2': 'Klant: D0000'}
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test dat de notification ledger eerder gemaakte notificaties overslaat en verlopen notificaties opruimt
+"""
+
+import time
+
+import pandas as pd
+import pytest
+
+import notification_ledger
+from notification_ledger import NotificationLedger
+
+VERSIONS = {1: 'v1', 3: 'v1'}
+
+
+def make_lines(rows):
+    return pd.DataFrame(rows, columns=['Sales Order No.', 'Item No.', 'Category'])
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = NotificationLedger(str(tmp_path / "ledger.sqlite"), retention_days=30)
+    yield ledger
+    ledger.close()
+
+
+def test_only_new_lines_after_commit(ledger):
+    lines = make_lines([('VO1', 'A', 1), ('VO1', 'B', 3), ('VO2', 'A', 1)])
+    assert len(ledger.exclude_notified(lines, VERSIONS)) == 3
+    assert ledger.commit() == 3
+
+    # Zelfde regels plus één nieuwe: alleen de nieuwe blijft over, in de oorspronkelijke volgorde
+    lines = make_lines([('VO3', 'C', 3), ('VO1', 'A', 1), ('VO2', 'A', 1), ('VO2', 'B', 1)])
+    new = ledger.exclude_notified(lines, VERSIONS)
+    assert list(new.index) == [0, 3]
+
+
+def test_uncommitted_lines_not_recorded(ledger):
+    lines = make_lines([('VO1', 'A', 1)])
+    ledger.exclude_notified(lines, VERSIONS)
+    ledger.discard()
+    assert ledger.commit() == 0
+    assert len(ledger.exclude_notified(lines, VERSIONS)) == 1
+
+
+def test_new_template_version_notifies_again(ledger):
+    lines = make_lines([('VO1', 'A', 1), ('VO1', 'B', 3)])
+    ledger.exclude_notified(lines, VERSIONS)
+    ledger.commit()
+    new = ledger.exclude_notified(lines, {1: 'v2', 3: 'v1'})
+    assert new['Item No.'].tolist() == ['A']
+
+
+def test_prune_removes_expired_notifications(ledger, monkeypatch):
+    ledger.exclude_notified(make_lines([('VO1', 'A', 1), ('VO2', 'A', 1)]), VERSIONS)
+    ledger.commit()
+    later = time.time() + 31 * 86400
+    monkeypatch.setattr(notification_ledger.time, 'time', lambda: later)
+    ledger.exclude_notified(make_lines([('VO3', 'A', 1)]), VERSIONS)
+    # commit ruimt de verlopen notificaties op en houdt de nieuwe
+    ledger.commit()
+    assert ledger.count() == 1
+    assert len(ledger.exclude_notified(make_lines([('VO1', 'A', 1)]), VERSIONS)) == 1
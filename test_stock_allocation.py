@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test de verdeling van voorraad over concurrerende orderregels
+"""
+
+import numpy as np
+import pandas as pd
+
+import backorder_analyzer as analyzer
+from stock_allocation import allocate_stock
+
+
+def make_lines(rows):
+    return pd.DataFrame(rows, columns=['Sales Order No.', 'Customer Name', 'Item No.', 'Quantity',
+                                       'Quantity Available'])
+
+
+def test_over_demand_fifo_by_order_number():
+    # 5 op voorraad, 3 orders vragen samen 9; VO9 is ouder dan VO10
+    df = make_lines([('VO10', 'D1', 'A', 3, 5), ('VO9', 'D2', 'A', 4, 5), ('VO11', 'D3', 'A', 2, 5)])
+    allocated, remaining = allocate_stock(df, ['order'])
+    assert allocated.tolist() == [1, 4, 0]
+    assert remaining.tolist() == [2, 0, 2]
+    assert allocated.dtype == df['Quantity'].dtype
+
+
+def test_partial_allocation_and_no_stock():
+    df = make_lines([('VO1', 'D1', 'A', 3, 2), ('VO1', 'D1', 'B', 2, 0), ('VO2', 'D2', 'B', 1, np.nan),
+                     ('VO2', 'D2', 'C', 2, -3)])
+    allocated, remaining = allocate_stock(df, ['order'])
+    assert allocated.tolist() == [2, 0, 0, 0]
+    assert remaining.tolist() == [1, 2, 1, 2]
+
+
+def test_customer_priority_before_order_number():
+    df = make_lines([('VO1', 'D1', 'A', 2, 3), ('VO2', 'D2', 'A', 2, 3), ('VO3', 'D3', 'A', 2, 3)])
+    allocated, _ = allocate_stock(df, ['customer', 'order'], {'D3': 1, 'D2': 2})
+    assert allocated.tolist() == [0, 1, 2]
+    # Alleen op volgorde in de export
+    allocated, _ = allocate_stock(df.iloc[::-1].reset_index(drop=True), ['line'])
+    assert allocated.tolist() == [2, 1, 0]
+
+
+def test_split_and_zero_demand_lines_counted_once():
+    df = make_lines([('VO1', 'D1', 'A', 3, 2), ('VO1', 'D1', 'B', 1, 5), ('VO1', 'D1', 'C', 0, 0),
+                     ('VO2', 'D2', 'A', 1, 2), ('VO2', 'D2', 'D', np.nan, 0)])
+    df = analyzer.apply_column_defaults(df)
+    grouped_data = analyzer.group_by_sales_order(df, allocate=True, priority=['order'], customer_priority={},
+                                                 substitutes=False)
+    first, second = grouped_data['VO1'], grouped_data['VO2']
+    # A: 2 van 3 toegewezen (deels verzendbaar), B volledig, C zonder vraag
+    assert (first['sendable_count'], first['backorder_count'], first['split_count']) == (1, 1, 1)
+    assert first['sendable']['Quantity'].tolist() == [2, 1]
+    assert first['backorder']['Item No.'].tolist() == ['A']
+    assert first['backorder']['Quantity'].tolist() == [1]
+    # Voorraad van A is op; D heeft geen vraag en is dus geen backorder
+    assert (second['sendable_count'], second['backorder_count'], second['split_count']) == (0, 1, 0)
+    assert second['backorder']['Item No.'].tolist() == ['A']
+    assert first['total_items'] + second['total_items'] == 5
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test dat de streaming modus dezelfde tellingen en e-mails oplevert als de analyse in het geheugen
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backorder_analyzer as analyzer
+from analysis_api import AnalysisSettings, Analyzer
+
+EMAIL_COLUMNS = ['Klant', 'Onderwerp', 'E-mail Body']
+
+
+def make_export(file_path, rows=2000, seed=11, sort=False):
+    """Synthetische export met ~25 regels per order; gesorteerd op ordernummer of door elkaar."""
+    rng = np.random.default_rng(seed)
+    orders = np.array([f"VO{100000 + i}" for i in rng.integers(0, 80, rows)], dtype=object)
+    orders[7] = None
+    available = rng.integers(-2, 6, rows).astype(float)
+    available[rng.random(rows) < 0.05] = np.nan
+    df = pd.DataFrame({
+        'DOCUMENT_ID': orders,
+        'SELL_TO_CUSTOMER_ID': [f"D{i:04d}" for i in rng.integers(0, 20, rows)],
+        'TYPE_ID': rng.choice(['OIL-5W30-1L', 'BRAKE-PADS-FRONT', 'BA-1001', '11115', '12248', '30001',
+                               '10701', '10705'], rows),
+        'ITEM_ID': rng.integers(100000, 999999, rows),
+        'QUANTITY': rng.integers(1, 10, rows),
+        'AVAILABLE_STOCK': available,
+        'Location Code': rng.choice(['DSV', 'NL01'], rows),
+        'Fully Reserved': rng.choice(['No', 'Yes'], rows)
+    })
+    if sort:
+        df = df.sort_values('DOCUMENT_ID', kind='stable', na_position='first')
+    df.to_excel(file_path, index=False)
+    return str(file_path)
+
+
+@pytest.fixture
+def small_budget(monkeypatch, tmp_path):
+    # ~500 gebufferde regels en batches van 300: de export past nooit in één keer in het budget
+    monkeypatch.setattr(analyzer, 'STREAMING_MEMORY_BUDGET_MB', 0.2)
+    monkeypatch.setattr(analyzer, 'STREAMING_BATCH_ROWS', 300)
+    monkeypatch.setattr(analyzer, 'STOCK_ALLOCATION_ENABLED', False)
+    monkeypatch.setattr(analyzer, 'EXPORT_CACHE_DIR', str(tmp_path / "cache"))
+
+
+def email_rows(frame):
+    return sorted(frame[EMAIL_COLUMNS].astype(str).itertuples(index=False, name=None))
+
+
+def run_both(export_file, tmp_path, email_mode):
+    streaming = analyzer.main(export_file, use_cache=False, streaming=True, email_mode=email_mode,
+                              use_ledger=False, output_file=str(tmp_path / "stream.xlsx"),
+                              email_file=str(tmp_path / "stream_emails.xlsx"))
+    settings = AnalysisSettings(use_cache=False, engine='pandas', email_mode=email_mode, use_ledger=False,
+                                stock_allocation=False, change_report=False, output_dir=str(tmp_path),
+                                email_file=str(tmp_path / "memory_emails.xlsx"))
+    in_memory = Analyzer(settings).run(export_file, output_file=str(tmp_path / "memory.xlsx"))
+    streamed_emails = pd.read_excel(streaming['email_file'], dtype=str) if streaming['email_file'] else \
+        pd.DataFrame(columns=EMAIL_COLUMNS)
+    return streaming, in_memory, streamed_emails
+
+
+@pytest.mark.parametrize("email_mode", ["per_item", "digest"])
+def test_sorted_export_equal(tmp_path, small_budget, email_mode):
+    export_file = make_export(tmp_path / "export.xlsx", sort=True)
+    streaming, in_memory, streamed_emails = run_both(export_file, tmp_path, email_mode)
+
+    for key in ('rows_read', 'rows_after_filter', 'orders', 'sendable', 'backorder', 'emails'):
+        assert streaming[key] == in_memory.stats[key], key
+    assert streaming['category_counts'] == in_memory.stats['category_counts']
+    assert streaming['split_orders'] == 0
+    # Gesorteerd: na elke batch staat hooguit de lopende order plus één batch in de buffer
+    assert streaming['peak_buffered_rows'] < 300 + 100
+    assert email_rows(streamed_emails) == email_rows(in_memory.email_report)
+    assert in_memory.stats['emails'] > 0
+
+
+@pytest.mark.parametrize("email_mode", ["per_item", "digest"])
+def test_unsorted_export_falls_back_to_budget(tmp_path, small_budget, email_mode):
+    export_file = make_export(tmp_path / "export.xlsx", sort=False)
+    streaming, in_memory, streamed_emails = run_both(export_file, tmp_path, email_mode)
+
+    # Orders komen in meer blokken, maar regels, tellingen en e-mails zijn gelijk
+    for key in ('rows_read', 'rows_after_filter', 'sendable', 'backorder', 'emails'):
+        assert streaming[key] == in_memory.stats[key], key
+    assert streaming['split_orders'] > 0
+    assert streaming['orders'] == in_memory.stats['orders'] + streaming['split_orders']
+    assert streaming['peak_buffered_rows'] <= 0.2 * 1024 * 1024 / 400 + 1
+    assert email_rows(streamed_emails) == email_rows(in_memory.email_report)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test de ketens van alternatieven voor artikelen in categorie 4
+"""
+
+import numpy as np
+import pandas as pd
+
+from substitution import (STATUS_CYCLE, STATUS_INSUFFICIENT, STATUS_NO_ALTERNATIVE, STATUS_NOT_IN_EXPORT,
+                          STATUS_SHIPPABLE, export_availability, resolve_chains, resolve_substitutes)
+
+
+def make_lines(rows):
+    return pd.DataFrame(rows, columns=['Item No.', 'Quantity'])
+
+
+def test_chains_and_cycles():
+    chains = resolve_chains({'A': 'B', 'B': 'C', 'X': 'Y', 'Y': 'X'}).set_index('item')
+    assert chains.loc['A', 'path'] == ('A', 'B', 'C')
+    assert chains.loc['A', 'chain'] == 'A → B → C'
+    assert not chains.loc['A', 'cycle']
+    assert chains.loc['X', 'cycle']
+    assert chains.loc['X', 'chain'] == 'X → Y → X'
+
+
+def test_first_alternative_with_stock():
+    # B heeft voorraad: de keten stopt bij B, ook al heeft B zelf een alternatief
+    availability = pd.Series({'B': 5.0, 'C': 10.0})
+    result = resolve_substitutes(make_lines([('A', 2)]), {'A': 'B', 'B': 'C'}, availability)
+    assert result.iloc[0].tolist() == ['B', 'A → B', 5.0, STATUS_SHIPPABLE]
+
+    # Zonder voorraad bij B gaat de keten door naar C
+    availability = pd.Series({'B': 0.0, 'C': 10.0})
+    result = resolve_substitutes(make_lines([('A', 2)]), {'A': 'B', 'B': 'C'}, availability)
+    assert result.iloc[0].tolist() == ['C', 'A → B → C', 10.0, STATUS_SHIPPABLE]
+
+
+def test_claimed_stock_not_promised_twice():
+    # 3 op voorraad bij B: de eerste regel claimt 2, voor de tweede blijft 1 over
+    lines = make_lines([('A', 2), ('A', 2), ('D', 2)])
+    result = resolve_substitutes(lines, {'A': 'B', 'D': 'B'}, pd.Series({'B': 3.0}))
+    assert result['Alternative_Status'].tolist() == [STATUS_SHIPPABLE, STATUS_INSUFFICIENT, STATUS_INSUFFICIENT]
+    assert result['Alternative_Available'].tolist() == [3.0, 1.0, 0.0]
+
+
+def test_later_position_uses_remaining_stock():
+    # E → C (geen voorraad) → B: in de tweede ronde is er na de claim van A nog 1 van B over
+    lines = make_lines([('E', 1), ('A', 2), ('G', 1)])
+    result = resolve_substitutes(lines, {'A': 'B', 'E': 'C', 'C': 'B', 'G': 'H', 'H': 'B'},
+                                 pd.Series({'B': 3.0, 'C': 0.0}))
+    assert result['Alternative_Status'].tolist() == [STATUS_SHIPPABLE, STATUS_SHIPPABLE, STATUS_INSUFFICIENT]
+    assert result['Alternative_Chain'].tolist() == ['E → C → B', 'A → B', 'G → H → B']
+    assert result['Alternative_Available'].tolist() == [1.0, 3.0, 0.0]
+
+
+def test_statuses_without_stock():
+    lines = make_lines([('X', 1), ('A', 1), ('E', 1), ('Z', np.nan)])
+    result = resolve_substitutes(lines, {'X': 'Y', 'Y': 'X', 'A': 'B', 'E': 'F', 'Z': 'B'},
+                                 pd.Series({'B': 5.0}))
+    assert result['Alternative_Status'].tolist() == [STATUS_CYCLE, STATUS_SHIPPABLE, STATUS_NOT_IN_EXPORT,
+                                                     STATUS_INSUFFICIENT]
+    assert result.loc[2, 'Alternative'] == 'F'
+
+    result = resolve_substitutes(make_lines([('Q', 1)]), {'A': 'B'}, pd.Series({'B': 5.0}))
+    assert result.iloc[0]['Alternative_Status'] == STATUS_NO_ALTERNATIVE
+
+
+def test_cycle_with_stock_uses_alternative():
+    result = resolve_substitutes(make_lines([('X', 1)]), {'X': 'Y', 'Y': 'X'}, pd.Series({'Y': 2.0}))
+    assert result.iloc[0].tolist() == ['Y', 'X → Y', 2.0, STATUS_SHIPPABLE]
+
+
+def test_export_availability_subtracts_allocated():
+    df = pd.DataFrame({'Item No.': ['B', 'B', 'C'], 'Quantity Available': [4, 4, np.nan]})
+    availability = export_availability(df, allocated=[1, 2, 0])
+    assert availability.to_dict() == {'B': 1.0, 'C': 0.0}